@@ -0,0 +1,114 @@
+"""Correctness and throughput of command translation for every target shell.
+
+Translates a fixed set of bash commands for Windows PowerShell, Windows
+cmd and the Unix shells, and checks each result against the expected
+text (Unix targets must get the commands back unchanged). Then times
+translate_many() over a batch of those commands, on a fresh translator
+(cold) and a warm one.
+
+    python benchmarks/command_translation.py [--batch 10000]
+"""
+import argparse
+import importlib
+import os
+import sys
+import time
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+command_translator = importlib.import_module("vibe-terminal.command_translator")
+
+CASES = {
+    ("windows", "powershell"): [
+        ("ls -la", "Get-ChildItem -Force"),
+        ("ls -a -l src", "Get-ChildItem -Force src"),
+        ("rm -rf build dist", "Remove-Item -Recurse -Force build dist"),
+        ("rm 'my file.txt'", "Remove-Item 'my file.txt'"),
+        ("mkdir -p a/b/c", "New-Item -ItemType Directory -Force -Path a/b/c"),
+        ("cat notes.txt | grep -i todo", "Get-Content notes.txt | Select-String -Pattern todo"),
+        ("grep -r 'def main' src",
+         "Get-ChildItem -Recurse -File -Path src | Select-String -Pattern 'def main' -CaseSensitive"),
+        ("touch a.txt",
+         "foreach ($p in a.txt) { if (Test-Path $p) { (Get-Item $p).LastWriteTime = Get-Date } "
+         "else { New-Item -ItemType File -Path $p | Out-Null } }"),
+        ("head -n 5 log.txt", "Get-Content log.txt -TotalCount 5"),
+        ("find . -name '*.py'", "Get-ChildItem -Recurse -Path . -Filter *.py"),
+        ("cp -r src backup && echo done", "Copy-Item -Recurse src backup && Write-Output done"),
+        ("echo \"it's\" > out.txt", "Write-Output 'it''s' > out.txt"),
+        # Unknown flags, unknown programs and shell syntax are left alone
+        ("ls --color=auto", "ls --color=auto"),
+        ("git status", "git status"),
+        ("echo $HOME", "echo $HOME"),
+        ("cat > hello.py << 'EOF'\nprint('hi')\nEOF", "Set-Content -Path hello.py -Value @'\nprint('hi')\n'@"),
+        ("cat > x <<EOF\nrm -rf $TMP\nEOF\npwd", "cat > x <<EOF\nrm -rf $TMP\nEOF\nGet-Location"),
+    ],
+    ("windows", "cmd"): [
+        ("ls -la", "dir /a"),
+        ("rm -rf build", "rmdir /s /q build"),
+        ("rm -f a.txt", "del /f /q a.txt"),
+        ("mkdir -p a/b/c", "mkdir a\\b\\c"),
+        # cmd reads `/` as a switch, so path operands get backslashes
+        ("rm src/x.txt", "del src\\x.txt"),
+        ("cat docs/notes.txt", "type docs\\notes.txt"),
+        ("cp src/a.txt \"my backup/a.txt\"", "copy src\\a.txt \"my backup\\a.txt\""),
+        ("mv build/out.log logs/", "move build\\out.log logs\\"),
+        ("ls -la src/app", "dir /a src\\app"),
+        ("grep -r a/b src/lib", "findstr /s a/b src\\lib"),
+        ("find src/app -name '*.py'", "dir /s /b src\\app\\*.py"),
+        ("echo a/b", "echo a/b"),
+        ("touch a.txt", "type nul >> a.txt"),
+        ("cat a.txt | grep -i error", "type a.txt | findstr /i error"),
+        ("cp -r src \"my backup\"", "xcopy /e /i src \"my backup\""),
+        ("which python", "where python"),
+        ("cat > run.bat << 'EOF'\n@echo off\n\necho 100% & done\nEOF",
+         "echo.@echo off > run.bat\necho. >> run.bat\necho.echo 100%% ^& done >> run.bat"),
+    ],
+}
+UNIX_COMMANDS = ["ls -la", "rm -rf build", "cat a | grep -i x", "cat > f << 'EOF'\nhi\nEOF", "echo $HOME"]
+for target in (("linux", "bash"), ("linux", "zsh"), ("macos", "zsh")):
+    CASES[target] = [(command, command) for command in UNIX_COMMANDS]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch", type=int, default=10000, help="Commands per translate_many() call")
+    args = parser.parse_args()
+
+    failures = 0
+    for (os_type, shell_type), cases in CASES.items():
+        translator = command_translator.CommandTranslator(os_type, shell_type)
+        results = translator.translate_many([command for command, _ in cases])
+        passed = 0
+        for (command, expected), result in zip(cases, results):
+            if result == expected:
+                passed += 1
+            else:
+                failures += 1
+                print(f"FAIL {os_type}/{shell_type}: {command!r}\n  expected {expected!r}\n  got      {result!r}")
+        print(f"{os_type}/{shell_type}: {passed}/{len(cases)} translations as expected")
+
+    commands = [command for command, _ in CASES[("windows", "powershell")]]
+    batch = (commands * (args.batch // len(commands) + 1))[:args.batch]
+    for label, translator in (("cold", None), ("warm", command_translator.CommandTranslator("windows", "powershell"))):
+        translator = translator or command_translator.CommandTranslator("windows", "powershell")
+        if label == "warm":
+            translator.translate_many(commands)
+        started = time.perf_counter()
+        translator.translate_many(batch)
+        elapsed = time.perf_counter() - started
+        print(f"translate_many, {label}: {len(batch)} commands in {elapsed * 1000:.1f} ms "
+              f"({elapsed / len(batch) * 1e6:.2f} us/command)")
+
+    # Distinct commands, so nothing comes from the per-instance cache
+    translator = command_translator.CommandTranslator("windows", "powershell")
+    distinct = [f"rm -rf build{i} && mkdir -p build{i}/out | grep -i x{i}" for i in range(args.batch)]
+    started = time.perf_counter()
+    translator.translate_many(distinct)
+    elapsed = time.perf_counter() - started
+    print(f"translate_many, distinct: {len(distinct)} commands in {elapsed * 1000:.1f} ms "
+          f"({elapsed / len(distinct) * 1e6:.2f} us/command)")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
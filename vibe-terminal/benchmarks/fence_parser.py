@@ -0,0 +1,167 @@
+"""Fuzz and benchmark the streaming fence parser.
+
+The fuzz phase generates random markdown documents from known blocks
+(backtick and tilde fences of varying length and indentation, languages,
+heredocs containing fences, unterminated trailing blocks, prose with inline
+code) and checks that:
+
+- the parser recovers exactly the blocks that were generated
+- feeding the document in random chunk sizes gives the same result
+- random garbage never raises
+
+The benchmark phase times the parser on multi-megabyte responses, checks
+that time grows linearly with size, and compares with the regex the command
+extractors used before.
+
+    python benchmarks/fence_parser.py [--iterations 2000] [--seed 0] [--size-mb 4]
+"""
+import argparse
+import importlib
+import os
+import random
+import re
+import sys
+import time
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+fences = importlib.import_module("vibe-terminal.fences")
+
+LANGUAGES = ["", "bash", "sh", "zsh", "python", "powershell", "json", "Bash"]
+WORDS = ["list", "the", "files", "`ls`", "run", "``code``", "then", "<<", "EOF", "~~", "done."]
+# Body words leave out "<<", which would open a heredoc inside shell blocks
+BODY_WORDS = [word for word in WORDS if word != "<<"]
+OLD_PATTERN = re.compile(r'```(?:bash)?\s*(.*?)\s*```', re.DOTALL)
+
+
+def random_body(rng: random.Random, language: str) -> str:
+    lines = []
+    for _ in range(rng.randint(0, 6)):
+        choice = rng.random()
+        if choice < 0.15 and language.lower() in fences.SHELL_LANGUAGES:
+            # A heredoc whose body contains a fence that must not close the block
+            delimiter = rng.choice(["EOF", "END", "MD"])
+            quoted = rng.choice([f"'{delimiter}'", delimiter, f'"{delimiter}"'])
+            lines.append(f"cat > README.md << {quoted}")
+            lines.extend(["# Title", "```python", "print('x')", "```", delimiter])
+        elif choice < 0.25:
+            lines.append("echo `date` ``")
+        else:
+            lines.append(" ".join(rng.choice(BODY_WORDS) for _ in range(rng.randint(0, 5))))
+    return "\n".join(lines)
+
+
+def random_document(rng: random.Random):
+    """Return a document and the blocks the parser should find in it."""
+    parts, expected = [], []
+    for _ in range(rng.randint(0, 8)):
+        parts.append(" ".join(rng.choice(WORDS) for _ in range(rng.randint(0, 8))))
+        char = rng.choice("`~")
+        length = rng.randint(3, 5)
+        indent = rng.randint(0, 3)
+        language = rng.choice(LANGUAGES)
+        body = random_body(rng, language)
+        if body.strip() and body.lstrip().startswith(char * 3):
+            body = "x" + body
+        # Body lines are indented like the fence; the parser strips that indentation again
+        indented = "\n".join((" " * indent + line) if line else line for line in body.split("\n"))
+        info = f" {language}" if language and rng.random() < 0.5 else language
+        parts.append(f"{' ' * indent}{char * length}{info}\n{indented}\n{' ' * indent}{char * rng.randint(length, length + 2)}")
+        expected.append((language.lower(), body, True))
+
+    if rng.random() < 0.2:
+        language = rng.choice(LANGUAGES)
+        body = random_body(rng, language)
+        parts.append(f"```{language}\n{body}")
+        expected.append((language.lower(), body, False))
+    return "\n".join(parts) + rng.choice(["", "\n", "\r\n"]), expected
+
+
+def feed_in_chunks(rng: random.Random, text: str):
+    parser = fences.FenceParser()
+    position = 0
+    while position < len(text):
+        size = rng.randint(1, 64)
+        parser.feed(text[position:position + size])
+        position += size
+    parser.close()
+    return parser.blocks
+
+
+def fuzz(iterations: int, seed: int) -> int:
+    rng = random.Random(seed)
+    failures = 0
+    for iteration in range(iterations):
+        document, expected = random_document(rng)
+        blocks = fences.parse_fenced_blocks(document)
+        # Whether the document's final line ending belongs to an unterminated block is ambiguous
+        got = [(b.language, b.content if b.terminated else b.content.rstrip("\r\n"), b.terminated) for b in blocks]
+        expected = [(lang, body if done else body.rstrip("\n"), done) for lang, body, done in expected]
+        if got != expected:
+            failures += 1
+            if failures <= 3:
+                print(f"Mismatch in iteration {iteration}:\n{document!r}\nexpected {expected}\ngot      {got}")
+        if feed_in_chunks(rng, document) != blocks:
+            failures += 1
+            if failures <= 3:
+                print(f"Chunked parse differs in iteration {iteration}:\n{document!r}")
+
+        garbage = "".join(rng.choice("`~ \n\tab<'\"-EOF\r") for _ in range(rng.randint(0, 200)))
+        try:
+            fences.parse_fenced_blocks(garbage)
+            feed_in_chunks(rng, garbage)
+        except Exception as e:  # noqa: BLE001 - any exception is a failure here
+            failures += 1
+            print(f"Parser raised {e!r} on {garbage!r}")
+    return failures
+
+
+def make_response(size_bytes: int) -> str:
+    block = "Here is the command:\n```bash\ncat > notes.md << 'EOF'\n```js\nconsole.log(1)\n```\nEOF\nls -la\n```\n\n"
+    return block * max(1, size_bytes // len(block))
+
+
+def time_call(fn, *args) -> float:
+    started = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - started
+
+
+def benchmark(size_mb: float) -> int:
+    failures = 0
+    sizes = [int(size_mb * 1024 * 1024 / 4), int(size_mb * 1024 * 1024)]
+    timings = []
+    for size in sizes:
+        text = make_response(size)
+        parse_time = min(time_call(fences.parse_fenced_blocks, text) for _ in range(3))
+        chunked_time = time_call(feed_in_chunks, random.Random(0), text)
+        regex_time = time_call(OLD_PATTERN.findall, text)
+        timings.append(parse_time)
+        print(f"{len(text) / 1024 / 1024:6.2f} MB: parse {parse_time * 1000:8.1f} ms "
+              f"({len(text) / parse_time / 1024 / 1024:5.1f} MB/s), chunked {chunked_time * 1000:8.1f} ms, "
+              f"old regex {regex_time * 1000:8.1f} ms")
+
+    # 4x the input should cost about 4x the time; allow generous noise
+    ratio = timings[1] / timings[0]
+    print(f"Scaling for 4x input: {ratio:.1f}x")
+    if ratio > 6:
+        print("FAIL: parse time grows faster than linearly")
+        failures += 1
+    return failures
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--size-mb", type=float, default=4.0)
+    args = parser.parse_args()
+
+    failures = fuzz(args.iterations, args.seed)
+    print(f"Fuzz: {args.iterations} documents, {failures} failure(s)")
+    failures += benchmark(args.size_mb)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,149 @@
+"""Disk usage and load time of history results, inline versus in the blob store.
+
+Builds a history in the previous format, where every entry's result JSON
+holds its complete stdout/stderr, from a mix of typical commands (repeated
+`ls -la` and `git status` runs with near-identical output, occasional
+large build logs). It then reports the database size and the time to load
+the newest page and to read every entry, migrates the database to the blob
+store (compressed, deduplicated, capped outputs) and reports the same
+numbers again. Outputs must round-trip unchanged unless they were capped,
+and undoing or rotating away entries must free exactly the blobs no other
+entry references.
+
+    python benchmarks/history_blobs.py [--entries 20000]
+"""
+import argparse
+import importlib
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+command_history = importlib.import_module("vibe-terminal.command_history")
+blob_store = importlib.import_module("vibe-terminal.blob_store")
+
+OLD_SCHEMA = """
+CREATE TABLE history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, command TEXT NOT NULL, timestamp TEXT NOT NULL, created REAL NOT NULL,
+    cwd TEXT, host TEXT, pid INTEGER, session TEXT, return_code INTEGER, result TEXT
+);
+PRAGMA user_version = 2;
+"""
+
+
+def make_outputs(rng: random.Random):
+    listing = "\n".join(
+        f"-rw-r--r--  1 user staff {rng.randint(100, 99999):>6} Oct 19 12:00 file_{i}.py" for i in range(40)
+    ) + "\n"
+    status = "On branch main\nChanges not staged for commit:\n" + "".join(
+        f"\tmodified:   src/module_{i}.py\n" for i in range(8)
+    )
+    return listing, status
+
+
+def build_old(path: str, entries: int, seed: int = 0) -> dict:
+    rng = random.Random(seed)
+    listing, status = make_outputs(rng)
+    db = sqlite3.connect(path)
+    db.executescript(OLD_SCHEMA)
+    rows, originals = [], {}
+    for i in range(entries):
+        kind = rng.random()
+        if kind < 0.45:
+            command, output = "ls -la", listing
+            if rng.random() < 0.05:
+                listing, status = make_outputs(rng)
+        elif kind < 0.85:
+            command, output = "git status", status
+        elif kind < 0.99:
+            command, output = f"grep -rn item_{i % 50} src", f"src/a.py:{i % 50}: item_{i % 50}\n" * rng.randint(1, 20)
+        else:
+            command = "make build"
+            output = "".join(f"[{n:5}] compiling unit_{n}.c -O2 -Wall\n" for n in range(rng.randint(2000, 6000)))
+        result = {"command": command, "success": True, "output": output, "error": "", "return_code": 0,
+                  "output_bytes": len(output), "truncated": False, "duration": 0.1}
+        originals[i + 1] = output
+        rows.append((command, "2026-10-19 12:00:00", time.time(), "/home/user/project", "bench", 1, "bench:1",
+                     0, json.dumps(result)))
+    db.executemany(
+        "INSERT INTO history (command, timestamp, created, cwd, host, pid, session, return_code, result) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        rows
+    )
+    db.commit()
+    db.execute("VACUUM")
+    db.close()
+    return originals
+
+
+def timed(fn):
+    started = time.perf_counter()
+    value = fn()
+    return value, (time.perf_counter() - started) * 1000
+
+
+def report(label: str, path: str, page_ms: float, scan_ms: float) -> None:
+    size = sum(os.path.getsize(path + suffix) for suffix in ("", "-wal") if os.path.exists(path + suffix))
+    print(f"{label:<8} {size / 1024 / 1024:8.2f} MiB   newest page {page_ms:7.2f} ms   all entries {scan_ms:8.1f} ms")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entries", type=int, default=20000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "history.db")
+        originals = build_old(path, args.entries)
+
+        db = sqlite3.connect(path)
+        _, page_ms = timed(lambda: [json.loads(row[0]) for row in
+                                    db.execute("SELECT result FROM history ORDER BY id DESC LIMIT 20")])
+        _, scan_ms = timed(lambda: sum(1 for row in db.execute("SELECT result FROM history") if json.loads(row[0])))
+        db.close()
+        report("Before", path, page_ms, scan_ms)
+
+        history = command_history.CommandHistory(path, import_from=None)
+        _, migrate_ms = timed(history._connect)
+        # In WAL mode VACUUM writes the new database to the WAL; checkpoint it into place
+        history._db.execute("VACUUM")
+        history._db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        _, page_ms = timed(lambda: history.search(limit=20))
+        _, scan_ms = timed(lambda: sum(1 for _ in history.iter_history()))
+        report("After", path, page_ms, scan_ms)
+        blobs, size, compressed = history.blobs.stats()
+        print(f"Migration took {migrate_ms / 1000:.1f}s; {blobs} unique outputs, "
+              f"{size / 1024 / 1024:.2f} MiB stored as {compressed / 1024 / 1024:.2f} MiB compressed")
+
+        failures = 0
+        for entry in history.iter_history():
+            expected = blob_store.excerpt(originals[entry["id"]])
+            if entry["result"]["output"] != expected:
+                failures += 1
+        print(f"Round trip: {len(originals) - failures}/{len(originals)} outputs intact")
+
+        # Undoing a command releases its own blobs without sweeping the whole store
+        _, undo_ms = timed(history.undo_last_command)
+        leftover, _ = history.blobs.gc()
+        print(f"Undo of the last entry took {undo_ms:.2f} ms; {leftover} unreferenced blobs left behind")
+        if leftover:
+            failures += 1
+        blobs = history.blobs.stats()[0]
+
+        # Dropping most entries must free their blobs
+        history.rotate(max_entries=10)
+        removed = blobs - history.blobs.stats()[0]
+        print(f"After keeping 10 entries, rotation freed {removed} of {blobs} blobs")
+        if history.blobs.stats()[0] > 10:
+            failures += 1
+        history.close()
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,100 @@
+"""Concurrent writers on the shared command history.
+
+Starts many processes that each append entries to one history database, as
+VibeTerminal running in dozens of terminals would, and checks that no entry
+is lost and that every entry carries its writer's pid and session. The
+read-modify-write JSON file used before is run under the same load for
+comparison; it typically loses most entries.
+
+    python benchmarks/history_concurrency.py [--writers 32] [--entries 200]
+"""
+import argparse
+import importlib
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+command_history = importlib.import_module("vibe-terminal.command_history")
+
+
+def sqlite_writer(path: str, writer: int, entries: int, start) -> None:
+    os.environ["VIBETERMINAL_SESSION"] = f"bench:{writer}"
+    history = command_history.CommandHistory(path, import_from=None)
+    start.wait()
+    for i in range(entries):
+        history.add_command(f"echo {writer} {i}", {"return_code": 0, "output": f"{writer} {i}\n"})
+    history.close()
+
+
+def json_writer(path: str, writer: int, entries: int, start) -> None:
+    start.wait()
+    for i in range(entries):
+        # What CommandHistory._save_history did: load everything, append, rewrite
+        try:
+            with open(path) as f:
+                history = json.load(f)
+        except (OSError, ValueError):
+            history = []
+        history.append({"command": f"echo {writer} {i}"})
+        with open(path, "w") as f:
+            json.dump(history, f, indent=2)
+
+
+def run(target, path: str, writers: int, entries: int) -> float:
+    start = multiprocessing.Event()
+    processes = [multiprocessing.Process(target=target, args=(path, w, entries, start)) for w in range(writers)]
+    for process in processes:
+        process.start()
+    time.sleep(0.2)
+    started = time.perf_counter()
+    start.set()
+    for process in processes:
+        process.join()
+    return time.perf_counter() - started
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--writers", type=int, default=32)
+    parser.add_argument("--entries", type=int, default=200, help="Entries appended by each writer")
+    args = parser.parse_args()
+    expected = args.writers * args.entries
+    failures = 0
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "history.db")
+        elapsed = run(sqlite_writer, path, args.writers, args.entries)
+        history = command_history.CommandHistory(path, import_from=None)
+        stored = history.count()
+        sessions = {}
+        for entry in history.iter_history():
+            writer = entry["command"].split()[1]
+            sessions.setdefault(entry["session"], set()).add(writer)
+        mismatched = [session for session, writers in sessions.items() if {f"bench:{w}" for w in writers} != {session}]
+        print(f"SQLite: {args.writers} writers x {args.entries} entries in {elapsed:.2f}s "
+              f"({stored / elapsed:,.0f} appends/s), {stored}/{expected} stored")
+        if stored != expected:
+            print(f"FAIL: {expected - stored} entries lost")
+            failures += 1
+        if len(sessions) != args.writers or mismatched:
+            print(f"FAIL: entries tagged with the wrong session: {mismatched[:5]}")
+            failures += 1
+
+        path = os.path.join(directory, "history.json")
+        elapsed = run(json_writer, path, args.writers, args.entries)
+        try:
+            with open(path) as f:
+                stored = len(json.load(f))
+        except ValueError:
+            stored = 0  # A concurrent rewrite left the file truncated
+        print(f"JSON:   {args.writers} writers x {args.entries} entries in {elapsed:.2f}s, {stored}/{expected} stored")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,101 @@
+"""History search latency on a large history.
+
+Fills a temporary history database with generated entries (1M by default)
+and times paginated newest-first queries: full-text searches for common and
+rare words, combined with directory, time-range and success filters, and
+the following page via the keyset cursor. Fails if any query is slower than
+the budget.
+
+    python benchmarks/history_search.py [--entries 1000000] [--budget-ms 50] [--keep history.db]
+"""
+import argparse
+import importlib
+import os
+import random
+import sys
+import tempfile
+import time
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+command_history = importlib.import_module("vibe-terminal.command_history")
+
+COMMANDS = [
+    "ls -la {d}", "git status", "git log --oneline -n 20", "docker build -t {w} .", "docker ps -a",
+    "docker compose up -d {w}", "grep -rn {w} {d}", "python3 {w}.py", "pytest tests/test_{w}.py",
+    "kubectl get pods -n {w}", "rsync -av {d}/ backup/{w}/", "make {w}", "npm run {w}", "cat {d}/{w}.log",
+]
+WORDS = ["api", "web", "worker", "build", "release", "auth", "billing", "search", "metrics", "cache"]
+DIRS = [f"/home/user/projects/{w}" for w in WORDS]
+
+
+def populate(history, entries: int, seed: int = 0) -> None:
+    rng = random.Random(seed)
+    now = time.time()
+    step = 365 * 86400 / entries
+    rows = []
+    for i in range(entries):
+        created = now - (entries - i) * step
+        command = rng.choice(COMMANDS).format(d=rng.choice(DIRS), w=rng.choice(WORDS))
+        if rng.random() < 0.0001:
+            command += " --flag-zanzibar"
+        return_code = 0 if rng.random() < 0.9 else rng.choice([1, 2, 127])
+        rows.append((command, time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(created)), created,
+                     rng.choice(DIRS), "bench", 1, "bench:1", return_code, '{"return_code": %d}' % return_code))
+    db = history._connect()
+    with history._transaction():
+        db.executemany(
+            "INSERT INTO history (command, timestamp, created, cwd, host, pid, session, return_code, result) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            rows
+        )
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entries", type=int, default=1_000_000)
+    parser.add_argument("--budget-ms", type=float, default=50.0, help="Slowest acceptable query")
+    parser.add_argument("--keep", help="Build (or reuse) the database at this path instead of a temporary one")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    path = args.keep or os.path.join(directory, "history.db")
+    history = command_history.CommandHistory(path, import_from=None)
+    if history.count() < args.entries:
+        started = time.perf_counter()
+        populate(history, args.entries - history.count())
+        print(f"Inserted {args.entries} entries in {time.perf_counter() - started:.1f}s "
+              f"({os.path.getsize(path) / 1024 / 1024:.0f} MiB), full-text index: {history.full_text}")
+
+    week_ago = time.time() - 7 * 86400
+    queries = {
+        "latest page": {},
+        "search 'docker'": {"text": "docker"},
+        "search 'docker build'": {"text": "docker build"},
+        "search rare word": {"text": "zanzibar"},
+        "search 'git', one directory": {"text": "git", "cwd": DIRS[3]},
+        "search 'pytest', failed": {"text": "pytest", "success": False},
+        "search 'rsync', last week": {"text": "rsync", "since": week_ago},
+        "failed, one directory": {"success": False, "cwd": DIRS[5]},
+        "prefix 'kube'": {"text": "kube"},
+    }
+    failures = 0
+    for name, filters in queries.items():
+        timings = []
+        for _ in range(3):
+            started = time.perf_counter()
+            page = history.search(limit=20, **filters)
+            if page:
+                # The next page, through the keyset cursor
+                history.search(limit=20, before_id=page[-1]["id"], **filters)
+            timings.append((time.perf_counter() - started) / 2)
+        best = min(timings) * 1000
+        status = "ok" if best <= args.budget_ms else "SLOW"
+        failures += status != "ok"
+        print(f"{name:<30} {best:8.2f} ms/page  {len(page):>3} results  {status}")
+    history.close()
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
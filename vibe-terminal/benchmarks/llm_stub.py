@@ -0,0 +1,163 @@
+"""Offline LLM round trips through the local stub server.
+
+Serves a small cassette with a shaped latency (a fixed delay before the
+first token and a fixed token rate) and checks, with the real LLM client,
+that non-streamed and streamed answers come back as recorded and that the
+measured time to first token and total time match the configured shape.
+Then records a session through a second stub in record mode, replays the
+saved cassette, checks the injected error rate over many requests, and
+reports client-side time-to-first-token percentiles for concurrent streams.
+
+    python benchmarks/llm_stub.py [--ttft-ms 200] [--tokens-per-second 100] [--concurrency 16]
+"""
+import argparse
+import concurrent.futures
+import http.client
+import importlib
+import json
+import os
+import sys
+import tempfile
+import time
+import urllib.parse
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+stub_server = importlib.import_module("vibe-terminal.llm.stub_server")
+llm_module = importlib.import_module("vibe-terminal.llm.llm")
+
+ANSWER = ("Here are the Python files in this directory, largest first.\n\n"
+          "```bash\nfind . -name '*.py' -type f -exec ls -lS {} +\n```\n\n"
+          "Add `| head` to see only the biggest ones.")
+CASSETTE = {
+    "version": 1,
+    "interactions": [
+        {"request": {"query": "Hello"}, "response": {"content": "Hi!"}},
+        {"request": {"query": "list the python files"}, "response": {"content": ANSWER}},
+        {"response": {"content": "I have no recording for that."}},
+    ],
+}
+
+
+def stream_ttft(base_url: str, query: str) -> float:
+    """Send one streamed request with a bare HTTP client and return the time to its first content chunk."""
+    url = urllib.parse.urlsplit(base_url)
+    connection = http.client.HTTPConnection(url.netloc, timeout=30)
+    body = json.dumps({"model": "stub", "stream": True, "messages": [{"role": "user", "content": query}]})
+    started = time.perf_counter()
+    connection.request("POST", url.path + "/chat/completions", body, {"Content-Type": "application/json"})
+    response = connection.getresponse()
+    first = None
+    for line in response:
+        if first is None and line.startswith(b"data:") and b'"content": "' in line and b'"content": ""' not in line:
+            first = time.perf_counter() - started
+    connection.close()
+    return first
+
+
+def percentile(values, fraction: float) -> float:
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ttft-ms", type=float, default=200.0)
+    parser.add_argument("--tokens-per-second", type=float, default=100.0)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--error-rate", type=float, default=0.2)
+    args = parser.parse_args()
+    os.environ.setdefault("NOVITA_API_KEY", "stub")
+
+    failures = 0
+
+    def check(condition: bool, message: str) -> None:
+        nonlocal failures
+        if not condition:
+            print(f"FAIL: {message}")
+            failures += 1
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "cassette.json")
+        with open(path, "w") as f:
+            json.dump(CASSETTE, f)
+        shape = {
+            "ttft": stub_server.Distribution("fixed", (args.ttft_ms,)),
+            "tokens_per_second": stub_server.Distribution("fixed", (args.tokens_per_second,)),
+        }
+
+        with stub_server.StubServer(stub_server.Cassette(path), seed=1, **shape) as server:
+            llm = llm_module.LLM(model="stub", base_url=server.base_url)
+            answer = llm.invoke_chat("You are a test.", "list the python files")
+            check(answer == ANSWER, f"non-streamed answer differs: {answer!r}")
+
+            pieces = []
+            started = time.perf_counter()
+            first = []
+            streamed = llm.stream_chat("You are a test.", "list the python files",
+                                       on_text=lambda text: first.append(time.perf_counter() - started)
+                                       or pieces.append(text))
+            total = time.perf_counter() - started
+            check(streamed == ANSWER, f"streamed answer differs: {streamed!r}")
+            check(len(pieces) > 10, f"answer was not streamed in pieces ({len(pieces)})")
+            expected_total = args.ttft_ms / 1000 + sum(max(1, len(p) // 4) for p in pieces[1:]) / args.tokens_per_second
+            print(f"Streamed {len(pieces)} chunks: first token after {first[0] * 1000:.0f} ms "
+                  f"(configured {args.ttft_ms:.0f} ms), complete after {total * 1000:.0f} ms "
+                  f"(expected {expected_total * 1000:.0f} ms)")
+            check(abs(first[0] * 1000 - args.ttft_ms) < 100, "time to first token is off")
+            check(abs(total - expected_total) < 0.2 + expected_total * 0.2, "total time is off")
+            fallback = llm.invoke_chat("You are a test.", "something else entirely")
+            check(fallback == "I have no recording for that.", f"default interaction not used: {fallback!r}")
+
+            # Record through a second stub that forwards to the first, then replay the recording
+            recorded_path = os.path.join(directory, "recorded.json")
+            with stub_server.StubServer(stub_server.Cassette(recorded_path), upstream=server.base_url) as recorder:
+                recording_llm = llm_module.LLM(model="stub", base_url=recorder.base_url)
+                recording_llm.invoke_chat("Context: /home/a", "list the python files")
+                recording_llm.stream_chat("Context: /home/a", "Hello")
+            with open(recorded_path) as f:
+                recorded = json.load(f)["interactions"]
+            check(len(recorded) == 3, f"expected 3 recorded interactions (with the client's check), got {len(recorded)}")
+
+        with stub_server.StubServer(stub_server.Cassette(recorded_path)) as replay:
+            replay_llm = llm_module.LLM(model="stub", base_url=replay.base_url)
+            # A different context in the prompt still matches on the user's query
+            check(replay_llm.invoke_chat("Context: /home/b", "list the python files") == ANSWER,
+                  "recorded answer not replayed")
+            check(replay_llm.stream_chat("Context: /home/b", "Hello") == "Hi!", "recorded stream not replayed")
+        print(f"Recorded {len(recorded)} interactions and replayed them")
+
+        with stub_server.StubServer(stub_server.Cassette(path), error_rate=args.error_rate, seed=7) as server:
+            url = urllib.parse.urlsplit(server.base_url)
+            failed = 0
+            for _ in range(500):
+                connection = http.client.HTTPConnection(url.netloc, timeout=10)
+                connection.request("POST", url.path + "/chat/completions",
+                                   json.dumps({"messages": [{"role": "user", "content": "Hello"}]}),
+                                   {"Content-Type": "application/json"})
+                response = connection.getresponse()
+                response.read()
+                failed += response.status == 500
+                connection.close()
+            print(f"Injected errors: {failed / 500:.1%} of 500 requests (configured {args.error_rate:.0%})")
+            check(abs(failed / 500 - args.error_rate) < 0.05, "error rate is off")
+
+        ttft = stub_server.Distribution("lognormal", (args.ttft_ms, 0.4))
+        with stub_server.StubServer(stub_server.Cassette(path), ttft=ttft, seed=3,
+                                    tokens_per_second=shape["tokens_per_second"]) as server:
+            requests = args.concurrency * 4
+            started = time.perf_counter()
+            with concurrent.futures.ThreadPoolExecutor(args.concurrency) as pool:
+                firsts = list(pool.map(lambda _: stream_ttft(server.base_url, "list the python files"),
+                                       range(requests)))
+            elapsed = time.perf_counter() - started
+            check(all(first is not None for first in firsts), "a concurrent stream returned no content")
+            firsts = [first * 1000 for first in firsts if first is not None]
+            print(f"{requests} streams, {args.concurrency} at a time, in {elapsed:.2f}s: time to first token "
+                  f"p50 {percentile(firsts, 0.5):.0f} ms, p90 {percentile(firsts, 0.9):.0f} ms "
+                  f"(lognormal, median {args.ttft_ms:.0f} ms)")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
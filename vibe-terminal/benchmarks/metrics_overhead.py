@@ -0,0 +1,123 @@
+"""Cost and output of the metrics registry.
+
+Measures the time one counter increment and one histogram observation add
+to the instrumented paths, checks that the rendered text follows the
+Prometheus exposition format (HELP/TYPE lines, cumulative buckets ending in
++Inf, _count equal to the +Inf bucket), that two runs writing the same
+textfile add up instead of overwriting each other, and that the /metrics
+endpoint serves the same text. Finally runs LLM requests against the stub
+server and checks that they show up with the right labels.
+
+    python benchmarks/metrics_overhead.py [--iterations 200000]
+"""
+import argparse
+import importlib
+import json
+import os
+import sys
+import tempfile
+import time
+import urllib.request
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+metrics = importlib.import_module("vibe-terminal.metrics")
+stub_server = importlib.import_module("vibe-terminal.llm.stub_server")
+llm_module = importlib.import_module("vibe-terminal.llm.llm")
+
+
+def per_call_ns(function, iterations: int) -> float:
+    started = time.perf_counter()
+    for _ in range(iterations):
+        function()
+    return (time.perf_counter() - started) / iterations * 1e9
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=200000)
+    args = parser.parse_args()
+    os.environ.setdefault("NOVITA_API_KEY", "stub")
+
+    failures = 0
+
+    def check(condition: bool, message: str) -> None:
+        nonlocal failures
+        if not condition:
+            print(f"FAIL: {message}")
+            failures += 1
+
+    registry = metrics.Registry()
+    counter = registry.counter("bench_events", "Events.", ("kind",))
+    histogram = registry.histogram("bench_duration_seconds", "Durations.", ("kind",), metrics.COMMAND_BUCKETS)
+    child = counter.labels("a")
+    inc = per_call_ns(child.inc, args.iterations)
+    labelled_inc = per_call_ns(lambda: counter.labels("b").inc(), args.iterations)
+    observe = per_call_ns(lambda: histogram.labels("a").observe(0.03), args.iterations)
+    print(f"counter inc {inc:.0f} ns, labels().inc() {labelled_inc:.0f} ns, "
+          f"labels().observe() {observe:.0f} ns per call")
+    check(observe < 20000, "observing a histogram takes more than 20 us")
+
+    histogram.labels('quote"d').observe(100)
+    families = metrics.parse_text(registry.render())
+    check(set(families) == {"bench_events", "bench_duration_seconds"}, f"unexpected families {sorted(families)}")
+    documentation, kind, samples = families["bench_duration_seconds"]
+    check(kind == "histogram" and documentation == "Durations.", "histogram HELP/TYPE lines are wrong")
+    buckets = [value for sample, value in samples.items() if sample.startswith('bench_duration_seconds_bucket{kind="a"')]
+    check(buckets == sorted(buckets), "bucket counts are not cumulative")
+    check(samples.get('bench_duration_seconds_bucket{kind="a",le="+Inf"}') == args.iterations, "+Inf bucket is off")
+    check(samples.get('bench_duration_seconds_count{kind="a"}') == args.iterations, "_count is off")
+    check(samples.get('bench_duration_seconds_bucket{kind="a",le="0.025"}') == 0
+          and samples.get('bench_duration_seconds_bucket{kind="a",le="0.05"}') == args.iterations,
+          "0.03 landed in the wrong bucket")
+    check('bench_duration_seconds_count{kind="quote\\"d"}' in samples, "label values are not escaped")
+    check(families["bench_events"][2].get('bench_events_total{kind="a"}') == args.iterations, "counter total is off")
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "textfile", "vibeterminal.prom")
+        metrics.write_textfile(path, registry)
+        metrics.write_textfile(path, registry)
+        with open(path) as f:
+            merged = metrics.parse_text(f.read())
+        check(merged["bench_events"][2].get('bench_events_total{kind="a"}') == 2 * args.iterations,
+              "a second run did not add to the textfile")
+        check(merged["bench_duration_seconds"][1] == "histogram", "textfile lost the metric type")
+        print(f"Textfile after two runs: {os.path.getsize(path)} bytes, counts doubled")
+
+    server = metrics.start_http_server(0, registry=registry)
+    try:
+        url = f"http://127.0.0.1:{server.server_address[1]}/metrics"
+        with urllib.request.urlopen(url, timeout=5) as response:
+            content_type = response.headers["Content-Type"]
+            served = response.read().decode()
+        check(content_type == metrics.CONTENT_TYPE, f"wrong content type {content_type!r}")
+        check(served == registry.render(), "/metrics serves different text than render()")
+        print(f"/metrics served {len(served)} bytes")
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "cassette.json")
+        with open(path, "w") as f:
+            json.dump({"version": 1, "interactions": [{"response": {"content": "Hi!"}}]}, f)
+        with stub_server.StubServer(stub_server.Cassette(path)) as server:
+            llm = llm_module.LLM(model="stub", base_url=server.base_url)
+            llm.invoke_chat("You are a test.", "Hello")
+            llm.stream_chat("You are a test.", "Hello")
+    samples = metrics.parse_text(metrics.REGISTRY.render())
+    requests = samples["vibeterminal_llm_requests"][2]
+    check(requests.get('vibeterminal_llm_requests_total{model="stub",provider="local",outcome="ok"}') == 2,
+          f"LLM requests not counted: {requests}")
+    durations = samples["vibeterminal_llm_request_duration_seconds"][2]
+    check(durations.get('vibeterminal_llm_request_duration_seconds_count{model="stub",provider="local",mode="stream"}') == 1,
+          "streamed request duration not observed")
+    ttft = samples["vibeterminal_llm_time_to_first_token_seconds"][2]
+    check(ttft.get('vibeterminal_llm_time_to_first_token_seconds_count{model="stub",provider="local"}') == 1,
+          "time to first token not observed")
+    print(f"Stub LLM requests recorded: {sum(requests.values()):.0f}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,349 @@
+"""Benchmark suite for the hot paths of a query, with baseline comparison.
+
+Each benchmark builds a synthetic fixture at several scales and times one
+operation on it: extracting commands from large LLM responses
+(parse_commands), the safety check on long scripts (is_command_safe),
+appending to and searching a large history, loading the context of large
+directories, and complete agent graph runs against a stub LLM that answers
+instantly, both in-process and over HTTP through the local stub server.
+Every case is run until a sample takes at least --min-time seconds,
+--repeat times; the median time per operation is reported.
+
+Results can be written as JSON and compared with an earlier run; the suite
+fails if any case is slower than the baseline by more than the tolerance.
+
+    python benchmarks/run.py [--quick] [--filter history] [--output results.json]
+                             [--baseline baseline.json] [--tolerance 0.25]
+"""
+import argparse
+import contextlib
+import importlib
+import itertools
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, Iterator, List, NamedTuple
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+SCHEMA_VERSION = 1
+
+
+class Benchmark(NamedTuple):
+    name: str
+    parameter: str
+    scales: List[int]
+    quick_scales: List[int]
+    # Generator: builds the fixture, yields the operation to time, then cleans up
+    fixture: Callable[[int], Iterator[Callable[[], object]]]
+
+
+BENCHMARKS: List[Benchmark] = []
+
+
+def benchmark(parameter: str, scales: List[int], quick_scales: List[int]) -> Callable:
+    def register(fixture):
+        BENCHMARKS.append(Benchmark(fixture.__name__, parameter, scales, quick_scales, fixture))
+        return fixture
+    return register
+
+
+def module(name: str):
+    return importlib.import_module(f"vibe-terminal.{name}")
+
+
+def llm_response(blocks: int) -> str:
+    """A long agent answer: prose, shell blocks (some with heredocs) and code that must not run."""
+    parts = []
+    for i in range(blocks):
+        parts.append(f"Step {i}: list the files, then inspect the build output of target {i}.\n")
+        if i % 3 == 0:
+            parts.append(f"```bash\ncat > notes_{i}.txt << 'EOF'\nline one\n```not a fence\nEOF\n```\n")
+        elif i % 3 == 1:
+            parts.append(f"```python\nprint({i})\n```\n")
+        else:
+            parts.append(f"```sh\nls -la build_{i} | grep -i error && echo done_{i}\n```\n")
+    return "".join(parts)
+
+
+SCRIPT_LINES = [
+    "ls -la src",
+    "grep -rn 'TODO' . | head -n 20",
+    "find . -name '*.pyc' -delete",
+    "git status && git diff --stat",
+    "cat > out.txt << 'EOF'\nhello\nEOF",
+    "for f in *.log; do gzip \"$f\"; done",
+    "echo $(date) >> run.log",
+    "rm -rf build/tmp",
+    "python -m pytest -q tests/",
+    "sed -i 's/foo/bar/g' config.ini",
+]
+# The analyzer stops at the first unsafe command; a read-only script is analyzed in full
+READ_ONLY_LINES = [
+    "ls -la src",
+    "grep -rn 'TODO' . | head -n 20",
+    "git status && git diff --stat",
+    "cat a.txt | sort | uniq -c",
+    "find . -name '*.py' -type f",
+    "wc -l $(git ls-files)",
+]
+
+
+@benchmark("blocks", [10, 100, 1000], [10, 100])
+def parse_commands(scale: int):
+    nodes = module("agent.nodes")
+    state = {"llm_response_raw": llm_response(scale)}
+    yield lambda: nodes.parse_commands(dict(state))
+
+
+@benchmark("lines", [10, 100, 1000], [10, 100])
+def is_command_safe(scale: int):
+    utils = module("utils")
+    script = "\n".join(READ_ONLY_LINES[i % len(READ_ONLY_LINES)] + f" # {i}" for i in range(scale))
+    # Verdicts are memoized per command text; a new last line each time bypasses that
+    calls = itertools.count()
+    yield lambda: utils.is_command_safe(f"{script}\necho {next(calls)}")
+
+
+def _filled_history(directory: str, entries: int):
+    command_history = module("command_history")
+    history = command_history.CommandHistory(history_file=os.path.join(directory, "history.db"), import_from=None)
+    for i in range(entries):
+        history.add_command(f"{SCRIPT_LINES[i % len(SCRIPT_LINES)]} # {i}",
+                            {"return_code": 1 if i % 7 == 0 else 0, "output": f"output of command {i}\n" * 4, "error": ""},
+                            cwd=f"/work/project{i % 10}")
+    return history
+
+
+@benchmark("entries", [1000, 10000], [1000])
+def history_add(scale: int):
+    with tempfile.TemporaryDirectory() as directory:
+        history = _filled_history(directory, scale)
+        result = {"return_code": 0, "output": "total 0\n", "error": ""}
+        yield lambda: history.add_command("ls -la", result, cwd="/work/project0")
+        history.close()
+
+
+@benchmark("entries", [1000, 10000], [1000])
+def history_search(scale: int):
+    with tempfile.TemporaryDirectory() as directory:
+        history = _filled_history(directory, scale)
+        yield lambda: history.search(text="grep head", cwd="/work/project1", limit=20)
+        history.close()
+
+
+@benchmark("files", [100, 10000, 100000], [100, 10000])
+def directory_context(scale: int):
+    cli = module("cli")
+    previous = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        for i in range(scale // 10):
+            os.mkdir(os.path.join(directory, f"dir_{i:06d}"))
+        for i in range(scale - scale // 10):
+            open(os.path.join(directory, f"file_{i:06d}.txt"), "w").close()
+        os.chdir(directory)
+        try:
+            yield cli.load_directory_context
+        finally:
+            os.chdir(previous)
+
+
+class StubLLM:
+    """Answers every prompt instantly with a canned response, like the LLM client would."""
+
+    model = "stub"
+
+    def __init__(self, response: str):
+        self.response = response
+
+    def invoke_chat(self, system_prompt: str, user_query: str, chat_history=None) -> str:
+        return self.response
+
+    def stream_chat(self, system_prompt: str, user_query: str, chat_history=None, on_text=None) -> str:
+        for word in self.response.split(" "):
+            if on_text:
+                on_text(word + " ")
+        return self.response
+
+
+def _graph_fixture(scale: int, make_llm: Callable[[str], object]):
+    """An agent graph run whose LLM answers with `scale` shell blocks (a chat answer for 0)."""
+    cli = module("cli")
+    graph = module("agent.graph")
+    command_history = module("command_history")
+    previous = os.getcwd()
+    if scale:
+        blocks = "".join(f"```bash\necho step {i}\n```\n" for i in range(scale))
+        response = f"Run these:\n{blocks}"
+    else:
+        response = "The directory holds a small Python project with tests and a README. " * 5
+    options = {"is_agent_mode": scale > 0, "verbose": False, "serial": False, "spool_output": False,
+               "timeout": None, "cache_results": False, "speculate": False, "foreground": True}
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        history = command_history.CommandHistory(history_file=os.path.join(directory, "history.db"), import_from=None)
+        conversation = {"graph": graph.create_agent_graph(), "llm": make_llm(response)}
+        try:
+            yield lambda: cli.run_query("what is in this directory?", options, True, history, conversation=conversation)
+        finally:
+            history.close()
+            os.chdir(previous)
+
+
+@benchmark("commands", [0, 1, 5], [0, 1])
+def graph_run(scale: int):
+    yield from _graph_fixture(scale, StubLLM)
+
+
+@benchmark("commands", [0, 1], [0])
+def graph_run_http(scale: int):
+    """The same runs through the real LLM client, served by the local stub server without added latency."""
+    stub_server = module("llm.stub_server")
+    llm_module = module("llm.llm")
+    os.environ.setdefault("NOVITA_API_KEY", "stub")
+    with tempfile.TemporaryDirectory() as directory:
+        cassette = os.path.join(directory, "cassette.json")
+        servers = []
+
+        def make_llm(response: str):
+            with open(cassette, "w") as f:
+                json.dump({"version": 1, "interactions": [{"response": {"content": response}}]}, f)
+            servers.append(stub_server.StubServer(stub_server.Cassette(cassette)).start())
+            return llm_module.LLM(model="stub", base_url=servers[0].base_url)
+
+        try:
+            yield from _graph_fixture(scale, make_llm)
+        finally:
+            for server in servers:
+                server.stop()
+
+
+def measure(operation: Callable[[], object], repeat: int, min_time: float) -> Dict:
+    """Time an operation: calibrate the calls per sample, then take repeat samples."""
+    operation()  # Warm-up: imports, caches, lazily started shells
+    number = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(number):
+            operation()
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_time or number >= 1_000_000:
+            break
+        number = max(number * 2, int(number * min_time / max(elapsed, 1e-9) * 1.2))
+    samples = [elapsed / number]
+    for _ in range(repeat - 1):
+        started = time.perf_counter()
+        for _ in range(number):
+            operation()
+        samples.append((time.perf_counter() - started) / number)
+    return {
+        "median_s": statistics.median(samples),
+        "min_s": min(samples),
+        "stdev_s": statistics.stdev(samples) if len(samples) > 1 else 0.0,
+        "number": number,
+        "repeat": len(samples),
+    }
+
+
+def environment() -> Dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=PROJECT_ROOT,
+                                capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "commit": commit,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+
+
+def format_time(seconds: float) -> str:
+    for unit, factor in (("s", 1), ("ms", 1e3), ("us", 1e6)):
+        if seconds * factor >= 1:
+            return f"{seconds * factor:.2f} {unit}"
+    return f"{seconds * 1e9:.0f} ns"
+
+
+def compare(results: Dict[str, Dict], baseline: Dict[str, Dict], tolerance: float) -> int:
+    """Print each case's change against the baseline and return the number of regressions."""
+    regressions = 0
+    print(f"\nAgainst the baseline (tolerance {tolerance:.0%}):")
+    for name, result in results.items():
+        before = baseline.get(name)
+        if before is None:
+            print(f"  {name:<36} new")
+            continue
+        ratio = result["median_s"] / before["median_s"] if before["median_s"] else float("inf")
+        verdict = "ok"
+        if ratio > 1 + tolerance:
+            verdict = "REGRESSION"
+            regressions += 1
+        elif ratio < 1 - tolerance:
+            verdict = "faster"
+        print(f"  {name:<36} {format_time(before['median_s']):>10} -> {format_time(result['median_s']):>10}"
+              f"  x{ratio:.2f}  {verdict}")
+    for name in baseline:
+        if name not in results:
+            print(f"  {name:<36} not run")
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--quick", action="store_true", help="Smaller scales and shorter samples, e.g. for CI")
+    parser.add_argument("--filter", help="Only run benchmarks whose name contains this text")
+    parser.add_argument("--repeat", type=int, default=5, help="Samples per case")
+    parser.add_argument("--min-time", type=float, help="Seconds per sample (default 0.2, 0.05 with --quick)")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    parser.add_argument("--baseline", help="Results JSON of an earlier run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown against the baseline")
+    args = parser.parse_args()
+    min_time = args.min_time if args.min_time is not None else (0.05 if args.quick else 0.2)
+
+    results: Dict[str, Dict] = {}
+    for bench in BENCHMARKS:
+        if args.filter and args.filter not in bench.name:
+            continue
+        for scale in bench.quick_scales if args.quick else bench.scales:
+            name = f"{bench.name}[{bench.parameter}={scale}]"
+            fixture = bench.fixture(scale)
+            setup_started = time.perf_counter()
+            # Everything the code under test prints (rich output, command output) is discarded
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                operation = next(fixture)
+                setup = time.perf_counter() - setup_started
+                try:
+                    result = measure(operation, args.repeat, min_time)
+                finally:
+                    fixture.close()
+            results[name] = {"benchmark": bench.name, bench.parameter: scale, "setup_s": setup, **result}
+            print(f"{name:<38} {format_time(result['median_s']):>10}  "
+                  f"(min {format_time(result['min_s'])}, {result['number']} x {result['repeat']})", flush=True)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"schema": SCHEMA_VERSION, "environment": environment(), "quick": args.quick,
+                       "results": results}, f, indent=2)
+        print(f"\nResults written to {args.output}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("environment", {}).get("machine") != platform.machine():
+            print("Note: the baseline was recorded on a different machine type")
+        if compare(results, baseline.get("results", {}), args.tolerance):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
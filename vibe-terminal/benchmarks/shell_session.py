@@ -0,0 +1,69 @@
+"""Per-command overhead of the persistent shell session.
+
+Compares three ways of running a trivial command:
+
+- tempfile: write a script to a NamedTemporaryFile and run /bin/<shell> on it
+  (the previous cli.execute_command)
+- subprocess: subprocess.run(shell=True) per command (the previous agent executor)
+- session: ShellSession.run in one long-lived pty-backed shell
+
+    python benchmarks/shell_session.py [--runs 200] [--shell bash]
+"""
+import argparse
+import importlib
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+shell_session = importlib.import_module("vibe-terminal.shell_session")
+
+COMMAND = "true"
+
+
+def run_tempfile(shell: str) -> None:
+    with tempfile.NamedTemporaryFile(mode="w", suffix=".sh", delete=False) as temp_file:
+        temp_file.write(f"#!/bin/{shell}\n{COMMAND}")
+        path = temp_file.name
+    os.chmod(path, 0o755)
+    subprocess.run([f"/bin/{shell}", path], capture_output=True)
+    os.unlink(path)
+
+
+def run_subprocess(shell: str) -> None:
+    subprocess.run(COMMAND, shell=True, capture_output=True)
+
+
+def time_per_command(runner, runs: int) -> float:
+    start = time.perf_counter()
+    for _ in range(runs):
+        runner()
+    return (time.perf_counter() - start) / runs * 1000
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=200)
+    parser.add_argument("--shell", default="bash")
+    args = parser.parse_args()
+
+    session = shell_session.ShellSession(args.shell)
+    session.run(COMMAND, echo=False)  # Exclude shell startup from the steady-state numbers
+
+    results = {
+        "tempfile": time_per_command(lambda: run_tempfile(args.shell), args.runs),
+        "subprocess": time_per_command(lambda: run_subprocess(args.shell), args.runs),
+        "session": time_per_command(lambda: session.run(COMMAND, echo=False), args.runs),
+    }
+    session.close()
+
+    for name, ms in results.items():
+        print(f"{name:<12} {ms:8.3f} ms/command  ({results['tempfile'] / ms:5.1f}x vs tempfile)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,51 @@
+"""Cold-start budget check for the non-LLM CLI paths.
+
+Runs `VibeTerminal --history` and `VibeTerminal --undo` in fresh interpreters
+and exits non-zero if the median wall-clock time exceeds the budget, or if
+importing the CLI pulls in any of the heavy LLM/voice dependencies.
+
+    python benchmarks/startup_budget.py [--budget 0.5] [--runs 5]
+"""
+import argparse
+import importlib
+import os
+import sys
+import tempfile
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+startup_profile = importlib.import_module("vibe-terminal.startup_profile")
+
+DEFAULT_BUDGET_SECONDS = float(os.environ.get("VIBETERMINAL_STARTUP_BUDGET", "0.5"))
+NON_LLM_COMMANDS = [["--history"], ["--undo"]]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--budget", type=float, default=DEFAULT_BUDGET_SECONDS, help="Budget in seconds per command")
+    parser.add_argument("--runs", type=int, default=5, help="Runs per command; the median is compared")
+    args = parser.parse_args()
+
+    failures = []
+
+    imported = {t.module.split(".")[0] for t in startup_profile.profile_imports("cli")}
+    leaked = sorted(imported.intersection(startup_profile.HEAVY_MODULES))
+    if leaked:
+        failures.append(f"importing the CLI loads heavy modules: {', '.join(leaked)}")
+
+    # An empty directory keeps the measurement independent of any local history
+    with tempfile.TemporaryDirectory() as workdir:
+        for command in NON_LLM_COMMANDS:
+            elapsed = startup_profile.measure_cold_start(command, runs=args.runs, cwd=workdir)
+            status = "ok" if elapsed <= args.budget else "OVER BUDGET"
+            print(f"VibeTerminal {' '.join(command):<12} {elapsed * 1000:8.1f} ms  (budget {args.budget * 1000:.0f} ms)  {status}")
+            if elapsed > args.budget:
+                failures.append(f"{' '.join(command)} took {elapsed:.3f}s")
+
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,55 @@
+"""Peak-memory check for the streaming executor.
+
+Runs commands that print increasingly large outputs through
+executor.run_streaming in fresh interpreters and reports the peak RSS of
+each. Exits non-zero if peak memory grows with output size by more than
+the allowed slack.
+
+    python benchmarks/streaming_memory.py [--sizes-mb 1 64 512] [--slack-mb 16]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MEASURE = """
+import importlib, json, resource, sys
+executor = importlib.import_module("vibe-terminal.executor")
+result = executor.run_streaming(f"yes vibeterminal | head -c {int(sys.argv[1])}", echo=False)
+peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+if sys.platform == "darwin":
+    peak_kb //= 1024
+print(json.dumps({"captured": len(result["stdout"]), "total": result["stdout_bytes"], "peak_kb": peak_kb}))
+"""
+
+
+def measure(size_bytes: int) -> dict:
+    env = {**os.environ, "PYTHONPATH": PROJECT_ROOT}
+    proc = subprocess.run([sys.executable, "-c", MEASURE, str(size_bytes)], capture_output=True, text=True, env=env, check=True)
+    return json.loads(proc.stdout)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes-mb", type=int, nargs="+", default=[1, 64, 512])
+    parser.add_argument("--slack-mb", type=float, default=16.0, help="Allowed peak RSS growth across sizes")
+    args = parser.parse_args()
+
+    peaks = []
+    for size_mb in args.sizes_mb:
+        stats = measure(size_mb * 1024 * 1024)
+        peaks.append(stats["peak_kb"] / 1024)
+        print(f"output {size_mb:6d} MB  captured {stats['captured']:8d} bytes  peak RSS {peaks[-1]:7.1f} MB")
+
+    growth = max(peaks) - min(peaks)
+    if growth > args.slack_mb:
+        print(f"FAIL: peak memory grew by {growth:.1f} MB across output sizes", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,108 @@
+"""Overhead of tracing and validity of the exported trace files.
+
+Times span() with tracing off (the default for every run) and on, then
+records nested spans from several threads, exports them as Chrome trace
+events and as OTLP/JSON, and checks that every span, its nesting and its
+attributes survive the export.
+
+    python benchmarks/trace_export.py [--spans 100000] [--out trace.json]
+"""
+import argparse
+import importlib
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+tracing = importlib.import_module("vibe-terminal.tracing")
+
+
+def time_spans(count: int) -> float:
+    started = time.perf_counter()
+    for i in range(count):
+        with tracing.span("op", "bench", i=i) as s:
+            s.set("done", True)
+    return (time.perf_counter() - started) / count
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--spans", type=int, default=100000, help="Spans timed with tracing off and on")
+    parser.add_argument("--out", help="Also keep the Chrome trace here (open it in Perfetto)")
+    args = parser.parse_args()
+
+    off = time_spans(args.spans)
+    tracing.start_tracing()
+    on = time_spans(args.spans)
+    tracing.stop_tracing()
+    print(f"span(): {off * 1e9:.0f} ns with tracing off, {on * 1e9:.0f} ns with tracing on")
+
+    tracer = tracing.start_tracing()
+
+    def worker(number: int) -> None:
+        with tracing.span("turn", "bench", worker=number):
+            with tracing.span("llm.stream", "llm") as s:
+                time.sleep(0.002)
+                s.event("first_token")
+                s.set("time_to_first_token_ms", 2.0)
+            with tracing.span("exec", "subprocess", command="x" * 500):
+                time.sleep(0.001)
+
+    threads = [threading.Thread(target=worker, args=(n,), name=f"worker-{n}") for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    tracing.stop_tracing()
+
+    failures = 0
+    with tempfile.TemporaryDirectory() as directory:
+        chrome_path = args.out or os.path.join(directory, "trace.json")
+        otlp_path = os.path.join(directory, "trace.otlp.json")
+        tracer.write(chrome_path, "chrome")
+        tracer.write(otlp_path, "otlp")
+        with open(chrome_path) as f:
+            chrome = json.load(f)
+        with open(otlp_path) as f:
+            otlp = json.load(f)
+
+    complete = [e for e in chrome["traceEvents"] if e["ph"] == "X"]
+    instants = [e for e in chrome["traceEvents"] if e["ph"] == "i"]
+    thread_names = {e["args"]["name"] for e in chrome["traceEvents"] if e["name"] == "thread_name"}
+    if len(complete) != 12 or len(instants) != 4:
+        print(f"FAIL: expected 12 spans and 4 events in the Chrome trace, got {len(complete)} and {len(instants)}")
+        failures += 1
+    if not {f"worker-{n}" for n in range(4)} <= thread_names:
+        print(f"FAIL: thread names missing from the Chrome trace: {sorted(thread_names)}")
+        failures += 1
+    for turn in (e for e in complete if e["name"] == "turn"):
+        children = [e for e in complete if e["tid"] == turn["tid"] and e["name"] != "turn"]
+        if any(c["ts"] < turn["ts"] or c["ts"] + c["dur"] > turn["ts"] + turn["dur"] for c in children):
+            print("FAIL: a child span lies outside its parent")
+            failures += 1
+    if any(len(e["args"].get("command", "")) > tracing.MAX_ATTRIBUTE_LENGTH for e in complete):
+        print("FAIL: long attributes were not clipped")
+        failures += 1
+
+    spans = otlp["resourceSpans"][0]["scopeSpans"][0]["spans"]
+    ids = {s["spanId"] for s in spans}
+    parents = [s for s in spans if s["name"] != "turn"]
+    if len(spans) != 12 or any(s.get("parentSpanId") not in ids for s in parents):
+        print("FAIL: OTLP spans are missing or not linked to their parents")
+        failures += 1
+    if any(int(s["endTimeUnixNano"]) < int(s["startTimeUnixNano"]) for s in spans):
+        print("FAIL: an OTLP span ends before it starts")
+        failures += 1
+
+    print(f"Exported {len(complete)} spans from {len(threads)} threads as Chrome trace events and OTLP/JSON")
+    if args.out:
+        print(f"Chrome trace written to {args.out}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,86 @@
+"""Time to first spoken sentence for a streamed response.
+
+Replays a typical chat answer (prose, a code block, a list) as a token
+stream at a given rate and records when each sentence becomes ready to
+speak, compared with waiting for the whole response as VibeTerminal used
+to. Checks that the code block is replaced by a short notice and that
+splitting the stream gives the same sentences as splitting the whole text.
+With --speak, the sentences are also spoken through pyttsx3.
+
+    python benchmarks/tts_first_sentence.py [--tokens-per-second 40] [--speak]
+"""
+import argparse
+import importlib
+import os
+import re
+import sys
+import time
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+tts = importlib.import_module("vibe-terminal.tts")
+
+RESPONSE = """To find large files, use **find** with a size filter. It searches the directory tree recursively, \
+so it can take a while on big disks.
+
+```bash
+find . -type f -size +100M -exec ls -lh {} \\;
+```
+
+A few notes:
+- The `+100M` means larger than 100 MiB.
+- Use `du -sh *` for a per-directory summary instead.
+- On macOS, e.g. with BSD find, the same options work.
+
+Let me know if you want to delete them too!"""
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tokens-per-second", type=float, default=40.0)
+    parser.add_argument("--speak", action="store_true", help="Speak the sentences as well")
+    args = parser.parse_args()
+    tokens = re.findall(r"\s*\S+", RESPONSE)
+    delay = 1 / args.tokens_per_second
+
+    splitter = tts.SentenceSplitter()
+    queue = tts.SpeechQueue() if args.speak else None
+    started = time.perf_counter()
+    ready = []
+    for token in tokens:
+        time.sleep(delay)
+        for sentence in splitter.feed(token):
+            ready.append((time.perf_counter() - started, sentence))
+            if queue:
+                queue.say(sentence)
+    for sentence in splitter.close():
+        ready.append((time.perf_counter() - started, sentence))
+        if queue:
+            queue.say(sentence)
+    complete = time.perf_counter() - started
+
+    for at, sentence in ready:
+        print(f"{at * 1000:7.0f} ms  {sentence}")
+    print(f"First sentence ready after {ready[0][0] * 1000:.0f} ms; "
+          f"the whole response after {complete * 1000:.0f} ms ({len(tokens)} tokens)")
+
+    whole = tts.SentenceSplitter()
+    expected = whole.feed(RESPONSE) + whole.close()
+    failures = 0
+    if [sentence for _, sentence in ready] != expected:
+        print("FAIL: streaming split differs from splitting the whole text")
+        failures += 1
+    if any("find . -type" in sentence for _, sentence in ready) or "The command is shown on screen." not in expected:
+        print("FAIL: the code block was read out")
+        failures += 1
+    if queue:
+        queue.wait()
+        queue.close()
+        if queue.error:
+            print(f"Speech failed: {queue.error}")
+            failures += 1
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
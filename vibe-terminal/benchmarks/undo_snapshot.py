@@ -0,0 +1,135 @@
+"""Cost of the undo snapshot taken before a file-modifying command.
+
+Creates a large file (256 MiB by default) and times the snapshot VibeTerminal
+takes before commands that delete it (`rm`), replace it (`sed -i`) and change
+it in place (`>>`): the first two are hardlinked, the last is reflinked where
+the filesystem supports it and otherwise copied within the copy budget or
+recorded as too large. It then runs each command, restores the snapshot and
+checks the file's hash, and snapshots many small files twice to show that
+unchanged content is stored once. Finally snapshots a tree of 1 MiB files
+with a 1 MiB copy budget, before removing it (hardlinked, nothing copied)
+and before changing it in place (copying stops at the budget and the
+snapshot is marked incomplete). Fails if a hardlinked snapshot is slower
+than the budget, any restore does not bring the original content back or
+a snapshot copies more than its budget.
+
+    python benchmarks/undo_snapshot.py [--size-mb 256] [--budget-ms 50] [--dir /path/on/btrfs]
+"""
+import argparse
+import hashlib
+import importlib
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+undo_journal = importlib.import_module("vibe-terminal.undo_journal")
+
+
+def file_hash(path: str) -> str:
+    digest = hashlib.blake2b()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def directory_size(path: str) -> int:
+    # Hardlinked objects share their blocks with the original and count once per inode
+    seen, total = set(), 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            st = os.stat(os.path.join(root, name))
+            if (st.st_dev, st.st_ino) not in seen:
+                seen.add((st.st_dev, st.st_ino))
+                total += st.st_blocks * 512
+    return total
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size-mb", type=int, default=256)
+    parser.add_argument("--budget-ms", type=float, default=50.0, help="Slowest acceptable hardlinked snapshot")
+    parser.add_argument("--dir", help="Run on this filesystem instead of the temporary directory")
+    args = parser.parse_args()
+    failures = 0
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as directory:
+        work = os.path.join(directory, "work")
+        os.makedirs(work)
+        big = os.path.join(work, "big.log")
+        with open(big, "wb") as f:
+            for i in range(args.size_mb):
+                f.write(hashlib.sha256(str(i).encode()).digest() * (1 << 15))
+        original = file_hash(big)
+        journal = undo_journal.UndoJournal(os.path.join(directory, "undo"))
+
+        for command in ("rm big.log", "sed -i 's/a/b/' big.log", "echo tail >> big.log"):
+            started = time.perf_counter()
+            snapshot_id = journal.snapshot(command, work)
+            elapsed = (time.perf_counter() - started) * 1000
+            state = journal.get(snapshot_id)["paths"][0]
+            method = "hardlink" if "big.log" in undo_journal.replaced_paths(command) else "reflink/copy"
+            subprocess.run(command, shell=True, cwd=work, check=True)
+            restored, errors = journal.restore(snapshot_id)
+            intact = os.path.exists(big) and file_hash(big) == original
+            if state.kind == "skipped":
+                # Too large to copy here; restoring it cannot be expected
+                outcome = "skipped (no reflink, over the copy budget)"
+                subprocess.run("truncate -s -5 big.log", shell=True, cwd=work, check=True)
+            else:
+                outcome = "restored" if intact else "NOT RESTORED"
+                failures += not intact
+            slow = method == "hardlink" and elapsed > args.budget_ms
+            failures += slow
+            print(f"{command:<24} {method:<13} snapshot {elapsed:8.2f} ms{' SLOW' if slow else ''}  {outcome}")
+
+        # Many small files, snapshotted twice without changes in between
+        for i in range(1000):
+            with open(os.path.join(work, f"small_{i}.txt"), "w") as f:
+                f.write(f"line {i % 100}\n" * 50)
+        started = time.perf_counter()
+        # touch changes the files in place, so their content is stored rather than hardlinked
+        first = journal.snapshot("touch small_*.txt", work)
+        second = journal.snapshot("touch small_*.txt", work)
+        elapsed = (time.perf_counter() - started) * 1000 / 2
+        paths = len(journal.get(first)["paths"]) + len(journal.get(second)["paths"])
+        objects = sum(len(files) for _, _, files in os.walk(journal.objects))
+        print(f"1000 small files x2: {elapsed:.1f} ms per snapshot, {paths} paths recorded, "
+              f"{objects} objects stored ({directory_size(journal.objects) / 1024:.0f} KiB)")
+        if objects > 100:
+            failures += 1
+        journal.close()
+
+        # A tree of 1 MiB files against a 1 MiB copy budget
+        build = os.path.join(work, "build")
+        os.makedirs(build)
+        for i in range(200):
+            with open(os.path.join(build, f"part_{i}.o"), "wb") as f:
+                f.write(hashlib.sha256(f"part {i}".encode()).digest() * (1 << 15))
+        budgeted = undo_journal.UndoJournal(os.path.join(directory, "undo-budget"), copy_budget=1 << 20)
+        tree_inodes = {os.stat(os.path.join(build, name)).st_ino for name in os.listdir(build)}
+
+        def copied_data() -> int:
+            # Hardlinks to the tree's files take no new space
+            return sum(st.st_blocks * 512 for st in (
+                os.stat(os.path.join(root, name)) for root, _, files in os.walk(budgeted.objects) for name in files
+            ) if st.st_ino not in tree_inodes)
+
+        for command, expect_complete in (("rm -rf build", True), ("chmod -R 600 build", False)):
+            before = copied_data()
+            snapshot = budgeted.get(budgeted.snapshot(command, work))
+            stored = copied_data() - before
+            over = snapshot["bytes_copied"] > budgeted.copy_budget
+            print(f"{command:<24} 200 x 1 MiB, budget 1 MiB: copied {snapshot['bytes_copied'] / 1024:.0f} KiB, "
+                  f"new object data {stored / 1024:.0f} KiB, complete={snapshot['complete']}")
+            failures += over or snapshot["complete"] != expect_complete
+        budgeted.close()
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,107 @@
+"""Speech endpointing and recognition latency on recorded WAV files.
+
+Plays 16-bit mono WAV files through the voice pipeline at recording speed,
+as if they came from the microphone, and reports each utterance with its
+partial transcripts and the latency from the end of speech to the final
+text. Without files, a synthetic recording (noise with three bursts of
+tone) checks that the detector finds exactly three utterances, using a
+stand-in recognizer so that no speech model is needed.
+
+    python benchmarks/voice_latency.py [recording.wav ...] [--backend vosk] [--budget-ms 1000]
+"""
+import argparse
+import importlib
+import math
+import os
+import random
+import sys
+import tempfile
+import wave
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+speech = importlib.import_module("vibe-terminal.speech")
+
+
+class FrameCounter(speech.Recognizer):
+    """Stand-in recognizer: the "transcript" is the number of frames heard."""
+
+    name = "frame counter"
+
+    def start(self, sample_rate):
+        self.frames = 0
+
+    def accept(self, frame):
+        self.frames += 1
+        return f"{self.frames} frames" if self.frames % 10 == 0 else None
+
+    def finish(self):
+        return f"{self.frames} frames"
+
+
+def synthesize(path: str, bursts: int = 3, seed: int = 0) -> None:
+    rng = random.Random(seed)
+    rate = speech.SAMPLE_RATE
+    samples = []
+    for _ in range(bursts):
+        samples += [int(rng.gauss(0, 60)) for _ in range(rate)]  # 1s of room noise
+        samples += [int(6000 * math.sin(2 * math.pi * 220 * n / rate) + rng.gauss(0, 60)) for n in range(rate)]
+    samples += [int(rng.gauss(0, 60)) for _ in range(rate)]
+    with wave.open(path, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        wav.writeframes(b"".join(max(-32768, min(32767, s)).to_bytes(2, "little", signed=True) for s in samples))
+
+
+def transcribe(path: str, transcriber, realtime: bool) -> list:
+    source = speech.WavFileSource(path, realtime=realtime)
+    utterances = []
+    while True:
+        partials = []
+        utterance = transcriber.listen(source, on_partial=partials.append)
+        if utterance is None:
+            return utterances
+        utterances.append(utterance)
+        print(f"  {utterance.duration:5.2f}s speech  latency {utterance.latency * 1000:6.0f} ms  "
+              f"{len(partials):>3} partials  {utterance.text!r}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("wav", nargs="*", help="16-bit mono recordings to transcribe")
+    parser.add_argument("--backend", help="Recognition backend (default: as configured)")
+    parser.add_argument("--budget-ms", type=float, default=1000.0, help="Slowest acceptable end-of-speech latency")
+    parser.add_argument("--fast", action="store_true", help="Feed audio as fast as possible instead of in real time")
+    args = parser.parse_args()
+    failures = 0
+
+    if not args.wav:
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "bursts.wav")
+            synthesize(path)
+            print(f"Synthetic recording, {FrameCounter.name}:")
+            utterances = transcribe(path, speech.Transcriber(FrameCounter()), realtime=not args.fast)
+        if len(utterances) != 3:
+            print(f"FAIL: expected 3 utterances, detected {len(utterances)}")
+            failures += 1
+        return 1 if failures else 0
+
+    try:
+        recognizer = speech.create_recognizer(args.backend)
+    except speech.SpeechError as e:
+        print(f"Error: {e}")
+        return 1
+    for path in args.wav:
+        print(f"{path}, {recognizer.name}:")
+        # One transcriber per file: each recording calibrates to its own noise floor
+        utterances = transcribe(path, speech.Transcriber(recognizer), realtime=not args.fast)
+        slow = [u for u in utterances if u.latency * 1000 > args.budget_ms]
+        if not utterances or slow:
+            print(f"FAIL: {len(utterances)} utterances, {len(slow)} over the latency budget")
+            failures += 1
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
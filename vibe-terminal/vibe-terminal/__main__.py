@@ -1,7 +1,7 @@
-from .cli import app
+from .cli import run
 
 def entry_point():
-    app()
+    run()
 
 if __name__ == "__main__":
     entry_point()
\ No newline at end of file
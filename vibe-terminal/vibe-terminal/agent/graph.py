@@ -8,6 +8,8 @@ from .nodes import (
 )
 from rich.console import Console
 
+from ..tracing import traced
+
 console = Console()
 
 def should_execute_commands(state: AgentState) -> str:
@@ -19,11 +21,15 @@ def should_execute_commands(state: AgentState) -> str:
 def create_agent_graph() -> StateGraph:
     graph = StateGraph(AgentState)
 
-    # Define the nodes
-    graph.add_node("generate_response", generate_initial_response)
-    graph.add_node("parse_commands", parse_commands)
-    graph.add_node("execute_commands", execute_parsed_commands)
-    graph.add_node("format_output", format_final_output)
+    # Define the nodes; each records a span when tracing is on
+    nodes = {
+        "generate_response": generate_initial_response,
+        "parse_commands": parse_commands,
+        "execute_commands": execute_parsed_commands,
+        "format_output": format_final_output,
+    }
+    for name, node in nodes.items():
+        graph.add_node(name, traced(f"node.{name}", "graph")(node))
 
     # Set the entry point
     graph.set_entry_point("generate_response")
@@ -1,17 +1,35 @@
 import re
 import os
-from typing import List, Dict, TypedDict, Annotated, Union
+import sqlite3
+import sys
+import time
+from typing import Callable, List, Dict, TypedDict, Annotated, Union
 from rich.console import Console
 from rich.prompt import Confirm
 from rich.syntax import Syntax
 import subprocess
+from functools import partial
 
 from ..llm.llm import LLM
 from ..utils import print_code, is_command_safe, get_current_context, print_colored
 from .tools import execute_shell_command
 from ..command_translator import CommandTranslator
 from ..os_detection import OSDetector
-from .prompt_loader import get_system_prompt
+from .prompt_loader import get_system_prompt, get_capabilities_prompt
+from ..command_effects import analyze_command
+from .scheduler import execute_scheduled, plan_stages
+from ..executor import run_streaming, cancel_running
+from ..execution_policy import AUTO_BACKGROUND_TIMEOUT, ExecutionPolicy, get_policy
+from ..shell_session import ShellSession, get_session
+from ..heredoc import execute_script, parse_file_writes
+from ..fences import split_command_blocks
+from ..result_cache import ResultCache, cache_enabled, get_cache
+from ..safety import analyze_safety
+from ..speculation import SpeculativeExecutor, speculation_enabled
+from ..jobs import AUTO_DETACH, is_long_running, is_marked_background, start_job
+from ..undo_journal import UndoJournal, undo_enabled
+from ..tracing import span
+from ..metrics import COMMAND_DURATION, COMMAND_RESULTS, REPLAYED_RESULTS
 
 console = Console()
 
@@ -25,8 +43,18 @@ class AgentState(TypedDict):
     command_execution_results: List[Dict]  # List of results from execute_shell_command
     is_agent_mode: bool
     verbose: bool
+    serial: bool  # Run extracted commands one at a time instead of in dependency order
+    spool_output: bool  # Keep the full output of each command in a temp file
+    timeout: Union[float, None]  # Per-command wall-clock limit, overriding the agent policy
+    cache_results: bool  # Reuse earlier results of read-only commands while their inputs are unchanged
+    speculate: bool  # Run likely read-only commands while the LLM is answering
+    speculation: Union[SpeculativeExecutor, None]  # Started by generate_initial_response
+    foreground: bool  # Never detach commands into background jobs
+    auto_background: bool  # Also detach a final command detected as long-running
+    on_response_text: Union[Callable[[str], None], None]  # Receives the response as it streams in
     final_output: str
     chat_history: List  # For conversational follow-up
+    llm: Union[LLM, None]  # Client reused across the queries of a voice session
 
 
 # --- System Prompts ---
@@ -109,15 +137,16 @@ def get_llm_instance(state: AgentState) -> LLM:
     """Get or create an LLM instance."""
     try:
         # Check if we already have an instance
-        if "llm" in state:
+        if state.get("llm") is not None:
             return state["llm"]
         
         # Create a new instance
-        llm = LLM(
-            model=state.get("model", "llama-3.3-70b-versatile"),
-            temperature=state.get("temperature", 0.7),
-            max_tokens=state.get("max_tokens", 1000)
-        )
+        with span("llm.init", "llm"):
+            llm = LLM(
+                model=state.get("model", "llama-3.3-70b-versatile"),
+                temperature=state.get("temperature", 0.7),
+                max_tokens=state.get("max_tokens", 1000)
+            )
         
         # Store the instance in the state
         state["llm"] = llm
@@ -167,6 +196,11 @@ def generate_initial_response(state: AgentState) -> AgentState:
             context=context_str,
             file_context_prompt=file_context_prompt_str
         )
+
+        # Steer generated commands towards the faster tools that are installed
+        capabilities_prompt = get_capabilities_prompt()
+        if capabilities_prompt:
+            prompt += f"\n{capabilities_prompt}\n"
         
         # Add specific instructions for file creation
         if "create" in query.lower() or "make" in query.lower():
@@ -200,7 +234,19 @@ DO NOT add any content that wasn't specifically requested by the user.
             file_context_prompt=file_context_prompt_str
         )
 
-    response = llm.invoke_chat(prompt, query, chat_history=state.get("chat_history", []))
+    # Prefetch likely read-only commands while the model is thinking
+    speculation = None
+    if state["is_agent_mode"] and speculation_enabled(state.get("speculate", False)):
+        speculation = SpeculativeExecutor()
+        started = speculation.start()
+        if state.get("verbose") and started:
+            console.print(f"[dim]Speculatively running: {', '.join(started)}[/dim]")
+
+    if state.get("on_response_text"):
+        response = llm.stream_chat(prompt, query, chat_history=state.get("chat_history", []),
+                                   on_text=state["on_response_text"])
+    else:
+        response = llm.invoke_chat(prompt, query, chat_history=state.get("chat_history", []))
 
     # Validate the response for file creation
     if "create" in query.lower() or "make" in query.lower():
@@ -214,7 +260,7 @@ DO NOT add any content that wasn't specifically requested by the user.
             prompt += "\n\nIMPORTANT: Use the EXACT filename specified by the user, not 'new_file.txt' or 'dependency_links.txt'."
             response = llm.invoke_chat(prompt, query, chat_history=state.get("chat_history", []))
 
-    return {**state, "llm_response_raw": response or ""}
+    return {**state, "llm_response_raw": response or "", "speculation": speculation}
 
 
 def validate_file_creation_command(command: str) -> bool:
@@ -228,61 +274,34 @@ def validate_file_creation_command(command: str) -> bool:
             console.print("[yellow]Command is empty[/yellow]")
             return False
             
-        # Check for basic heredoc syntax
-        if 'cat >' not in command:
-            console.print("[yellow]Missing 'cat >' in command[/yellow]")
-            return False
-        if '<<' not in command:
-            console.print("[yellow]Missing '<<' in command[/yellow]")
-            return False
-        if 'EOF' not in command:
-            console.print("[yellow]Missing 'EOF' in command[/yellow]")
+        # Check for a heredoc file write
+        writes = parse_file_writes(command)
+        if not writes:
+            console.print("[yellow]No 'cat > file << EOF' heredoc in command[/yellow]")
             return False
+        write = writes[0]
             
-        # Extract filename
-        try:
-            filename = command.split('cat >')[1].split('<<')[0].strip()
-            console.print(f"[dim]Extracted filename: {filename}[/dim]")
-            
-            # Check for placeholder filenames
-            if '{' in filename or '}' in filename:
-                console.print("[yellow]Filename contains placeholder characters[/yellow]")
-                return False
-                
-            # Check for valid file extension
-            if not filename.endswith('.py'):
-                console.print("[yellow]Filename does not end with .py[/yellow]")
-                return False
-        except Exception as e:
-            console.print(f"[yellow]Error extracting filename: {str(e)}[/yellow]")
+        # Check the filename
+        filename = write.path
+        console.print(f"[dim]Extracted filename: {filename}[/dim]")
+        
+        # Check for placeholder filenames
+        if '{' in filename or '}' in filename:
+            console.print("[yellow]Filename contains placeholder characters[/yellow]")
             return False
             
-        # Extract content
-        try:
-            lines = command.strip().split('\n')
-            content_lines = []
-            in_heredoc = False
-            
-            for line in lines:
-                if line.strip() == 'EOF':
-                    in_heredoc = False
-                    continue
-                elif line.strip().endswith("<< 'EOF'"):
-                    in_heredoc = True
-                    continue
-                elif in_heredoc:
-                    content_lines.append(line)
-                    
-            content = '\n'.join(content_lines).strip()
-            console.print(f"[dim]Extracted content:\n{content}[/dim]")
+        # Check for valid file extension
+        if not filename.endswith('.py'):
+            console.print("[yellow]Filename does not end with .py[/yellow]")
+            return False
             
-            # Check for print statement
-            if 'print(' not in content and 'print ' not in content:
-                console.print("[yellow]Content does not contain a print statement[/yellow]")
-                return False
-                
-        except Exception as e:
-            console.print(f"[yellow]Error extracting content: {str(e)}[/yellow]")
+        # Check the content
+        content = write.content.strip()
+        console.print(f"[dim]Extracted content:\n{content}[/dim]")
+        
+        # Check for print statement
+        if 'print(' not in content and 'print ' not in content:
+            console.print("[yellow]Content does not contain a print statement[/yellow]")
             return False
             
         console.print("[green]Command validation successful[/green]")
@@ -296,6 +315,13 @@ def validate_file_creation_command(command: str) -> bool:
         return False
 
 
+def report_incomplete_blocks(blocks: List[str]) -> None:
+    """Show command blocks the response ended inside; they are never run."""
+    for block in blocks:
+        console.print("[yellow]Not running an incomplete command block (the response ended inside it):[/yellow]")
+        console.print(f"[dim]{block}[/dim]")
+
+
 def parse_commands(state: AgentState) -> AgentState:
     """Parse commands from the LLM response and update the state."""
     try:
@@ -311,15 +337,15 @@ def parse_commands(state: AgentState) -> AgentState:
         # Extract commands from the response
         commands = []
         try:
-            # Look for command blocks
-            import re
-            command_blocks = re.findall(r'```(?:bash)?\s*(.*?)\s*```', response, re.DOTALL)
+            # Look for shell/PowerShell command blocks; other languages are not run
+            command_blocks, incomplete = split_command_blocks(response)
+            report_incomplete_blocks(incomplete)
             
             if command_blocks:
                 for block in command_blocks:
                     # Treat the entire block as a single command
-                    commands.append(block.strip())
-                    console.print(f"[dim]Found command block: {block.strip()}[/dim]")
+                    commands.append(block)
+                    console.print(f"[dim]Found command block: {block}[/dim]")
             else:
                 console.print("[yellow]No command blocks found in response[/yellow]")
                 
@@ -344,6 +370,185 @@ def parse_commands(state: AgentState) -> AgentState:
         return state
 
 
+def run_extracted_command(command: str, spool: bool = False, policy: ExecutionPolicy = None,
+                          session: ShellSession = None, cwd: str = None, cache: ResultCache = None,
+                          verbose: bool = False, speculation: SpeculativeExecutor = None,
+                          journal: UndoJournal = None) -> Dict:
+    """Run a single extracted command and return its result.
+
+    Output is streamed to the terminal as it is produced; only a bounded
+    head/tail excerpt is kept in the result. A command that exceeds the
+    policy's limits is killed and reported as failed. With a session the
+    command runs in the persistent shell, otherwise in a fresh process in cwd.
+    Heredoc file writes never spawn a shell; they are written atomically.
+    With a result cache, a still-valid earlier result of a read-only command
+    is replayed instead of running it again; likewise the result of a
+    speculative run started while the LLM was answering. With an undo
+    journal, the files a command is about to change are snapshotted first
+    so that --undo can restore them.
+    """
+    policy = policy or get_policy("agent")
+    started = time.perf_counter()
+    try:
+        run_cwd = session.cwd if session is not None else (cwd or os.getcwd())
+        result = None
+        runner = "session" if session is not None else "subprocess"
+        # A session whose environment was changed could give a different answer
+        if speculation is not None and not (session is not None and session.state_changed):
+            result = speculation.take(command, run_cwd)
+            REPLAYED_RESULTS.labels("speculation", "miss" if result is None else "hit").inc()
+            if result is not None:
+                runner = "speculative"
+            if result is not None and verbose:
+                console.print(f"[dim]Using speculative result: {command}[/dim]")
+        if result is None and cache is not None:
+            result = cache.get(command, run_cwd)
+            REPLAYED_RESULTS.labels("cache", "miss" if result is None else "hit").inc()
+            if result is not None:
+                runner = "cache"
+            if result is not None and verbose:
+                age = time.time() - result["cached_at"]
+                console.print(f"[dim]Result cache hit ({age:.0f}s old): {command}[/dim]")
+        # Replayed results come from read-only commands, which need no snapshot
+        snapshot_id = None
+        if result is None and journal is not None:
+            snapshot_id = take_snapshot(journal, command, run_cwd, verbose)
+        if result is not None:
+            sys.stdout.write(result["stdout"])
+            sys.stderr.write(result["stderr"])
+            sys.stdout.flush()
+        # Execute the command; heredoc file writes are performed in-process, in order
+        elif session is not None:
+            result = execute_script(
+                command,
+                lambda script: session.run(script, spool=spool, timeout=policy.timeout),
+                cwd=lambda: session.cwd
+            )
+            if result.get("session_exited"):
+                console.print("[yellow]The command ended the shell session (exit or set -e); "
+                              "the next command starts a new shell without the earlier cd/export state[/yellow]")
+        else:
+            result = execute_script(
+                command,
+                lambda script: run_streaming(script, cwd=cwd, spool=spool, policy=policy),
+                cwd=lambda: cwd or os.getcwd()
+            )
+        if cache is not None and not result.get("cached"):
+            cache.observe(command, run_cwd, result)
+        if speculation is not None and not result.get("speculative") and not analyze_safety(command, run_cwd).read_only:
+            speculation.invalidate()
+        for message in result["write_errors"]:
+            console.print(f"[red]Error writing file: {message}[/red]")
+        if result["timed_out"]:
+            console.print(f"[yellow]Command timed out after {result['duration']:.1f}s and was stopped: {command}[/yellow]")
+        elif result["cancelled"]:
+            console.print(f"[yellow]Command cancelled: {command}[/yellow]")
+        record_command_metrics(result, runner, time.perf_counter() - started)
+        
+        return {
+            "command": command,
+            "success": result["return_code"] == 0,
+            "output": result["stdout"],
+            "error": result["stderr"],
+            "return_code": result["return_code"],
+            "output_bytes": result["stdout_bytes"] + result["stderr_bytes"],
+            "truncated": result["truncated"],
+            "spool_paths": result["spool_paths"],
+            "duration": result["duration"],
+            "timed_out": result["timed_out"],
+            "cancelled": result["cancelled"],
+            "limits": result["limits"],
+            "files_written": result["files_written"],
+            "cached": result.get("cached", False),
+            "speculative": result.get("speculative", False),
+            "snapshot_id": snapshot_id
+        }
+        
+    except Exception as e:
+        console.print(f"[red]Error executing command: {str(e)}[/red]")
+        COMMAND_RESULTS.labels("error").inc()
+        return {
+            "command": command,
+            "success": False,
+            "error": str(e),
+            "return_code": -1
+        }
+
+
+def record_command_metrics(result: Dict, runner: str, duration: float) -> None:
+    """Observe how long a command took by where it ran and count it by exit code.
+
+    The duration is the wall time of this run, so a replayed result counts
+    the replay rather than the original run.
+    """
+    COMMAND_DURATION.labels(runner).observe(duration)
+    if result["timed_out"]:
+        exit_code = "timeout"
+    elif result["cancelled"]:
+        exit_code = "cancelled"
+    else:
+        exit_code = str(result["return_code"])
+    COMMAND_RESULTS.labels(exit_code).inc()
+
+
+def take_snapshot(journal: UndoJournal, command: str, cwd: str, verbose: bool = False) -> Union[int, None]:
+    """Snapshot the files a command is about to change; returns the snapshot id, if one was taken.
+
+    A snapshot that fails never stops the command from running.
+    """
+    try:
+        snapshot_id = journal.snapshot(command, cwd)
+    except (OSError, sqlite3.Error) as e:
+        console.print(f"[yellow]Could not snapshot files for undo: {str(e)}[/yellow]")
+        return None
+    if snapshot_id is not None and verbose:
+        console.print(f"[dim]Undo snapshot {snapshot_id}: {command}[/dim]")
+    return snapshot_id
+
+
+def run_background_command(command: str, cwd: str = None, journal: UndoJournal = None) -> Dict:
+    """Start a command as a background job and return a result that points at its output.
+
+    The job keeps running after VibeTerminal exits; `VibeTerminal jobs`
+    shows its status and `VibeTerminal jobs tail N` its output.
+    """
+    snapshot_id = take_snapshot(journal, command, cwd or os.getcwd()) if journal is not None else None
+    try:
+        job = start_job(command, cwd)
+    except OSError as e:
+        console.print(f"[red]Error starting background job: {str(e)}[/red]")
+        return {"command": command, "success": False, "error": str(e), "return_code": -1}
+    reason = "marked # background" if is_marked_background(command) else "detected as long-running"
+    console.print(f"[bold cyan]Detached into background job {job['id']} ({reason}); it keeps running after "
+                  f"VibeTerminal exits. Follow it with: VibeTerminal jobs tail {job['id']} -f[/bold cyan]")
+    console.print(f"[dim]{command}[/dim]")
+    return {
+        "command": command,
+        "success": True,
+        "output": f"Detached into background job {job['id']} ({reason}); it has not finished yet",
+        "error": "",
+        "return_code": None,
+        "job_id": job["id"],
+        "spool_paths": {"stdout": job["stdout_path"], "stderr": job["stderr_path"]},
+        "files_written": [],
+        "snapshot_id": snapshot_id
+    }
+
+
+def select_background_commands(commands: List[str], auto: bool = AUTO_DETACH) -> List[str]:
+    """Pick the commands to detach into background jobs.
+
+    Commands the model marked with a `# background` first line always
+    qualify. With auto (--background or VIBETERMINAL_AUTO_BACKGROUND=1), a
+    command detected as long-running does too if it is the last one, so
+    that no later command depends on its unfinished work.
+    """
+    selected = [command for command in commands if is_marked_background(command)]
+    if auto and commands and commands[-1] not in selected and is_long_running(commands[-1]):
+        selected.append(commands[-1])
+    return selected
+
+
 def execute_parsed_commands(state: AgentState) -> AgentState:
     """Execute the parsed commands and update the state with the results."""
     try:
@@ -366,36 +571,65 @@ EOF"""
                     commands = [default_command]
                     state["extracted_commands"] = commands
         
-        # Execute each command
-        results = []
-        for command in commands:
-            try:
-                # Execute the command
-                result = subprocess.run(
-                    command,
-                    shell=True,
-                    capture_output=True,
-                    text=True,
-                    check=False
-                )
-                
-                # Store the result
-                results.append({
-                    "command": command,
-                    "success": result.returncode == 0,
-                    "output": result.stdout,
-                    "error": result.stderr,
-                    "return_code": result.returncode
-                })
-                
-            except Exception as e:
-                console.print(f"[red]Error executing command: {str(e)}[/red]")
-                results.append({
-                    "command": command,
-                    "success": False,
-                    "error": str(e),
-                    "return_code": -1
-                })
+        # Commands run in the persistent shell session, except that independent
+        # commands sharing a stage run concurrently as fresh processes in its cwd
+        auto = state.get("auto_background", False) or AUTO_DETACH
+        policy = get_policy("agent", timeout=state.get("timeout"))
+        # VIBETERMINAL_AGENT_TIMEOUT=0 still means no limit
+        if auto and policy.timeout is None and "VIBETERMINAL_AGENT_TIMEOUT" not in os.environ:
+            policy = policy._replace(timeout=AUTO_BACKGROUND_TIMEOUT)
+        spool = state.get("spool_output", False)
+        session = get_session(policy=policy) if ShellSession.is_supported() else None
+        cwd = session.cwd if session else None
+        serial = state.get("serial", False)
+        if session is not None:
+            changes_shell = any(analyze_command(command, cwd).shell_state for command in commands)
+            # Fresh processes would not see the session's cd/export state
+            serial = serial or changes_shell or session.state_changed
+            session.state_changed = session.state_changed or changes_shell
+        if state.get("verbose") and not serial and len(commands) > 1:
+            stages = plan_stages(commands, cwd)
+            console.print(f"[dim]Execution plan: {len(commands)} commands in {len(stages)} stage(s)[/dim]")
+        cache = get_cache() if cache_enabled(state.get("cache_results", False)) else None
+        verbose = state.get("verbose", False)
+        speculation = state.get("speculation")
+        journal = UndoJournal() if undo_enabled() else None
+        options = {"spool": spool, "policy": policy, "cache": cache, "verbose": verbose, "speculation": speculation,
+                   "journal": journal}
+        run_command = partial(run_extracted_command, session=session, **options)
+        run_parallel = partial(run_extracted_command, cwd=cwd, **options)
+        background = [] if state.get("foreground", False) else select_background_commands(commands, auto)
+        if background:
+            def detach(run):
+                def run_or_detach(command: str) -> Dict:
+                    if command not in background:
+                        return run(command)
+                    # The job may write anywhere, at any time from now on
+                    if cache is not None:
+                        cache.invalidate()
+                    if speculation is not None:
+                        speculation.invalidate()
+                    return run_background_command(command, session.cwd if session else cwd, journal)
+                return run_or_detach
+            run_command, run_parallel = detach(run_command), detach(run_parallel)
+        try:
+            results = execute_scheduled(
+                commands,
+                run_command,
+                serial=serial,
+                cwd=cwd,
+                on_interrupt=cancel_running,
+                run_parallel=run_parallel
+            )
+        finally:
+            if speculation is not None:
+                speculation.finish()
+            if journal is not None:
+                journal.close()
+        if cache is not None and verbose:
+            console.print(f"[dim]Result cache: {cache.hits} hit(s), {cache.misses} miss(es)[/dim]")
+        if speculation is not None and verbose:
+            console.print(f"[dim]Speculation: {speculation.used} used, {speculation.wasted} wasted[/dim]")
         
         # Update the state with the results
         state["command_execution_results"] = results
@@ -421,6 +655,10 @@ EOF"""
 def format_final_output(state: AgentState) -> AgentState:
     """Format the final output for display and store it in state['final_output']."""
     try:
+        # Speculative runs that no command asked for are wasted
+        if state.get("speculation") is not None:
+            state["speculation"].finish()
+
         # If not in agent mode, just return the raw LLM response
         if not state.get("is_agent_mode", False):
             state["final_output"] = state.get("llm_response_raw", "No response generated")
@@ -525,16 +763,14 @@ EOF"""
         console.print("[dim]Parsing commands from response...[/dim]")
         commands = []
         try:
-            # Look for command blocks
-            import re
-            command_blocks = re.findall(r'```(?:bash|powershell)?\s*(.*?)\s*```', response_content, re.DOTALL)
+            # Look for command blocks; each block is kept whole so heredocs stay intact
+            command_blocks, incomplete = split_command_blocks(response_content)
+            report_incomplete_blocks(incomplete)
             
             if command_blocks:
                 for block in command_blocks:
-                    # Split the block into individual commands
-                    block_commands = [cmd.strip() for cmd in block.split('\n') if cmd.strip()]
-                    commands.extend(block_commands)
-                    console.print(f"[dim]Found command block with {len(block_commands)} commands[/dim]")
+                    commands.append(block)
+                    console.print(f"[dim]Found command block with {len(block.splitlines())} lines[/dim]")
             else:
                 console.print("[yellow]No command blocks found in response[/yellow]")
                 
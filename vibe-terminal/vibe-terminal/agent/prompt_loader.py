@@ -1,19 +1,21 @@
 import os
-import platform
 from pathlib import Path
 from typing import Optional
 
+from ..capabilities import format_capabilities_prompt
+from ..os_detection import OSDetector
+
 def get_os_type() -> str:
     """Determine the operating system type."""
-    system = platform.system().lower()
-    if system == "darwin":
-        return "macos"
-    elif system == "linux":
-        return "linux"
-    elif system == "windows":
-        return "windows"
-    else:
-        return "unknown"
+    return OSDetector.get_os_info()[0]
+
+def get_capabilities_prompt() -> str:
+    """Describe the fast tools installed on this machine, or return "" if probing fails."""
+    try:
+        return format_capabilities_prompt()
+    except Exception as e:
+        print(f"Warning: Could not probe shell capabilities: {str(e)}")
+        return ""
 
 def load_os_prompt() -> Optional[str]:
     """Load the appropriate system prompt based on the OS."""
@@ -63,5 +65,10 @@ ls -la
 If you need to explain something or ask for clarification, do so outside of the backtick blocks.
 Do not add any conversational fluff before or after the command blocks if commands are the primary output.
 Just provide the commands."""
+
+    # Steer the model towards the faster tools that are actually installed
+    capabilities_prompt = get_capabilities_prompt()
+    if capabilities_prompt:
+        prompt = f"{prompt}\n\n{capabilities_prompt}"
     
     return prompt 
\ No newline at end of file
@@ -0,0 +1,99 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Set
+
+from ..command_effects import CommandEffects, analyze_command
+
+# Upper bound on commands run at the same time; most generated commands wait on I/O
+DEFAULT_MAX_WORKERS = int(os.environ.get("VIBETERMINAL_MAX_PARALLEL", 4))
+
+
+def _overlaps(first: Set[str], second: Set[str]) -> bool:
+    """True if any path in one set equals or contains a path in the other."""
+    for a in first:
+        for b in second:
+            if a == b or b.startswith(a.rstrip(os.sep) + os.sep) or a.startswith(b.rstrip(os.sep) + os.sep):
+                return True
+    return False
+
+
+def build_dependencies(effects: List[CommandEffects]) -> List[Set[int]]:
+    """For each command, the indexes of earlier commands it must wait for."""
+    dependencies: List[Set[int]] = []
+    for j, later in enumerate(effects):
+        deps = set()
+        for i in range(j):
+            earlier = effects[i]
+            if (earlier.barrier or later.barrier
+                    or _overlaps(earlier.writes, later.reads | later.writes)
+                    or _overlaps(later.writes, earlier.reads)):
+                deps.add(i)
+        dependencies.append(deps)
+    return dependencies
+
+
+def plan_stages(commands: List[str], cwd: Optional[str] = None) -> List[List[int]]:
+    """Group command indexes into stages; commands within a stage are independent.
+
+    Stages run one after another, so every command runs after all of its
+    dependencies while keeping its position relative to them.
+    """
+    effects = [analyze_command(command, cwd) for command in commands]
+    dependencies = build_dependencies(effects)
+    levels: List[int] = []
+    for deps in dependencies:
+        levels.append(1 + max((levels[i] for i in deps), default=-1))
+
+    stages: List[List[int]] = [[] for _ in range(max(levels, default=-1) + 1)]
+    for index, level in enumerate(levels):
+        stages[level].append(index)
+    return stages
+
+
+def execute_scheduled(
+    commands: List[str],
+    run_command: Callable[[str], Dict],
+    serial: bool = False,
+    max_workers: int = DEFAULT_MAX_WORKERS,
+    cwd: Optional[str] = None,
+    on_interrupt: Optional[Callable[[], None]] = None,
+    run_parallel: Optional[Callable[[str], Dict]] = None
+) -> List[Dict]:
+    """Run commands stage by stage, in parallel within a stage.
+
+    Args:
+        commands: Commands in the order the model produced them
+        run_command: Executes one command and returns its result dict
+        serial: Run every command one at a time, in order
+        max_workers: Bound on concurrently running commands
+        cwd: Directory used to resolve relative paths during analysis
+        on_interrupt: Called when Ctrl-C arrives while a parallel stage is
+            running, to stop the commands running on worker threads
+        run_parallel: Executes a command that shares its stage with others;
+            defaults to run_command
+
+    Returns:
+        One result per command, in the original order
+    """
+    if serial or len(commands) < 2 or max_workers < 2:
+        return [run_command(command) for command in commands]
+
+    run_parallel = run_parallel or run_command
+    results: List[Optional[Dict]] = [None] * len(commands)
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for stage in plan_stages(commands, cwd):
+            if len(stage) == 1:
+                results[stage[0]] = run_command(commands[stage[0]])
+                continue
+            futures = [pool.submit(run_parallel, commands[i]) for i in stage]
+            stage_results = None
+            while stage_results is None:
+                try:
+                    stage_results = [future.result() for future in futures]
+                except KeyboardInterrupt:
+                    # Only the main thread sees Ctrl-C; stop the workers' commands and keep going
+                    if on_interrupt:
+                        on_interrupt()
+            for index, result in zip(stage, stage_results):
+                results[index] = result
+    return results
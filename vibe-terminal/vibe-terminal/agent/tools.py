@@ -1,8 +1,10 @@
-import subprocess
 import os
 from rich.console import Console
 from ..os_detection import OSDetector
 from ..command_translator import CommandTranslator
+from ..executor import run_streaming
+from ..execution_policy import get_policy
+from ..heredoc import execute_script, parse_file_writes
 from typing import Dict, Any
 
 console = Console()
@@ -29,63 +31,28 @@ def execute_shell_command(command: str) -> Dict[str, Any]:
         console.print(f"[bold blue]=== Executing Shell Command ===[/bold blue]")
         console.print(f"[dim]Command: {command}[/dim]")
         
-        # Check if this is a file creation command
-        if 'cat >' in command and '<<' in command and 'EOF' in command:
+        # Heredoc file writes happen in-process; everything else streams through the shell
+        writes = parse_file_writes(command)
+        if writes:
             console.print("[dim]Detected file creation command[/dim]")
-            
-            # Split the command into lines
-            lines = command.strip().split('\n')
-            if len(lines) < 3:
-                raise ValueError("Invalid file creation command format")
-            
-            # Get the file path from the first line
-            file_path = lines[0].split('cat >')[1].split('<<')[0].strip()
-            console.print(f"[dim]File path: {file_path}[/dim]")
-            
-            # Extract content between heredoc markers
-            content_lines = []
-            in_heredoc = False
-            for line in lines[1:]:
-                if line.strip() == 'EOF':
-                    in_heredoc = False
-                    continue
-                elif line.strip().endswith("<< 'EOF'"):
-                    in_heredoc = True
-                    continue
-                elif in_heredoc:
-                    content_lines.append(line)
-            
-            content = '\n'.join(content_lines).strip()
-            console.print(f"[dim]Content to write:\n{content}[/dim]")
-            
-            # Create the file
-            try:
-                with open(file_path, 'w') as f:
-                    f.write(content)
-                console.print(f"[green]File {file_path} created successfully[/green]")
-                return {
-                    "status": "success",
-                    "file_path": file_path,
-                    "content": content
-                }
-            except Exception as e:
-                console.print(f"[bold red]Error creating file: {str(e)}[/bold red]")
-                raise
-        
-        # For other commands, use subprocess
-        console.print("[dim]Executing command with subprocess[/dim]")
-        result = subprocess.run(
-            command,
-            shell=True,
-            capture_output=True,
-            text=True
-        )
+            for write in writes:
+                console.print(f"[dim]File path: {write.path}[/dim]")
+        else:
+            console.print("[dim]Executing command with subprocess[/dim]")
+        result = execute_script(command, lambda script: run_streaming(script, policy=get_policy("tool")))
+        for file_path in result["files_written"]:
+            console.print(f"[green]File {file_path} created successfully[/green]")
         
         return {
-            "status": "success" if result.returncode == 0 else "error",
-            "returncode": result.returncode,
-            "stdout": result.stdout,
-            "stderr": result.stderr
+            "status": "success" if result["return_code"] == 0 else "error",
+            "returncode": result["return_code"],
+            "stdout": result["stdout"],
+            "stderr": result["stderr"],
+            "files_written": result["files_written"],
+            "truncated": result["truncated"],
+            "timed_out": result["timed_out"],
+            "cancelled": result["cancelled"],
+            "limits": result["limits"]
         }
         
     except Exception as e:
@@ -0,0 +1,104 @@
+import hashlib
+import os
+import sqlite3
+import zlib
+from typing import Iterable, Optional, Tuple
+
+# Outputs larger than this are stored as a head/tail excerpt
+MAX_STORED_OUTPUT = int(os.environ.get("VIBETERMINAL_HISTORY_MAX_OUTPUT", 64 * 1024))
+# Share of the excerpt taken from the start of the output; the rest is its end
+HEAD_FRACTION = 0.25
+COMPRESSION_LEVEL = 6
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+    hash TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    data BLOB NOT NULL
+) WITHOUT ROWID;
+"""
+
+
+def excerpt(text: str, limit: int = MAX_STORED_OUTPUT) -> str:
+    """Keep the head and tail of a text longer than limit characters, with a marker in between."""
+    if limit <= 0 or len(text) <= limit:
+        return text
+    head = int(limit * HEAD_FRACTION)
+    tail = limit - head
+    omitted = len(text) - head - tail
+    return f"{text[:head]}\n... [{omitted} characters omitted from history] ...\n{text[-tail:]}"
+
+
+class BlobStore:
+    """Content-addressed, zlib-compressed text blobs in an SQLite table.
+
+    Identical texts, such as the output of repeated `ls -la` runs, are
+    stored once under the SHA-256 of their content. Deleting a row
+    releases the blobs it referenced, which removes the ones no other row
+    names; gc() sweeps every unreferenced blob.
+    """
+
+    def __init__(self, db: sqlite3.Connection, references: Tuple[Tuple[str, str], ...] = ()):
+        """Initialize the store.
+
+        Args:
+            db: Connection holding the blobs table; created if missing
+            references: (table, column) pairs whose values are blob hashes;
+                blobs not named by any of them are garbage
+        """
+        self.db = db
+        self.references = references
+        db.executescript(SCHEMA)
+
+    def put(self, text: str) -> str:
+        """Store a text (capped to an excerpt) and return its hash."""
+        data = excerpt(text).encode("utf-8", errors="surrogateescape")
+        digest = hashlib.sha256(data).hexdigest()
+        self.db.execute(
+            "INSERT OR IGNORE INTO blobs (hash, size, data) VALUES (?, ?, ?)",
+            (digest, len(data), zlib.compress(data, COMPRESSION_LEVEL))
+        )
+        return digest
+
+    def get(self, digest: Optional[str]) -> Optional[str]:
+        """Return the text stored under a hash, or None if there is none."""
+        if not digest:
+            return None
+        row = self.db.execute("SELECT data FROM blobs WHERE hash = ?", (digest,)).fetchone()
+        if row is None:
+            return None
+        return zlib.decompress(row[0]).decode("utf-8", errors="surrogateescape")
+
+    def release(self, digests: Iterable[Optional[str]]) -> int:
+        """Delete the given blobs unless a row still references them; returns how many were deleted.
+
+        Each check is an index lookup, so the cost depends on the number of
+        blobs released rather than on the size of the referencing tables.
+        """
+        unreferenced = "".join(
+            f" AND NOT EXISTS (SELECT 1 FROM {table} WHERE {column} = blobs.hash)" for table, column in self.references
+        )
+        deleted = 0
+        for digest in set(digests) - {None, ""}:
+            deleted += self.db.execute(f"DELETE FROM blobs WHERE hash = ?{unreferenced}", (digest,)).rowcount
+        return deleted
+
+    def clear(self) -> None:
+        """Delete every blob, once nothing references any of them."""
+        self.db.execute("DELETE FROM blobs")
+
+    def gc(self) -> Tuple[int, int]:
+        """Delete unreferenced blobs; returns how many were deleted and their compressed size."""
+        referenced = " UNION ".join(
+            f"SELECT {column} FROM {table} WHERE {column} IS NOT NULL" for table, column in self.references
+        )
+        condition = f"hash NOT IN ({referenced})" if referenced else "1"
+        row = self.db.execute(f"SELECT COUNT(*), COALESCE(SUM(LENGTH(data)), 0) FROM blobs WHERE {condition}").fetchone()
+        if row[0]:
+            self.db.execute(f"DELETE FROM blobs WHERE {condition}")
+        return row[0], row[1]
+
+    def stats(self) -> Tuple[int, int, int]:
+        """Return the number of blobs, their total size and their compressed size."""
+        row = self.db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(LENGTH(data)), 0) FROM blobs").fetchone()
+        return row[0], row[1], row[2]
@@ -0,0 +1,171 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from .config import get_cache_dir
+from .os_detection import OSDetector
+
+# Capability probe results are reused across runs for this long (seconds)
+DEFAULT_TTL_SECONDS = int(os.environ.get("VIBETERMINAL_CAPABILITY_TTL", 24 * 60 * 60))
+CACHE_FILE_NAME = "capabilities.json"
+CACHE_FORMAT_VERSION = 1
+
+# Fast tools worth steering the model towards, keyed by the name used in prompts.
+# Each entry lists the binary names to look for (some distros rename fd to
+# fdfind) and the hint shown to the model when the tool is present.
+FAST_TOOLS: Dict[str, Dict] = {
+    "rg": {
+        "binaries": ["rg"],
+        "label": "ripgrep",
+        "hint": "prefer `{bin} PATTERN [PATH]` over `grep -r`; it respects .gitignore and is much faster on large trees",
+    },
+    "fd": {
+        "binaries": ["fd", "fdfind"],
+        "label": "fd",
+        "hint": "prefer `{bin} PATTERN` / `{bin} -e EXT` over `find . -name`",
+    },
+    "jq": {
+        "binaries": ["jq"],
+        "label": "jq",
+        "hint": "use `{bin}` to query or reshape JSON instead of Python one-liners",
+    },
+    "parallel": {
+        "binaries": ["parallel"],
+        "label": "GNU parallel",
+        "hint": "use `{bin}` instead of `xargs` or shell loops to run independent jobs concurrently",
+    },
+}
+
+_VERSION_PATTERN = re.compile(r"\d+(?:\.\d+)+|\d{8}")
+_capabilities: Optional[Dict] = None
+
+
+class CapabilityProbe:
+    """Detects which fast command-line tools are installed and caches the result on disk."""
+
+    def __init__(self, cache_file: Optional[str] = None, ttl: int = DEFAULT_TTL_SECONDS):
+        """Initialize the probe.
+
+        Args:
+            cache_file: Path of the JSON cache file; defaults to the user cache directory
+            ttl: Seconds a cached probe stays valid
+        """
+        self.cache_file = cache_file or str(get_cache_dir() / CACHE_FILE_NAME)
+        self.ttl = ttl
+        self.os_type, self.shell_type = OSDetector.get_os_info()
+
+    def _environment_key(self) -> str:
+        """Hash of everything that changes which binaries resolve."""
+        raw = "\0".join([self.os_type, self.shell_type, os.environ.get("PATH", "")])
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _probe_tool(binaries: List[str]) -> Optional[Dict[str, str]]:
+        """Locate the first available binary and read its version."""
+        for binary in binaries:
+            path = shutil.which(binary)
+            if not path:
+                continue
+            version = ""
+            try:
+                result = subprocess.run(
+                    [path, "--version"],
+                    capture_output=True,
+                    text=True,
+                    timeout=2
+                )
+                first_line = (result.stdout or result.stderr).strip().splitlines()
+                match = _VERSION_PATTERN.search(first_line[0]) if first_line else None
+                version = match.group(0) if match else ""
+            except (OSError, subprocess.SubprocessError):
+                pass
+            return {"binary": binary, "path": path, "version": version}
+        return None
+
+    def probe(self) -> Dict:
+        """Probe every known tool, bypassing the cache."""
+        with ThreadPoolExecutor(max_workers=len(FAST_TOOLS)) as pool:
+            found = dict(zip(
+                FAST_TOOLS,
+                pool.map(lambda name: self._probe_tool(FAST_TOOLS[name]["binaries"]), FAST_TOOLS)
+            ))
+        return {
+            "version": CACHE_FORMAT_VERSION,
+            "probed_at": time.time(),
+            "environment": self._environment_key(),
+            "os_type": self.os_type,
+            "shell_type": self.shell_type,
+            "tools": {name: info for name, info in found.items() if info},
+        }
+
+    def _load_cached(self) -> Optional[Dict]:
+        """Return the cached probe if it is still fresh and matches this environment."""
+        try:
+            with open(self.cache_file, 'r', encoding='utf-8') as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if cached.get("version") != CACHE_FORMAT_VERSION:
+            return None
+        if cached.get("environment") != self._environment_key():
+            return None
+        if time.time() - cached.get("probed_at", 0) > self.ttl:
+            return None
+        return cached
+
+    def _save(self, capabilities: Dict) -> None:
+        """Persist probe results; failures only cost a re-probe next time."""
+        try:
+            tmp_path = f"{self.cache_file}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(capabilities, f, indent=2)
+            os.replace(tmp_path, self.cache_file)
+        except OSError as e:
+            print(f"Warning: Could not save capability cache: {str(e)}")
+
+    def get(self, refresh: bool = False) -> Dict:
+        """Return cached capabilities, probing again when stale or when refresh is set."""
+        capabilities = None if refresh else self._load_cached()
+        if capabilities is None:
+            capabilities = self.probe()
+            self._save(capabilities)
+        return capabilities
+
+
+def get_shell_capabilities(refresh: bool = False) -> Dict:
+    """Return the shell capabilities for this machine, probed at most once per process."""
+    global _capabilities
+    if _capabilities is None or refresh:
+        _capabilities = CapabilityProbe().get(refresh=refresh)
+    return _capabilities
+
+
+def format_capabilities_prompt(capabilities: Optional[Dict] = None) -> str:
+    """Render the detected tools as a system prompt section, or "" if none were found."""
+    if capabilities is None:
+        capabilities = get_shell_capabilities()
+    tools = capabilities.get("tools", {})
+    if not tools:
+        return ""
+
+    lines = [
+        "AVAILABLE FAST TOOLS:",
+        "",
+        f"The user's shell is {capabilities.get('shell_type', 'unknown')} on {capabilities.get('os_type', 'unknown')}. "
+        "The following tools are installed; prefer them over slower equivalents whenever they fit the task:",
+        "",
+    ]
+    for name, info in tools.items():
+        spec = FAST_TOOLS.get(name)
+        if not spec:
+            continue
+        version = f" {info['version']}" if info.get("version") else ""
+        hint = spec["hint"].format(bin=info["binary"])
+        lines.append(f"- {spec['label']}{version} (`{info['binary']}`): {hint}")
+    return "\n".join(lines)
@@ -2,26 +2,32 @@ import typer
 from typing_extensions import Annotated
 from rich.console import Console
 from rich.panel import Panel
+from rich.markup import escape
 import os
 import sys
-from typing import Optional, Tuple
+from typing import Optional, Tuple, TYPE_CHECKING
 from rich.prompt import Confirm, Prompt
 import tempfile
 import subprocess
+import time
 import warnings
-from dotenv import load_dotenv
+from datetime import datetime
 
-from .agent.graph import create_agent_graph, AgentState
 from .utils import get_current_context, print_colored
-from .config import load_api_key # To ensure API key is checked early
-from .agent.nodes import (
-    generate_initial_response,
-    parse_commands,
-    execute_parsed_commands,
-    format_final_output,
-)
-from .voice_handler import handle_voice_mode, VoiceHandler
 from .command_history import CommandHistory
+from .executor import run_streaming
+from .execution_policy import get_policy
+from .shell_session import ShellSession, get_session
+from .heredoc import execute_script, parse_file_writes
+from .config import get_cache_dir
+from .metrics import PORT_ENV_VAR as METRICS_PORT_ENV_VAR, TEXTFILE_ENV_VAR as METRICS_FILE_ENV_VAR
+from .tracing import FORMATS as TRACE_FORMATS, span, start_tracing, stop_tracing, traced
+
+# The agent graph (langgraph, openai) and the voice stack (speech_recognition,
+# pyttsx3, termios) are imported on the code paths that need them, so that
+# --history, --undo and friends start without paying for them.
+if TYPE_CHECKING:
+    from .agent.graph import AgentState
 
 # Suppress urllib3 warnings
 warnings.filterwarnings('ignore', category=Warning, module='urllib3')
@@ -33,16 +39,8 @@ app = typer.Typer(
 )
 console = Console()
 
-# Load environment variables
-load_dotenv()
-
-# Ensure API key is loaded/checked at module import
-# This is a bit eager, could be moved to on_command_run
-try:
-    _ = load_api_key() 
-except Exception as e:
-    console.print(f"[bold red]Initialization Error: Could not load API key. {e}[/bold red]")
-    # Optionally exit or disable features
+# Messages of a voice conversation sent back to the LLM as context
+MAX_CHAT_HISTORY = 20
 
 def parse_file_path(ctx: typer.Context, param: typer.CallbackParam, value: Optional[str]) -> Optional[str]:
     if not value:
@@ -75,6 +73,198 @@ def parse_file_path(ctx: typer.Context, param: typer.CallbackParam, value: Optio
     
     return value
 
+jobs_app = typer.Typer(
+    name="jobs",
+    help="Manage commands running in the background.",
+    add_completion=False
+)
+
+
+def print_job_notifications() -> None:
+    """Report background jobs that finished since the last time VibeTerminal ran."""
+    from .jobs import JobTable, TABLE_FILE, describe_job
+    if not (get_cache_dir() / "jobs" / TABLE_FILE).exists():
+        return
+    for job in JobTable().pending_notifications():
+        color = "green" if job["status"] == "done" else "yellow"
+        console.print(f"[{color}]{describe_job(job)}[/{color}]")
+
+
+def print_job_reference(result: dict) -> None:
+    """Show where a background job's output is, without reading it."""
+    from .jobs import JobTable
+    job = JobTable().get(result["job_id"])
+    status = job["status"] if job else "removed"
+    console.print(f"[dim]Job:[/dim] {result['job_id']} ({status})")
+    for name, path in (result.get("spool_paths") or {}).items():
+        if path and os.path.exists(path):
+            console.print(f"[dim]{name.capitalize()}:[/dim] {path} ({os.path.getsize(path)} bytes)")
+
+
+def parse_time_filter(value: Optional[str]) -> Optional[float]:
+    """Parse a date ("2024-05-01", "2024-05-01 14:00") or an age ("30m", "2h", "3d", "1w") into Unix time."""
+    if value is None:
+        return None
+    units = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800}
+    value = value.strip()
+    if value[:-1].isdigit() and value[-1:] in units:
+        return time.time() - int(value[:-1]) * units[value[-1]]
+    for pattern in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d"):
+        try:
+            return datetime.strptime(value, pattern).timestamp()
+        except ValueError:
+            continue
+    raise ValueError(f"not a date or age: {value!r}")
+
+
+def print_history_entry(entry: dict, full: bool = False, show_cwd: bool = True,
+                        preview_lines: int = 3) -> None:
+    """Print one history entry; unless full, long commands and output are truncated here."""
+    width = max(console.width - 4, 20)
+
+    def clip(text: str) -> str:
+        lines = text.rstrip("\n").split("\n")
+        if not full and len(lines) > preview_lines:
+            lines = lines[:preview_lines] + [f"... ({len(lines) - preview_lines} more lines)"]
+        if not full:
+            lines = [line if len(line) <= width else line[:width - 3] + "..." for line in lines]
+        return "\n".join("  " + escape(line) for line in lines)
+
+    result = entry.get("result") or {}
+    return_code = result.get("return_code")
+    if return_code == 0:
+        outcome = "[green]ok[/green]"
+    elif return_code is None:
+        outcome = "[dim]-[/dim]"
+    else:
+        outcome = f"[red]exit {return_code}[/red]"
+    where = f"  {escape(entry['cwd'])}" if show_cwd and entry.get("cwd") else ""
+    console.print(f"\n[bold cyan]#{entry['id']}[/bold cyan] [dim]{entry['timestamp']}{where}[/dim]  {outcome}")
+    console.print(clip(entry["command"]))
+    if result.get("job_id"):
+        print_job_reference(result)
+    elif full:
+        for key in ("output", "error"):
+            if result.get(key):
+                console.print(f"[dim]{key.capitalize()}:[/dim]")
+                console.print(clip(result[key]))
+
+
+def restore_snapshot(journal, snapshot_id: int) -> None:
+    """Restore the files a command changed from its undo snapshot."""
+    restored, errors = journal.restore(snapshot_id)
+    for action in restored:
+        console.print(f"[green]{escape(action[0].upper() + action[1:])}[/green]")
+    for error in errors:
+        console.print(f"[yellow]Could not undo: {escape(error)}[/yellow]")
+    if not restored and not errors:
+        console.print("[dim]The command changed no files[/dim]")
+
+
+def undo_file_creation(command: str) -> None:
+    """Remove the files a command without a snapshot created with a heredoc."""
+    writes = [write for write in parse_file_writes(command) if not write.append]
+    if not writes:
+        # For other commands, we can't automatically undo
+        console.print("[yellow]Note: Automatic undo is only supported for file creation commands[/yellow]")
+        return
+    for write in writes:
+        try:
+            # Get absolute path if relative
+            file_path = write.path
+            if not os.path.isabs(file_path):
+                file_path = os.path.join(os.getcwd(), file_path)
+
+            console.print(f"[dim]Attempting to remove file: {file_path}[/dim]")
+
+            if os.path.exists(file_path):
+                os.remove(file_path)
+                console.print(f"[green]Successfully removed file: {file_path}[/green]")
+            else:
+                console.print(f"[yellow]File not found: {file_path}[/yellow]")
+        except Exception as e:
+            console.print(f"[red]Error undoing file creation: {str(e)}[/red]")
+
+
+@jobs_app.callback(invoke_without_command=True)
+def jobs(ctx: typer.Context) -> None:
+    """List background jobs."""
+    if ctx.invoked_subcommand is not None:
+        return
+    from .jobs import JobTable, job_label
+    entries = JobTable().list()
+    if not entries:
+        console.print("[yellow]No background jobs[/yellow]")
+        return
+    colors = {"running": "cyan", "starting": "cyan", "done": "green"}
+    for job in entries:
+        color = colors.get(job["status"], "yellow")
+        exit_code = f" (exit {job['return_code']})" if job["return_code"] is not None else ""
+        console.print(f"[bold cyan]{job['id']:>4}[/bold cyan] [{color}]{job['status']:<9}[/{color}] "
+                      f"[dim]{job['started']}[/dim] {job_label(job['command'])}{exit_code}")
+
+
+@jobs_app.command("tail")
+def jobs_tail(
+    job_id: int = typer.Argument(..., help="Job number"),
+    lines: int = typer.Option(20, "-n", "--lines", help="Number of lines to show"),
+    stderr: bool = typer.Option(False, "--stderr", help="Show the job's stderr instead of stdout"),
+    follow: bool = typer.Option(False, "-f", "--follow", help="Keep printing output until the job finishes")
+) -> None:
+    """Show the last lines of a job's output."""
+    from .jobs import JobTable, tail_lines
+    table = JobTable()
+    job = table.get(job_id)
+    if job is None:
+        console.print(f"[red]No job {job_id}[/red]")
+        raise typer.Exit(1)
+    path = job["stderr_path"] if stderr else job["stdout_path"]
+    for line in tail_lines(path, lines):
+        print(line)
+    if not follow:
+        return
+    try:
+        with open(path, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            while True:
+                chunk = f.read(65536)
+                if chunk:
+                    sys.stdout.buffer.write(chunk)
+                    sys.stdout.flush()
+                    continue
+                job = table.get(job_id)
+                if job is None or job["finished"]:
+                    break
+                time.sleep(0.2)
+    except (OSError, KeyboardInterrupt):
+        pass
+
+
+@jobs_app.command("kill")
+def jobs_kill(job_id: int = typer.Argument(..., help="Job number")) -> None:
+    """Stop a running job and everything it started."""
+    from .jobs import kill_job
+    if kill_job(job_id):
+        console.print(f"[green]Stopped job {job_id}[/green]")
+    else:
+        console.print(f"[yellow]Job {job_id} is not running[/yellow]")
+
+
+@jobs_app.command("clean")
+def jobs_clean() -> None:
+    """Remove finished jobs and their output files."""
+    from .jobs import JobTable
+    console.print(f"[green]Removed {JobTable().remove_finished()} finished job(s)[/green]")
+
+
+def run() -> None:
+    """Run the CLI; `VibeTerminal jobs ...` is dispatched to the job commands."""
+    if sys.argv[1:2] == ["jobs"]:
+        jobs_app(args=sys.argv[2:], prog_name="VibeTerminal jobs")
+    else:
+        app()
+
+
 @app.command()
 def main(
     content: str = typer.Argument(None, help="Content to process"),
@@ -82,178 +272,325 @@ def main(
     use_context: bool = typer.Option(True, "-c", "--context", help="Use context from current directory"),
     verbose: bool = typer.Option(False, "-v", "--verbose", help="Enable verbose output"),
     voice_mode: bool = typer.Option(False, "--voice", help="Enable voice mode"),
+    wake_word: Optional[str] = typer.Option(None, "--wake-word", help="With --voice, only handle utterances starting with this word"),
     undo: bool = typer.Option(False, "--undo", help="Undo the last executed command"),
-    history: bool = typer.Option(False, "--history", help="Show command history")
+    steps: int = typer.Option(1, "--steps", help="With --undo, the number of commands to undo, newest first"),
+    history: bool = typer.Option(False, "--history", help="Show command history"),
+    here: bool = typer.Option(False, "--here", help="With --history, only show commands run in the current directory"),
+    search: Optional[str] = typer.Option(None, "--search", help="With --history, only show commands containing these words"),
+    since: Optional[str] = typer.Option(None, "--since", help="With --history, only show commands since a date or age (2h, 3d)"),
+    until: Optional[str] = typer.Option(None, "--until", help="With --history, only show commands before a date or age"),
+    status: Optional[str] = typer.Option(None, "--status", help="With --history, only show 'ok' or 'failed' commands"),
+    limit: int = typer.Option(20, "--limit", help="With --history, entries per page"),
+    before: Optional[int] = typer.Option(None, "--before", help="With --history, show the page of entries older than this id"),
+    full: bool = typer.Option(False, "--full", help="With --history, show complete commands and output"),
+    serial: bool = typer.Option(False, "--serial", help="Run extracted commands one at a time, in order"),
+    spool_output: bool = typer.Option(False, "--spool-output", help="Keep the full output of each command in a temp file"),
+    timeout: Optional[float] = typer.Option(None, "--timeout", help="Kill each executed command after this many seconds"),
+    cache_results: bool = typer.Option(False, "--cache-results", help="Reuse results of read-only commands while their inputs are unchanged"),
+    speculate: bool = typer.Option(False, "--speculate", help="Run likely read-only commands while the LLM is answering"),
+    foreground: bool = typer.Option(False, "--foreground", help="Never detach commands into background jobs, even marked ones"),
+    background: bool = typer.Option(False, "--background", help="Detach a final long-running command (build, install, download) into a background job"),
+    profile_startup: bool = typer.Option(False, "--profile-startup", help="Print an import-time breakdown of CLI startup"),
+    trace: Optional[str] = typer.Option(None, "--trace", help="Write a timeline of the run to this JSON file (open it in Perfetto)"),
+    trace_format: str = typer.Option("chrome", "--trace-format", help="With --trace, 'chrome' (trace events) or 'otlp' (OTLP/JSON)"),
+    metrics_port: Optional[int] = typer.Option(None, "--metrics-port", envvar=METRICS_PORT_ENV_VAR, help="Serve Prometheus metrics at http://127.0.0.1:PORT/metrics while running"),
+    metrics_file: Optional[str] = typer.Option(None, "--metrics-file", envvar=METRICS_FILE_ENV_VAR, help="Add this run's metrics to a Prometheus textfile-collector file")
 ) -> None:
     """Main entry point for the VibeTerminal CLI."""
+    if profile_startup:
+        from .startup_profile import print_startup_profile
+        print_startup_profile(console)
+        return
+    if trace:
+        if trace_format not in TRACE_FORMATS:
+            console.print(f"[red]Unknown trace format {trace_format!r}; use one of: {', '.join(TRACE_FORMATS)}[/red]")
+            raise typer.Exit(1)
+        start_tracing()
+    if metrics_port:
+        from .metrics import start_http_server
+        try:
+            start_http_server(metrics_port)
+        except OSError as e:
+            console.print(f"[yellow]Could not serve metrics on port {metrics_port}: {str(e)}[/yellow]")
+        else:
+            console.print(f"[dim]Serving metrics at http://127.0.0.1:{metrics_port}/metrics[/dim]")
+
+    voice_handler = None
     try:
+        print_job_notifications()
+
         # Initialize command history
         command_history = CommandHistory()
         
         # Handle history command
         if history:
-            history_entries = command_history.get_history()
-            if history_entries:
-                console.print("[bold blue]Command History:[/bold blue]")
-                for i, entry in enumerate(history_entries, 1):
-                    console.print(f"\n[bold cyan]Entry {i}:[/bold cyan]")
-                    console.print(f"[dim]Command:[/dim] {entry['command']}")
-                    console.print(f"[dim]Timestamp:[/dim] {entry['timestamp']}")
-                    if 'result' in entry:
-                        console.print(f"[dim]Result:[/dim] {entry['result']}")
-            else:
+            try:
+                filters = {
+                    "text": search,
+                    "cwd": os.getcwd() if here else None,
+                    "since": parse_time_filter(since),
+                    "until": parse_time_filter(until),
+                    "success": {"ok": True, "failed": False, None: None}[status],
+                }
+            except (KeyError, ValueError) as e:
+                console.print(f"[red]Invalid history filter: {e}[/red]")
+                return
+            entries = command_history.search(before_id=before, limit=limit, **filters)
+            if not entries:
                 console.print("[yellow]No command history available[/yellow]")
+                return
+            console.print("[bold blue]Command History:[/bold blue]")
+            for entry in entries:
+                print_history_entry(entry, full=full, show_cwd=not here)
+            if len(entries) == limit:
+                console.print(f"\n[dim]Older entries: add --before {entries[-1]['id']}[/dim]")
             return
         
         # Handle undo command
         if undo:
-            last_command = command_history.undo_last_command()
-            if last_command:
+            journal = None
+            for _ in range(max(steps, 1)):
+                # Relative paths in the command resolve against this directory
+                last_command = command_history.undo_last_command(cwd=os.getcwd())
+                if not last_command:
+                    console.print("[yellow]No commands to undo[/yellow]")
+                    break
                 console.print("[bold blue]Undoing last command...[/bold blue]")
                 console.print(f"[dim]Command: {last_command['command']}[/dim]")
-                
-                # Handle file creation undo
-                if 'cat >' in last_command['command'] and '<<' in last_command['command']:
-                    try:
-                        # Extract file path from the command
-                        command_lines = last_command['command'].strip().split('\n')
-                        file_path = command_lines[0].split('cat >')[1].split('<<')[0].strip()
-                        
-                        # Remove quotes if present
-                        file_path = file_path.strip('"\'')
-                        
-                        # Get absolute path if relative
-                        if not os.path.isabs(file_path):
-                            file_path = os.path.join(os.getcwd(), file_path)
-                        
-                        console.print(f"[dim]Attempting to remove file: {file_path}[/dim]")
-                        
-                        if os.path.exists(file_path):
-                            os.remove(file_path)
-                            console.print(f"[green]Successfully removed file: {file_path}[/green]")
-                        else:
-                            console.print(f"[yellow]File not found: {file_path}[/yellow]")
-                    except Exception as e:
-                        console.print(f"[red]Error undoing file creation: {str(e)}[/red]")
+                snapshot_id = (last_command.get("result") or {}).get("snapshot_id")
+                if snapshot_id is not None:
+                    if journal is None:
+                        from .undo_journal import UndoJournal
+                        journal = UndoJournal()
+                    restore_snapshot(journal, snapshot_id)
                 else:
-                    # For other commands, we can't automatically undo
-                    console.print("[yellow]Note: Automatic undo is only supported for file creation commands[/yellow]")
-            else:
-                console.print("[yellow]No commands to undo[/yellow]")
+                    undo_file_creation(last_command["command"])
+            if journal is not None:
+                journal.close()
             return
         
-        # Initialize voice handler if needed
-        voice_handler = None
-        if voice_mode:
-            voice_handler = VoiceHandler()
-            while True:
-                # Get voice command
-                command = handle_voice_mode()
-                if not command:
-                    return
-                
-                # Process the command
-                content = command
-                break
-        
-        # Get current directory context if requested
-        current_context = ""
-        if use_context:
-            current_dir = os.getcwd()
-            console.print(f"[dim]Current directory: {current_dir}[/dim]")
-            
-            # Get directory contents
-            try:
-                dirs = []
-                files = []
-                for item in os.listdir(current_dir):
-                    full_path = os.path.join(current_dir, item)
-                    if os.path.isdir(full_path):
-                        dirs.append(item)
-                    else:
-                        files.append(item)
-                
-                # Format directory contents
-                current_context = f"Current Directory (PWD):\n{current_dir}\nDirectory Contents:\n"
-                if dirs:
-                    current_context += "\nDirectories:\n" + "\n".join(f"- {d}" for d in sorted(dirs))
-                if files:
-                    current_context += "\nFiles:\n" + "\n".join(f"- {f}" for f in sorted(files))
-                
-                console.print("[dim]Context loaded successfully[/dim]")
-            except Exception as e:
-                console.print(f"[yellow]Warning: Could not load directory context: {str(e)}[/yellow]")
-        
-        # Initialize state
-        initial_state = {
-            "original_query": content,
-            "current_context": current_context,
-            "file_content": "",
-            "file_path": "",
-            "llm_response_raw": "",
-            "extracted_commands": [],
-            "command_execution_results": [],
+        options = {
             "is_agent_mode": agent_mode,
             "verbose": verbose,
-            "final_output": "",
-            "commands": []
+            "serial": serial,
+            "spool_output": spool_output,
+            "timeout": timeout,
+            "cache_results": cache_results,
+            "speculate": speculate,
+            "foreground": foreground,
+            "auto_background": background,
         }
-        
-        # Create and run the graph
+
+        # Voice mode is one continuous session; the graph, the LLM client and
+        # the conversation are kept from one utterance to the next
+        if voice_mode:
+            from .voice_handler import VoiceSession
+            session = VoiceSession(wake_word=wake_word)
+            voice_handler = session.handler
+            conversation = {"chat_history": []}
+
+            def answer(text: str) -> None:
+                try:
+                    run_query(text, options, use_context, command_history, voice_handler, conversation)
+                except Exception as e:
+                    error_msg = f"Error during execution: {str(e)}"
+                    console.print(f"[bold red]{error_msg}[/bold red]")
+                    voice_handler.speak_response(error_msg)
+
+            session.run(answer)
+            return
+
         try:
-            graph = create_agent_graph()
-            final_state = graph.invoke(initial_state)
-            
-            # Store command in history if commands were executed
-            if final_state.get("command_execution_results"):
-                for result in final_state["command_execution_results"]:
-                    command_history.add_command(result["command"], result)
-            
-            # Format and display the final output
-            if agent_mode:
-                # Extract file creation information
-                for result in final_state.get("command_execution_results", []):
-                    if 'cat >' in result["command"] and '<<' in result["command"]:
-                        try:
-                            command_lines = result["command"].strip().split('\n')
-                            file_path = command_lines[0].split('cat >')[1].split('<<')[0].strip()
-                            file_path = file_path.strip('"\'')
-                            if not os.path.isabs(file_path):
-                                file_path = os.path.join(os.getcwd(), file_path)
-                            console.print(f"[green]File created successfully: {file_path}[/green]")
-                            if voice_mode:
-                                voice_handler.speak_response(f"File created successfully at {file_path}")
-                        except Exception as e:
-                            console.print(f"[yellow]Command executed, but could not extract file path: {str(e)}[/yellow]")
-                    else:
-                        console.print(f"[green]Command executed successfully[/green]")
-                        if voice_mode:
-                            voice_handler.speak_response("Command executed successfully")
-            else:
-                response = final_state.get("llm_response_raw", "No response generated")
-                console.print("\n[bold green]Response:[/bold green]")
-                console.print(response)
-                if voice_mode:
-                    voice_handler.speak_response(response)
-                
+            run_query(content, options, use_context, command_history)
         except Exception as e:
-            error_msg = f"Error during execution: {str(e)}"
-            console.print(f"[bold red]{error_msg}[/bold red]")
-            if voice_mode:
-                voice_handler.speak_response(error_msg)
+            console.print(f"[bold red]Error during execution: {str(e)}[/bold red]")
             raise typer.Exit(1)
             
     except Exception as e:
         error_msg = f"Error: {str(e)}"
         console.print(f"[bold red]{error_msg}[/bold red]")
-        if voice_mode:
+        if voice_handler:
             voice_handler.speak_response(error_msg)
         raise typer.Exit(1)
+    finally:
+        if voice_handler:
+            voice_handler.close()
+        if trace:
+            write_trace(trace, trace_format)
+        if metrics_file:
+            write_metrics(metrics_file)
+
+
+def write_trace(path: str, trace_format: str) -> None:
+    """Stop tracing and write the recorded spans."""
+    tracer = stop_tracing()
+    if tracer is None:
+        return
+    try:
+        count = tracer.write(path, trace_format)
+    except OSError as e:
+        console.print(f"[red]Could not write trace: {str(e)}[/red]")
+        return
+    hint = "; open it at https://ui.perfetto.dev" if trace_format == "chrome" else ""
+    console.print(f"[dim]Trace with {count} spans written to {path}{hint}[/dim]")
+
+
+def write_metrics(path: str) -> None:
+    """Add this run's metrics to a textfile-collector file."""
+    from .metrics import write_textfile
+    try:
+        write_textfile(path)
+    except OSError as e:
+        console.print(f"[red]Could not write metrics: {str(e)}[/red]")
+
+
+def load_directory_context() -> str:
+    """Describe the current directory and its contents for the LLM prompt."""
+    current_dir = os.getcwd()
+    console.print(f"[dim]Current directory: {current_dir}[/dim]")
+    
+    # Get directory contents
+    try:
+        dirs = []
+        files = []
+        for item in os.listdir(current_dir):
+            full_path = os.path.join(current_dir, item)
+            if os.path.isdir(full_path):
+                dirs.append(item)
+            else:
+                files.append(item)
+        
+        # Format directory contents
+        current_context = f"Current Directory (PWD):\n{current_dir}\nDirectory Contents:\n"
+        if dirs:
+            current_context += "\nDirectories:\n" + "\n".join(f"- {d}" for d in sorted(dirs))
+        if files:
+            current_context += "\nFiles:\n" + "\n".join(f"- {f}" for f in sorted(files))
+        
+        console.print("[dim]Context loaded successfully[/dim]")
+        return current_context
+    except Exception as e:
+        console.print(f"[yellow]Warning: Could not load directory context: {str(e)}[/yellow]")
+        return ""
+
+
+def run_query(content: str, options: dict, use_context: bool, command_history: CommandHistory,
+              voice_handler=None, conversation: Optional[dict] = None) -> dict:
+    """Run one query through the agent graph, record its commands and show (and speak) the result.
+
+    Args:
+        content: The user's query
+        options: Agent state options from the command line (is_agent_mode, verbose, ...)
+        use_context: Include the current directory listing in the prompt
+        command_history: Where executed commands are recorded
+        voice_handler: Speaks the response, if given
+        conversation: State kept between queries of a session: the compiled
+            graph, the LLM client and the chat history; updated in place
+
+    Returns:
+        The final agent state
+    """
+    with span("query", "cli", query=content, agent_mode=options["is_agent_mode"]):
+        return _run_query(content, options, use_context, command_history, voice_handler, conversation)
+
+
+def _run_query(content: str, options: dict, use_context: bool, command_history: CommandHistory,
+               voice_handler, conversation: Optional[dict]) -> dict:
+    with span("import", "cli", module="agent.graph"):
+        from .config import load_api_key
+        from .agent.graph import create_agent_graph
 
-def execute_command(command: str, shell: str) -> Tuple[int, str, str]:
-    """Execute a command in the specified shell."""
+    agent_mode = options["is_agent_mode"]
+    conversation = conversation if conversation is not None else {}
+    with span("context.load", "cli"):
+        # Get current directory context if requested
+        current_context = load_directory_context() if use_context else ""
+    initial_state = {
+        "original_query": content,
+        "current_context": current_context,
+        "file_content": "",
+        "file_path": "",
+        "llm_response_raw": "",
+        "extracted_commands": [],
+        "command_execution_results": [],
+        **options,
+        "speculation": None,
+        # In voice chat, speaking starts with the first sentence of the response
+        "on_response_text": voice_handler.speak_stream if voice_handler and not agent_mode else None,
+        "llm": conversation.get("llm"),
+        "chat_history": list(conversation.get("chat_history", [])),
+        "final_output": "",
+        "commands": []
+    }
+
+    # Create the graph, ensuring the API key is loaded/checked before the first LLM call
+    if conversation.get("graph") is None:
+        try:
+            _ = load_api_key()
+        except Exception as e:
+            console.print(f"[bold red]Initialization Error: Could not load API key. {e}[/bold red]")
+        with span("graph.build", "graph"):
+            conversation["graph"] = create_agent_graph()
+    with span("graph.invoke", "graph"):
+        final_state = conversation["graph"].invoke(initial_state)
+    conversation["llm"] = final_state.get("llm")
+    
+    # Store command in history if commands were executed
+    if final_state.get("command_execution_results"):
+        for result in final_state["command_execution_results"]:
+            command_history.add_command(result["command"], result)
+    
+    # Format and display the final output
+    reply = show_result(final_state, agent_mode, voice_handler)
+
+    if "chat_history" in conversation:
+        history = conversation["chat_history"] + [{"role": "user", "content": content},
+                                                  {"role": "assistant", "content": reply}]
+        conversation["chat_history"] = history[-MAX_CHAT_HISTORY:]
+    return final_state
+
+@traced("render", "cli")
+def show_result(final_state: dict, agent_mode: bool, voice_handler=None) -> str:
+    """Print (and speak) the outcome of a query and return the assistant's reply."""
+    if agent_mode:
+        # Extract file creation information
+        for result in final_state.get("command_execution_results", []):
+            if result.get("files_written"):
+                for file_path in result["files_written"]:
+                    console.print(f"[green]File created successfully: {file_path}[/green]")
+                    if voice_handler:
+                        voice_handler.speak_response(f"File created successfully at {file_path}")
+            else:
+                console.print(f"[green]Command executed successfully[/green]")
+                if voice_handler:
+                    voice_handler.speak_response("Command executed successfully")
+        return final_state.get("final_output", "")
+    reply = final_state.get("llm_response_raw", "No response generated")
+    console.print("\n[bold green]Response:[/bold green]")
+    console.print(reply)
+    if voice_handler:
+        voice_handler.end_speech_stream()
+    return reply
+
+
+def execute_command(command: str, shell: str, echo: bool = True) -> Tuple[int, str, str]:
+    """Execute a command in the specified shell.
+
+    Commands run in this process's persistent session for the shell, so cd
+    and export carry over between calls. Output is forwarded live when echo
+    is set; the returned stdout/stderr are bounded head/tail excerpts.
+    """
     try:
-        # Create a temporary file for the command
+        policy = get_policy("shell")
+        if ShellSession.is_supported():
+            result = get_session(shell, policy).run(command, echo=echo, timeout=policy.timeout)
+            if result["session_exited"]:
+                console.print("[yellow]The command ended the shell session (exit or set -e); "
+                              "the next command starts a new shell without the earlier cd/export state[/yellow]")
+            return result["return_code"], result["stdout"], result["stderr"]
+
+        # Without pseudo-terminals, fall back to a fresh shell per command
         with tempfile.NamedTemporaryFile(mode='w', suffix='.sh', delete=False) as temp_file:
             temp_file.write(f"#!/bin/{shell}\n{command}")
             temp_file_path = temp_file.name
@@ -262,46 +599,16 @@ def execute_command(command: str, shell: str) -> Tuple[int, str, str]:
         os.chmod(temp_file_path, 0o755)
         
         # Execute the temporary file
-        process = subprocess.Popen(
-            [f"/bin/{shell}", temp_file_path],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True
-        )
-        stdout, stderr = process.communicate()
+        result = run_streaming([f"/bin/{shell}", temp_file_path], shell=False, echo=echo, policy=policy)
         
         # Clean up the temporary file
         os.unlink(temp_file_path)
         
-        return process.returncode, stdout, stderr
+        return result["return_code"], result["stdout"], result["stderr"]
     except Exception as e:
         return 1, "", str(e)
 
-def create_file_with_content(file_path: str, content: str) -> bool:
-    """Create a file with the specified content."""
-    try:
-        # Ensure the directory exists
-        os.makedirs(os.path.dirname(os.path.abspath(file_path)), exist_ok=True)
-        
-        # Split the content into lines and remove any EOF markers
-        lines = content.strip().split('\n')
-        cleaned_lines = []
-        for line in lines:
-            if line.strip() != 'EOF':
-                cleaned_lines.append(line)
-        
-        # Join the lines back together
-        cleaned_content = '\n'.join(cleaned_lines).strip()
-        
-        # Write the content to the file
-        with open(file_path, 'w', encoding='utf-8') as f:
-            f.write(cleaned_content)
-        return True
-    except Exception as e:
-        print(f"Error creating file: {str(e)}")
-        return False
-
-def execute_parsed_commands(state: AgentState) -> AgentState:
+def execute_parsed_commands(state: "AgentState") -> "AgentState":
     """Execute the parsed commands and update the state."""
     if not state["extracted_commands"]:
         return state
@@ -331,50 +638,37 @@ def execute_parsed_commands(state: AgentState) -> AgentState:
     return state
 
 def process_command(command: str, shell: str) -> None:
-    """Process a command and execute it."""
-    # Check if it's a file creation command
-    if "cat >" in command and "<< 'EOF'" in command:
-        try:
-            # Extract the file path and content
-            parts = command.split("<< 'EOF'")
-            if len(parts) != 2:
-                print("Invalid command format")
-                return
-            
-            # Get the current working directory
-            cwd = os.getcwd()
-            
-            # Extract and clean the file path
-            file_path = parts[0].replace("cat >", "").strip()
-            # If the path is relative, make it absolute using the current working directory
-            if not os.path.isabs(file_path):
-                file_path = os.path.join(cwd, file_path)
-            
-            content = parts[1].strip()
-            
-            # Create the file with content
-            if create_file_with_content(file_path, content):
-                print(f"Successfully created file: {file_path}")
-            else:
-                print("Failed to create file")
-        except Exception as e:
-            print(f"Error processing command: {str(e)}")
-        return
-    
-    # For other commands, execute them directly
+    """Process a command and execute it.
+
+    Heredoc file writes are performed in-process, relative to the session's
+    working directory; the rest of the command runs in the shell session.
+    """
     try:
-        returncode, stdout, stderr = execute_command(command, shell)
+        def session_cwd() -> str:
+            if ShellSession.is_supported():
+                return get_session(shell, get_policy("shell")).cwd
+            return os.getcwd()
+
+        def run_shell(script: str) -> dict:
+            returncode, stdout, stderr = execute_command(script, shell)
+            return {"return_code": returncode, "stdout": stdout, "stderr": stderr}
+
+        result = execute_script(command, run_shell, cwd=session_cwd)
+        returncode = result["return_code"]
         
-        if returncode == 0:
+        # Output has already been streamed to the terminal
+        for file_path in result["files_written"]:
+            print(f"Successfully created file: {file_path}")
+        for message in result["write_errors"]:
+            print(f"Failed to create file: {message}")
+        if returncode < 0:
+            print(f"Command was stopped by signal {-returncode}")
+        elif returncode == 0:
             print("Command executed successfully")
-            if stdout:
-                print(f"Output: {stdout}")
         else:
             print(f"Command failed with exit code: {returncode}")
-            if stderr:
-                print(f"Error: {stderr}")
     except Exception as e:
         print(f"Error executing command: {str(e)}")
 
 if __name__ == "__main__":
-    app()
\ No newline at end of file
+    run()
\ No newline at end of file
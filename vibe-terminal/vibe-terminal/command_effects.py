@@ -0,0 +1,264 @@
+import os
+import re
+import shlex
+from typing import List, NamedTuple, Optional, Set
+
+from .heredoc import strip_heredoc_bodies
+
+# Builtins that change the state of the shell itself; they order everything around them
+STATE_BUILTINS = {
+    "cd", "pushd", "popd", "export", "unset", "source", ".", "alias", "unalias", "set", "shopt",
+    "ulimit", "umask", "eval", "exec", "trap", "declare", "typeset", "local", "readonly", "hash",
+}
+
+# Commands that only read the paths they are given
+READ_ONLY_PROGRAMS = {
+    "ls", "cat", "head", "tail", "less", "more", "grep", "egrep", "fgrep", "rg", "find", "fd", "fdfind",
+    "wc", "du", "df", "stat", "file", "pwd", "echo", "printf", "tree", "which", "type", "whoami",
+    "date", "uname", "diff", "sort", "uniq", "cut", "jq", "md5sum", "sha256sum", "realpath",
+    "readlink", "basename", "dirname", "true", "false", "test", "[",
+}
+
+# find actions that write, delete or run commands
+FIND_WRITE_ACTIONS = {"-delete", "-fprint", "-fprint0", "-fprintf", "-fls"}
+FIND_EXEC_ACTIONS = {"-exec", "-execdir", "-ok", "-okdir"}
+
+# Commands that modify the paths they are given
+PATH_WRITING_PROGRAMS = {
+    "touch", "mkdir", "rm", "rmdir", "cp", "mv", "ln", "chmod", "chown", "tee", "truncate", "install",
+}
+
+# Read-only git subcommands; any other git invocation is treated as a barrier.
+# branch and remote only read when they list (see git_reads_only).
+READ_ONLY_GIT_SUBCOMMANDS = {"status", "diff", "log", "show", "branch", "remote", "rev-parse", "ls-files", "blame"}
+# git global options that take a value as the next word
+GIT_VALUE_OPTIONS = {"-C", "-c", "--git-dir", "--work-tree", "--namespace", "--exec-path"}
+# git branch options that create, delete, rename or configure branches
+GIT_BRANCH_WRITE_OPTIONS = {
+    "--delete", "--move", "--copy", "--force", "--set-upstream-to", "--unset-upstream", "--edit-description",
+    "--track", "--no-track", "--create-reflog",
+}
+GIT_BRANCH_WRITE_FLAGS = set("dDmMcCfut")
+# git branch options under which positionals are patterns or commits, not new branch names
+GIT_BRANCH_LIST_OPTIONS = {"-l", "--list", "--contains", "--no-contains", "--merged", "--no-merged", "--points-at"}
+
+# Options that make an otherwise read-only program write a file (or set the clock)
+WRITING_OPTIONS = {
+    "tree": {"-o"},
+    "date": {"-s", "--set"},
+    "sort": {"-o", "--output"},
+}
+
+# Read-only programs that scan the working directory when given no paths
+CWD_SCANNING_PROGRAMS = {"ls", "du", "tree", "find", "fd", "fdfind", "rg", "grep", "egrep", "fgrep"}
+
+# Programs whose first positional argument is a pattern, not a path
+PATTERN_FIRST_PROGRAMS = {"grep", "egrep", "fgrep", "rg", "fd", "fdfind", "jq"}
+
+# Wrappers that run the following words as the real command
+COMMAND_WRAPPERS = {"time", "nice", "nohup", "command", "builtin"}
+
+OUTPUT_REDIRECTS = {">", ">>", ">|", "&>", "&>>"}
+INPUT_REDIRECTS = {"<"}
+CONTROL_OPERATORS = {";", "&&", "||", "|", "&", "|&", ";;"}
+IGNORED_PATHS = {"/dev/null", "/dev/stdout", "/dev/stderr", "/dev/tty"}
+
+_ASSIGNMENT_PATTERN = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*=")
+_GLOB_CHARS = set("*?[")
+
+
+# Reasons _simple_command_effects reports a barrier
+BARRIER = "barrier"
+SHELL_STATE = "shell_state"
+
+
+class CommandEffects(NamedTuple):
+    reads: Set[str]
+    writes: Set[str]
+    barrier: bool  # Must run alone, after everything before it and before everything after it
+    shell_state: bool  # Changes the cwd or environment of the shell running it
+
+
+def git_reads_only(args: List[str]) -> bool:
+    """Whether a git invocation (the words after "git") only reads the repository."""
+    i = 0
+    while i < len(args) and args[i].startswith("-"):
+        i += 2 if args[i] in GIT_VALUE_OPTIONS else 1
+    if i >= len(args) or args[i] not in READ_ONLY_GIT_SUBCOMMANDS:
+        return False
+    subcommand, rest = args[i], args[i + 1:]
+    if any(a == "--output" or a.startswith("--output=") for a in rest):
+        return False
+    if subcommand == "remote":
+        return all(a in ("-v", "--verbose") for a in rest)
+    if subcommand == "branch":
+        for a in rest:
+            if a.split("=")[0] in GIT_BRANCH_WRITE_OPTIONS:
+                return False
+            if a.startswith("-") and not a.startswith("--") and GIT_BRANCH_WRITE_FLAGS & set(a[1:]):
+                return False
+        positionals = [a for a in rest if not a.startswith("-")]
+        return not positionals or any(a.split("=")[0] in GIT_BRANCH_LIST_OPTIONS for a in rest)
+    return True
+
+
+def has_writing_option(program: str, args: List[str]) -> bool:
+    """Whether a read-only program is given an option that makes it write."""
+    options = WRITING_OPTIONS.get(program)
+    if not options:
+        return False
+    for a in args:
+        if a.startswith("--"):
+            if a.split("=")[0] in options:
+                return True
+        elif any(a.startswith(o) for o in options if len(o) == 2):
+            # The option alone or with its value attached (-ofile)
+            return True
+    return False
+
+
+def _resolve(path: str, cwd: str) -> Optional[str]:
+    """Normalize a path argument, widening globs to the directory they expand in."""
+    if any(c in path for c in _GLOB_CHARS):
+        path = path[:min(path.index(c) for c in _GLOB_CHARS if c in path)]
+        path = path[:path.rfind("/") + 1] if "/" in path else ""
+    path = os.path.expanduser(path)
+    resolved = os.path.normpath(os.path.join(cwd, path))
+    return None if resolved in IGNORED_PATHS else resolved
+
+
+def _split_simple_commands(tokens: List[str]) -> List[List[str]]:
+    """Split a token stream at control operators."""
+    commands: List[List[str]] = [[]]
+    for token in tokens:
+        if token in CONTROL_OPERATORS:
+            commands.append([])
+        else:
+            commands[-1].append(token)
+    return [c for c in commands if c]
+
+
+def _simple_command_effects(tokens: List[str], cwd: str, reads: Set[str], writes: Set[str]) -> Optional[str]:
+    """Accumulate the paths one simple command touches.
+
+    Returns None, BARRIER, or SHELL_STATE for barriers that change the shell itself.
+    """
+    words: List[str] = []
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        # "2>" is tokenized as "2" followed by ">"
+        if token.isdigit() and i + 1 < len(tokens) and tokens[i + 1] in OUTPUT_REDIRECTS | INPUT_REDIRECTS | {">&", "<&"}:
+            i += 1
+            continue
+        if token in OUTPUT_REDIRECTS or token in INPUT_REDIRECTS:
+            if i + 1 < len(tokens):
+                target = _resolve(tokens[i + 1], cwd)
+                if target:
+                    (writes if token in OUTPUT_REDIRECTS else reads).add(target)
+            i += 2
+            continue
+        if token in {">&", "<&", "<<", "<<<"}:
+            # fd duplication, heredoc delimiter or here-string: no path involved
+            i += 2
+            continue
+        if token in {"{", "}"}:
+            # Groups run in the current shell and can hide cd/export
+            return SHELL_STATE
+        if token in {"(", ")"}:
+            return BARRIER
+        words.append(token)
+        i += 1
+
+    # Leading VAR=value assignments; on their own they mutate the shell environment
+    while words and _ASSIGNMENT_PATTERN.match(words[0]):
+        words.pop(0)
+    if not words:
+        return SHELL_STATE
+    while len(words) > 1 and words[0] in COMMAND_WRAPPERS:
+        words.pop(0)
+
+    program = os.path.basename(words[0])
+    args = words[1:]
+    if program in STATE_BUILTINS:
+        return SHELL_STATE
+    if program == "git":
+        if not git_reads_only(args):
+            return BARRIER
+        # -C runs git in another directory
+        directories = [args[i + 1] for i in range(len(args) - 1) if args[i] == "-C"]
+        reads.add(os.path.normpath(os.path.join(cwd, *directories)))
+        return None
+    if has_writing_option(program, args):
+        # The file it writes is an option value
+        return BARRIER
+    if program == "find" and any(a in FIND_EXEC_ACTIONS for a in args):
+        # The commands it runs may touch anything
+        return BARRIER
+    if program == "sed" and any(a.startswith("-i") or a == "--in-place" for a in args):
+        target = writes
+    elif program == "find" and any(a in FIND_WRITE_ACTIONS for a in args):
+        # -delete removes what it finds; -fprint* write a file named in the expression
+        target = writes
+    elif program in READ_ONLY_PROGRAMS or program == "sed":
+        target = reads
+    elif program in PATH_WRITING_PROGRAMS:
+        target = writes
+    else:
+        # Unknown programs (interpreters, build tools, package managers) may touch anything
+        return BARRIER
+
+    paths = [a for a in args if not a.startswith("-")]
+    if program in PATTERN_FIRST_PROGRAMS or program == "sed":
+        paths = paths[1:]
+    if program in {"echo", "printf"}:
+        paths = []
+    if not paths and program in CWD_SCANNING_PROGRAMS:
+        reads.add(os.path.normpath(cwd))
+    for path in paths:
+        resolved = _resolve(path, cwd)
+        if resolved:
+            target.add(resolved)
+    return None
+
+
+def analyze_command(command: str, cwd: Optional[str] = None) -> CommandEffects:
+    """Statically estimate which paths a command block reads and writes.
+
+    Anything the analysis cannot reason about (state-changing builtins,
+    unknown programs, substitutions, subshells) is reported as a barrier.
+
+    Args:
+        command: A command block as extracted from the LLM response
+        cwd: Directory relative paths are resolved against; defaults to the process cwd
+
+    Returns:
+        The read set, write set, barrier flag and shell-state flag of the block
+    """
+    cwd = cwd or os.getcwd()
+    reads: Set[str] = set()
+    writes: Set[str] = set()
+
+    script = strip_heredoc_bodies(command).replace("\\\n", " ")
+    # Expansions make the touched paths unknowable without running the command
+    barrier = "$(" in script or "`" in script or "$" in script.replace("$?", "")
+    shell_state = False
+
+    for line in script.split("\n"):
+        if not line.strip() or line.lstrip().startswith("#"):
+            continue
+        try:
+            lexer = shlex.shlex(line, posix=True, punctuation_chars=True)
+            lexer.whitespace_split = True
+            lexer.commenters = "#"
+            tokens = list(lexer)
+        except ValueError:
+            barrier = True
+            continue
+        for simple_command in _split_simple_commands(tokens):
+            reason = _simple_command_effects(simple_command, cwd, reads, writes)
+            if reason:
+                barrier = True
+                shell_state = shell_state or reason == SHELL_STATE
+
+    return CommandEffects(reads, writes, barrier, shell_state)
@@ -1,84 +1,544 @@
 import json
 import os
+import socket
+import sqlite3
+import time
+from contextlib import contextmanager
 from datetime import datetime
-from typing import Dict, List, Optional
-from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Set
+
+from .blob_store import BlobStore
+from .config import get_data_dir
+from .metrics import HISTORY_WRITE_DURATION
+from .tracing import traced
+
+# Per-directory history file of earlier versions; imported into the
+# per-user history the first time VibeTerminal runs in its directory
+LEGACY_HISTORY_FILE = ".VibeTerminal_history"
+# Overrides the location of the per-user history database
+HISTORY_ENV_VAR = "VIBETERMINAL_HISTORY"
+
+# Rotation: the oldest entries beyond any of these limits are deleted
+MAX_ENTRIES = int(os.environ.get("VIBETERMINAL_HISTORY_MAX_ENTRIES", 100000))
+MAX_AGE_DAYS = float(os.environ.get("VIBETERMINAL_HISTORY_MAX_AGE_DAYS", 365))
+MAX_BYTES = int(os.environ.get("VIBETERMINAL_HISTORY_MAX_BYTES", 256 * 1024 * 1024))
+# Rotation runs once every this many appends
+ROTATE_EVERY = 256
+# Rows fetched per query by the lazy readers
+BATCH_SIZE = 500
+# Concurrent writers wait this long for the database lock
+BUSY_TIMEOUT = 30
+
+_COLUMNS = "id, command, timestamp, cwd, host, pid, session, result, output_blob, error_blob"
+# Result fields stored in the blob store instead of inline
+_BLOB_FIELDS = (("output", "output_blob"), ("error", "error_blob"))
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    command TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    created REAL NOT NULL,
+    cwd TEXT,
+    host TEXT,
+    pid INTEGER,
+    session TEXT,
+    return_code INTEGER,
+    result TEXT,
+    output_blob TEXT,
+    error_blob TEXT
+);
+CREATE INDEX IF NOT EXISTS history_cwd ON history (cwd, id);
+CREATE INDEX IF NOT EXISTS history_session ON history (session, id);
+CREATE INDEX IF NOT EXISTS history_created ON history (created);
+"""
+
+
+# Full-text index over command text, kept in sync by triggers
+_FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS history_fts USING fts5 (command, content='history', content_rowid='id');
+CREATE TRIGGER IF NOT EXISTS history_fts_insert AFTER INSERT ON history BEGIN
+    INSERT INTO history_fts (rowid, command) VALUES (new.id, new.command);
+END;
+CREATE TRIGGER IF NOT EXISTS history_fts_delete AFTER DELETE ON history BEGIN
+    INSERT INTO history_fts (history_fts, rowid, command) VALUES ('delete', old.id, old.command);
+END;
+"""
+# Lets deleting an entry find out whether its output blobs are still referenced without a table scan
+_BLOB_INDEXES = """
+CREATE INDEX IF NOT EXISTS history_output_blob ON history (output_blob);
+CREATE INDEX IF NOT EXISTS history_error_blob ON history (error_blob);
+"""
+SCHEMA_VERSION = 4
+
+
+def fts_query(text: str) -> str:
+    """Turn free text into an FTS5 query matching entries that contain every word as a prefix."""
+    return " ".join('"' + word.replace('"', '""') + '"*' for word in text.split())
+
+
+def default_history_file() -> str:
+    """Path of the per-user history database."""
+    return os.environ.get(HISTORY_ENV_VAR) or str(get_data_dir() / "history.db")
+
+
+def current_session() -> str:
+    """Identify the terminal session: VIBETERMINAL_SESSION, or the host and the shell's session id.
+
+    Every VibeTerminal started from the same terminal shares the session id
+    of that terminal's shell.
+    """
+    session = os.environ.get("VIBETERMINAL_SESSION")
+    if session:
+        return session
+    try:
+        return f"{socket.gethostname()}:{os.getsid(0)}"
+    except (AttributeError, OSError):  # Windows
+        return f"{socket.gethostname()}:{os.getppid()}"
+
 
 class CommandHistory:
-    """Manages command history for the VibeTerminal CLI."""
-    
-    def __init__(self, history_file: str = ".VibeTerminal_history"):
+    """Manages command history for the VibeTerminal CLI.
+
+    Every terminal shares one per-user history in SQLite (WAL mode), so
+    concurrent VibeTerminal processes append without losing each other's
+    entries. Each entry is tagged with its directory, host, pid and terminal
+    session. Appending is a single insert, readers iterate in batches and
+    never load the whole history, and old entries are rotated out by count,
+    age and database size.
+    """
+
+    def __init__(self, history_file: Optional[str] = None, import_from: Optional[str] = "."):
         """Initialize command history.
-        
+
         Args:
-            history_file: Path to the history file
+            history_file: Path to the history database; defaults to
+                $VIBETERMINAL_HISTORY or <data dir>/history.db
+            import_from: Directory whose per-directory history file of
+                earlier versions is imported on first use; None to skip
+        """
+        self.history_file = history_file or default_history_file()
+        self.import_from = import_from
+        self.host = socket.gethostname()
+        self.session = current_session()
+        self._db: Optional[sqlite3.Connection] = None
+        self._appends = 0
+        self.full_text = False
+
+    def _legacy_file(self) -> Optional[str]:
+        if self.import_from is None:
+            return None
+        path = os.path.join(self.import_from, LEGACY_HISTORY_FILE)
+        return path if os.path.isfile(path) else None
+
+    def _connect(self, create: bool = True) -> Optional[sqlite3.Connection]:
+        """Open the database on first use; without create, a missing history is not created."""
+        if self._db is not None:
+            return self._db
+        legacy_file = self._legacy_file()
+        if not create and not legacy_file and not os.path.exists(self.history_file):
+            return None
+        try:
+            db = sqlite3.connect(self.history_file, timeout=BUSY_TIMEOUT, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.executescript(_SCHEMA)
+        except sqlite3.Error as e:
+            print(f"Warning: Could not open history: {str(e)}")
+            return None
+        self._db = db
+        self.blobs = BlobStore(db, references=(("history", "output_blob"), ("history", "error_blob")))
+        self._upgrade()
+        if legacy_file:
+            self._import_legacy(legacy_file)
+        return db
+
+    def _upgrade(self) -> None:
+        """Add the full-text index, indexing existing entries once. Without FTS5, search falls back to LIKE."""
+        db = self._db
+        version = db.execute("PRAGMA user_version").fetchone()[0]
+        if version < 2:
+            try:
+                db.executescript(
+                    "BEGIN IMMEDIATE;" + _FTS_SCHEMA
+                    + "INSERT INTO history_fts (history_fts) VALUES ('rebuild');"
+                    + "PRAGMA user_version = 2;"
+                    + "COMMIT;"
+                )
+            except sqlite3.Error:
+                # SQLite was built without FTS5
+                if db.in_transaction:
+                    db.execute("ROLLBACK")
+        if version < 3:
+            # Move inline outputs into the blob store
+            with self._transaction():
+                columns = {row[1] for row in db.execute("PRAGMA table_info(history)")}
+                for _, column in _BLOB_FIELDS:
+                    if column not in columns:
+                        db.execute(f"ALTER TABLE history ADD COLUMN {column} TEXT")
+            self._externalize_outputs()
+            db.execute("PRAGMA user_version = 3")
+        if version < 4:
+            db.executescript(_BLOB_INDEXES)
+            db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        self.full_text = db.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'history_fts'"
+        ).fetchone() is not None
+
+    def _store_outputs(self, result: Optional[Dict]):
+        """Split a result into its JSON without outputs and the blob hashes of its outputs."""
+        if not isinstance(result, dict):
+            return (json.dumps(result) if result is not None else None), None, None
+        result = dict(result)
+        hashes = []
+        for field, _ in _BLOB_FIELDS:
+            text = result.pop(field, None)
+            hashes.append(self.blobs.put(text) if isinstance(text, str) and text else None)
+            if text is not None and not isinstance(text, str):
+                result[field] = text
+        return json.dumps(result, default=str), hashes[0], hashes[1]
+
+    def _externalize_outputs(self, batch_size: int = 1000) -> int:
+        """Move outputs stored inline in result JSON (older entries, imports) into the blob store."""
+        db = self._db
+        moved, last_id = 0, 0
+        while True:
+            with self._transaction():
+                rows = db.execute(
+                    "SELECT id, result FROM history WHERE id > ? AND output_blob IS NULL AND error_blob IS NULL "
+                    "AND (result LIKE '%\"output\"%' OR result LIKE '%\"error\"%') ORDER BY id LIMIT ?",
+                    (last_id, batch_size)
+                ).fetchall()
+                for entry_id, result in rows:
+                    try:
+                        stored = self._store_outputs(json.loads(result))
+                    except ValueError:
+                        continue
+                    db.execute("UPDATE history SET result = ?, output_blob = ?, error_blob = ? WHERE id = ?",
+                               stored + (entry_id,))
+            moved += len(rows)
+            if len(rows) < batch_size:
+                return moved
+            last_id = rows[-1][0]
+
+    def _import_legacy(self, path: str) -> None:
+        """Import a per-directory history file once, then rename it out of the way.
+
+        Entries without a directory are attributed to the directory the file
+        was in. Concurrent processes import a file only once: the rename
+        happens while the write lock is held.
         """
-        self.history_file = history_file
-        self.history: List[Dict] = []
-        self._load_history()
-    
-    def _load_history(self) -> None:
-        """Load command history from file."""
+        directory = os.path.dirname(os.path.abspath(path))
         try:
-            if os.path.exists(self.history_file):
-                with open(self.history_file, 'r') as f:
-                    self.history = json.load(f)
-        except Exception as e:
-            print(f"Warning: Could not load history: {str(e)}")
-            self.history = []
-    
-    def _save_history(self) -> None:
-        """Save command history to file."""
+            rows = self._legacy_rows(path, directory)
+            with self._transaction() as db:
+                if not os.path.exists(path):
+                    return
+                db.executemany(
+                    "INSERT INTO history (command, timestamp, created, cwd, return_code, result) VALUES (?, ?, ?, ?, ?, ?)",
+                    rows
+                )
+                os.replace(path, path + ".migrated")
+            self._externalize_outputs()
+        except (OSError, ValueError, sqlite3.Error) as e:
+            print(f"Warning: Could not import history from {path}: {str(e)}")
+
+    @staticmethod
+    def _legacy_rows(path: str, directory: str):
+        """Rows for the entries of a JSON history file of earlier versions."""
+        with open(path, 'r') as f:
+            entries = json.load(f)
+        rows = []
+        for entry in entries if isinstance(entries, list) else []:
+            if not isinstance(entry, dict) or not entry.get("command"):
+                continue
+            timestamp = entry.get("timestamp") or datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            try:
+                created = datetime.strptime(timestamp, "%Y-%m-%d %H:%M:%S").timestamp()
+            except ValueError:
+                created = time.time()
+            result = entry.get("result")
+            rows.append((
+                entry["command"], timestamp, created, entry.get("cwd") or directory,
+                result.get("return_code") if isinstance(result, dict) else None,
+                json.dumps(result) if result is not None else None
+            ))
+        return rows
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        """Run statements atomically, taking the write lock up front."""
+        self._db.execute("BEGIN IMMEDIATE")
         try:
-            with open(self.history_file, 'w') as f:
-                json.dump(self.history, f, indent=2)
-        except Exception as e:
-            print(f"Warning: Could not save history: {str(e)}")
-    
-    def add_command(self, command: str, result: Optional[Dict] = None) -> None:
+            yield self._db
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+        self._db.execute("COMMIT")
+
+    def _entry(self, row) -> Dict:
+        entry_id, command, timestamp, cwd, host, pid, session, result, output_blob, error_blob = row
+        result = json.loads(result) if result is not None else None
+        if isinstance(result, dict):
+            for (field, _), digest in zip(_BLOB_FIELDS, (output_blob, error_blob)):
+                if digest:
+                    result[field] = self.blobs.get(digest)
+        return {
+            "id": entry_id,
+            "command": command,
+            "timestamp": timestamp,
+            "cwd": cwd,
+            "host": host,
+            "pid": pid,
+            "session": session,
+            "result": result
+        }
+
+    @traced("history.add", "history")
+    def add_command(self, command: str, result: Optional[Dict] = None, cwd: Optional[str] = None) -> None:
         """Add a command to history.
-        
+
         Args:
             command: The command that was executed
             result: Optional result of the command execution
+            cwd: Directory the command ran in; defaults to the current one
         """
-        entry = {
-            "command": command,
-            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            "result": result
-        }
-        self.history.append(entry)
-        self._save_history()
-    
-    def get_last_command(self) -> Optional[Dict]:
+        db = self._connect()
+        if db is None:
+            return
+        started = time.perf_counter()
+        try:
+            with self._transaction():
+                result_json, output_blob, error_blob = self._store_outputs(result)
+                db.execute(
+                    "INSERT INTO history (command, timestamp, created, cwd, host, pid, session, return_code, result, "
+                    "output_blob, error_blob) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        command, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), time.time(), cwd or os.getcwd(),
+                        self.host, os.getpid(), self.session,
+                        result.get("return_code") if result else None,
+                        result_json, output_blob, error_blob
+                    )
+                )
+            HISTORY_WRITE_DURATION.observe(time.perf_counter() - started)
+            self._appends += 1
+            if self._appends % ROTATE_EVERY == 1:
+                self.rotate()
+        except sqlite3.Error as e:
+            print(f"Warning: Could not save history: {str(e)}")
+
+    def rotate(self, max_entries: int = MAX_ENTRIES, max_age_days: float = MAX_AGE_DAYS,
+               max_bytes: int = MAX_BYTES) -> int:
+        """Delete the oldest entries beyond the count, age and size limits.
+
+        Args:
+            max_entries: Most entries kept
+            max_age_days: Entries older than this are deleted
+            max_bytes: If the database is larger, the oldest quarter of the entries is deleted
+
+        Returns:
+            Number of entries deleted
+        """
+        db = self._connect(create=False)
+        if db is None:
+            return 0
+        released: Set[str] = set()
+        with self._transaction():
+            deleted = self._delete("created < ?", (time.time() - max_age_days * 86400,), released)
+            deleted += self._delete(
+                "id <= (SELECT id FROM history ORDER BY id DESC LIMIT 1 OFFSET ?)", (max_entries,), released
+            )
+            page_size = db.execute("PRAGMA page_size").fetchone()[0]
+            used_pages = db.execute("PRAGMA page_count").fetchone()[0] - db.execute("PRAGMA freelist_count").fetchone()[0]
+            if used_pages * page_size > max_bytes:
+                deleted += self._delete(
+                    "id <= (SELECT id FROM history ORDER BY id DESC LIMIT 1 OFFSET (SELECT COUNT(*) * 3 / 4 FROM history))",
+                    (), released
+                )
+            self.blobs.release(released)
+        return deleted
+
+    def _delete(self, condition: str, params: tuple, released: Set[str]) -> int:
+        """Delete the entries matching a condition, adding the blob hashes they referenced to released."""
+        for hashes in self._db.execute(f"SELECT output_blob, error_blob FROM history WHERE {condition}", params):
+            released.update(digest for digest in hashes if digest)
+        return self._db.execute(f"DELETE FROM history WHERE {condition}", params).rowcount
+
+    @staticmethod
+    def _filters(cwd: Optional[str], session: Optional[str]):
+        clauses, params = [], []
+        if cwd is not None:
+            clauses.append("cwd = ?")
+            params.append(cwd)
+        if session is not None:
+            clauses.append("session = ?")
+            params.append(session)
+        return "".join(f" AND {clause}" for clause in clauses), params
+
+    @traced("history.last", "history")
+    def get_last_command(self, cwd: Optional[str] = None) -> Optional[Dict]:
         """Get the last executed command.
-        
+
+        Args:
+            cwd: Only consider commands run in this directory
+
         Returns:
             The last command entry or None if history is empty
         """
-        return self.history[-1] if self.history else None
-    
-    def undo_last_command(self) -> Optional[Dict]:
+        db = self._connect(create=False)
+        if db is None:
+            return None
+        where, params = self._filters(cwd, None)
+        row = db.execute(f"SELECT {_COLUMNS} FROM history WHERE 1{where} ORDER BY id DESC LIMIT 1", params).fetchone()
+        return self._entry(row) if row else None
+
+    @traced("history.undo", "history")
+    def undo_last_command(self, cwd: Optional[str] = None) -> Optional[Dict]:
         """Remove and return the last command from history.
-        
+
+        Args:
+            cwd: Only consider commands run in this directory
+
         Returns:
             The last command entry or None if history is empty
         """
-        if not self.history:
+        db = self._connect(create=False)
+        if db is None:
             return None
-        last_command = self.history.pop()
-        self._save_history()
-        return last_command
-    
-    def get_history(self) -> List[Dict]:
-        """Get all command history entries.
-        
+        where, params = self._filters(cwd, None)
+        with self._transaction():
+            row = db.execute(f"SELECT {_COLUMNS} FROM history WHERE 1{where} ORDER BY id DESC LIMIT 1", params).fetchone()
+            if row is None:
+                return None
+            entry = self._entry(row)
+            db.execute("DELETE FROM history WHERE id = ?", (row[0],))
+            self.blobs.release(row[-2:])
+        return entry
+
+    def iter_history(self, cwd: Optional[str] = None, session: Optional[str] = None,
+                     newest_first: bool = False) -> Iterator[Dict]:
+        """Iterate over history entries, fetching them in batches.
+
+        Args:
+            cwd: Only entries run in this directory
+            session: Only entries from this terminal session
+            newest_first: Iterate from the most recent entry backwards
+
         Returns:
-            List of command history entries
+            Iterator over command history entries
         """
-        return self.history
-    
+        db = self._connect(create=False)
+        if db is None:
+            return
+        order, compare = ("DESC", "<") if newest_first else ("ASC", ">")
+        where, filter_params = self._filters(cwd, session)
+        last_id = 2 ** 63 - 1 if newest_first else -1
+        while True:
+            # Keyset pagination: each batch starts after the last id seen
+            rows = db.execute(
+                f"SELECT {_COLUMNS} FROM history WHERE id {compare} ?{where} ORDER BY id {order} LIMIT {BATCH_SIZE}",
+                [last_id] + filter_params
+            ).fetchall()
+            for row in rows:
+                yield self._entry(row)
+            if len(rows) < BATCH_SIZE:
+                return
+            last_id = rows[-1][0]
+
+    @traced("history.search", "history")
+    def search(self, text: Optional[str] = None, cwd: Optional[str] = None, since: Optional[float] = None,
+               until: Optional[float] = None, success: Optional[bool] = None, before_id: Optional[int] = None,
+               limit: int = 20) -> List[Dict]:
+        """Return one page of matching entries, newest first.
+
+        Only the requested page is read: entries are visited in descending id
+        order (through the full-text index when searching) starting below
+        before_id, and reading stops after limit matches.
+
+        Args:
+            text: Words that must all occur in the command (prefix match)
+            cwd: Only entries run in this directory
+            since: Only entries recorded at or after this Unix time
+            until: Only entries recorded before this Unix time
+            success: Only successful (True) or failed (False) commands
+            before_id: Only entries older than this id, i.e. the last id of the previous page
+            limit: Page size
+
+        Returns:
+            Matching command history entries
+        """
+        db = self._connect(create=False)
+        if db is None:
+            return []
+        clauses, params = [], []
+        if before_id is not None:
+            clauses.append("h.id < ?")
+            params.append(before_id)
+        if cwd is not None:
+            clauses.append("h.cwd = ?")
+            params.append(cwd)
+        if since is not None:
+            clauses.append("h.created >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("h.created < ?")
+            params.append(until)
+        if success is not None:
+            clauses.append("h.return_code = 0" if success else "h.return_code != 0")
+        columns = ", ".join(f"h.{column}" for column in _COLUMNS.split(", "))
+        if text and text.split() and self.full_text:
+            query = (f"SELECT {columns} FROM history_fts JOIN history h ON h.id = history_fts.rowid "
+                     f"WHERE history_fts MATCH ?{''.join(' AND ' + c for c in clauses)} "
+                     f"ORDER BY history_fts.rowid DESC LIMIT ?")
+            params = [fts_query(text)] + params
+        else:
+            for word in (text or "").split():
+                clauses.append("h.command LIKE ? ESCAPE '\\'")
+                params.append("%" + word.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%")
+            where = " WHERE " + " AND ".join(clauses) if clauses else ""
+            query = f"SELECT {columns} FROM history h{where} ORDER BY h.id DESC LIMIT ?"
+        return [self._entry(row) for row in db.execute(query, params + [limit])]
+
+    def get_history(self) -> Iterator[Dict]:
+        """Get all command history entries, oldest first.
+
+        Returns:
+            Lazy iterator over command history entries
+        """
+        return self.iter_history()
+
+    def count(self) -> int:
+        """Return the number of entries in the history."""
+        db = self._connect(create=False)
+        return db.execute("SELECT COUNT(*) FROM history").fetchone()[0] if db else 0
+
+    def command_counts(self, cwd: Optional[str] = None) -> Dict[str, int]:
+        """Count how often each command was run, optionally only in one directory.
+
+        Args:
+            cwd: Only count commands run in this directory
+
+        Returns:
+            Mapping of command text to the number of times it was run
+        """
+        db = self._connect(create=False)
+        if db is None:
+            return {}
+        if cwd is None:
+            rows = db.execute("SELECT command, COUNT(*) FROM history GROUP BY command")
+        else:
+            rows = db.execute("SELECT command, COUNT(*) FROM history WHERE cwd = ? GROUP BY command", (cwd,))
+        return dict(rows.fetchall())
+
     def clear_history(self) -> None:
         """Clear all command history."""
-        self.history = []
-        self._save_history() 
\ No newline at end of file
+        db = self._connect(create=False)
+        if db is not None:
+            with self._transaction():
+                db.execute("DELETE FROM history")
+                self.blobs.clear()
+
+    def close(self) -> None:
+        """Close the database connection."""
+        if self._db is not None:
+            self._db.close()
+            self._db = None
@@ -1,92 +1,426 @@
-from typing import Dict, List
+import re
+import shlex
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, Union
+
 from .os_detection import OSDetector
-import os
+from .heredoc import heredoc_delimiters, parse_script
+
+# A rule is a template or a function of the operands and a quoting function.
+# Templates take {args} (all operands), {0}, {1}... (single operands) and {rest}
+# (the operands after {0}); a rule whose placeholders cannot be filled does not apply.
+Rule = Union[str, Callable[[List[str], Callable[[str], str]], Optional[str]]]
+
+# Separators between simple commands, longest first
+_OPERATORS = ("&&", "||", "|", ";", "&")
+# Text that makes the words of a command depend on the shell; such commands are left as they are
+_SHELL_SYNTAX = re.compile(r"[$`(){}]")
+_FLAG = re.compile(r"-[a-zA-Z]+")
+_POWERSHELL_SAFE = re.compile(r"[\w./:\\*?~+,=@-]+")
+_CMD_SAFE = re.compile(r"[\w./:\\*?~+,=@-]+")
+_PLACEHOLDER = re.compile(r"\{(args|rest|\d+)\}")
+# Programs whose options are words (`find -name`), not groups of letters
+_WORD_OPTIONS = {"find"}
+
+
+def quote_powershell(word: str) -> str:
+    """Quote a word for PowerShell; single quotes keep it literal (wildcards still apply)."""
+    if _POWERSHELL_SAFE.fullmatch(word) and not word.startswith(("-", "@")):
+        return word
+    return "'" + word.replace("'", "''") + "'"
+
+
+def quote_cmd(word: str) -> str:
+    """Quote a word for cmd.exe."""
+    if _CMD_SAFE.fullmatch(word):
+        return word
+    return '"' + word.replace('"', '""') + '"'
+
+
+def cmd_path(word: str) -> str:
+    """Turn a POSIX path into a cmd.exe path; cmd reads a `/` in an operand as the start of a switch."""
+    return word.replace("/", "\\")
+
+
+def _powershell_grep(recursive: bool, case_sensitive: bool) -> Rule:
+    def rule(operands: List[str], q: Callable[[str], str]) -> Optional[str]:
+        if not operands:
+            return None
+        pattern = f"Select-String -Pattern {q(operands[0])}" + (" -CaseSensitive" if case_sensitive else "")
+        paths = ", ".join(q(path) for path in operands[1:])
+        if recursive:
+            return f"Get-ChildItem -Recurse -File -Path {paths or '.'} | {pattern}"
+        return f"{pattern} -Path {paths}" if paths else pattern
+    return rule
+
+
+def _powershell_touch(operands: List[str], q: Callable[[str], str]) -> Optional[str]:
+    # Unlike New-Item -Force, touch keeps the content of existing files
+    if not operands:
+        return None
+    paths = ", ".join(q(path) for path in operands)
+    return (f"foreach ($p in {paths}) {{ if (Test-Path $p) {{ (Get-Item $p).LastWriteTime = Get-Date }} "
+            f"else {{ New-Item -ItemType File -Path $p | Out-Null }} }}")
+
+
+def _powershell_find(operands: List[str], q: Callable[[str], str]) -> Optional[str]:
+    # find [path] [-name pattern] [-type f|d]
+    path, options = (operands[0], operands[1:]) if operands and not operands[0].startswith("-") else (".", operands)
+    command = f"Get-ChildItem -Recurse -Path {q(path)}"
+    while options:
+        if len(options) < 2:
+            return None
+        option, value, options = options[0], options[1], options[2:]
+        if option == "-name":
+            command += f" -Filter {q(value)}"
+        elif option == "-type" and value in ("f", "d"):
+            command += " -File" if value == "f" else " -Directory"
+        else:
+            return None
+    return command
+
+
+def _cmd_paths(template: str) -> Rule:
+    # Every operand of the template is a path
+    def rule(operands: List[str], q: Callable[[str], str]) -> Optional[str]:
+        return _fill(template, operands, lambda word: q(cmd_path(word)))
+    return rule
+
+
+def _cmd_findstr(switches: str) -> Rule:
+    def rule(operands: List[str], q: Callable[[str], str]) -> Optional[str]:
+        if not operands:
+            return None
+        paths = "".join(f" {q(cmd_path(path))}" for path in operands[1:])
+        return f"findstr {switches}{q(operands[0])}{paths}"
+    return rule
+
+
+def _cmd_find(operands: List[str], q: Callable[[str], str]) -> Optional[str]:
+    path, options = (operands[0], operands[1:]) if operands and not operands[0].startswith("-") else (".", operands)
+    if not options:
+        return f"dir /s /b {q(cmd_path(path))}"
+    if len(options) == 2 and options[0] == "-name":
+        return f"dir /s /b {q(cmd_path(path.rstrip('/') + '/' + options[1]))}"
+    return None
+
+
+# Translations of Unix commands, keyed by (os, shell). Keys are a program
+# followed by its flags; single-letter flags are matched in any order and
+# grouping (`ls -la`, `ls -a -l` and `ls -al` are the same key).
+COMMAND_MAPPINGS: Dict[Tuple[str, str], Dict[str, Rule]] = {
+    ("windows", "powershell"): {
+        "ls": "Get-ChildItem {args}",
+        "ls -l": "Get-ChildItem {args}",
+        "ls -a": "Get-ChildItem -Force {args}",
+        "ls -al": "Get-ChildItem -Force {args}",
+        "ls -R": "Get-ChildItem -Recurse {args}",
+        "cat": "Get-Content {args}",
+        "grep": _powershell_grep(recursive=False, case_sensitive=True),
+        "grep -i": _powershell_grep(recursive=False, case_sensitive=False),
+        "grep -r": _powershell_grep(recursive=True, case_sensitive=True),
+        "grep -R": _powershell_grep(recursive=True, case_sensitive=True),
+        "grep -ir": _powershell_grep(recursive=True, case_sensitive=False),
+        "find": _powershell_find,
+        "rm": "Remove-Item {args}",
+        "rm -f": "Remove-Item -Force {args}",
+        "rm -r": "Remove-Item -Recurse {args}",
+        "rm -R": "Remove-Item -Recurse {args}",
+        "rm -fr": "Remove-Item -Recurse -Force {args}",
+        "rm -Rf": "Remove-Item -Recurse -Force {args}",
+        "rmdir": "Remove-Item {args}",
+        "cp": "Copy-Item {args}",
+        "cp -r": "Copy-Item -Recurse {args}",
+        "cp -R": "Copy-Item -Recurse {args}",
+        "mv": "Move-Item {args}",
+        "mv -f": "Move-Item -Force {args}",
+        "mkdir": "New-Item -ItemType Directory -Path {args}",
+        "mkdir -p": "New-Item -ItemType Directory -Force -Path {args}",
+        "touch": _powershell_touch,
+        "pwd": "Get-Location",
+        "echo": "Write-Output {args}",
+        "which": "Get-Command {args}",
+        "clear": "Clear-Host",
+        "head -n": "Get-Content {1} -TotalCount {0}",
+        "tail -n": "Get-Content {1} -Tail {0}",
+        "tail -f": "Get-Content {0} -Wait",
+        "wc -l": "(Get-Content {0} | Measure-Object -Line).Lines",
+        "ps": "Get-Process",
+        "kill": "Stop-Process -Id {args}",
+        "kill -9": "Stop-Process -Force -Id {args}",
+        "env": "Get-ChildItem Env:",
+        "printenv": "Get-ChildItem Env:",
+        "sleep": "Start-Sleep -Seconds {0}",
+    },
+    ("windows", "cmd"): {
+        "ls": _cmd_paths("dir {args}"),
+        "ls -l": _cmd_paths("dir {args}"),
+        "ls -a": _cmd_paths("dir /a {args}"),
+        "ls -al": _cmd_paths("dir /a {args}"),
+        "ls -R": _cmd_paths("dir /s {args}"),
+        "cat": _cmd_paths("type {args}"),
+        "grep": _cmd_findstr(""),
+        "grep -i": _cmd_findstr("/i "),
+        "grep -r": _cmd_findstr("/s "),
+        "grep -ir": _cmd_findstr("/s /i "),
+        "find": _cmd_find,
+        "rm": _cmd_paths("del {args}"),
+        "rm -f": _cmd_paths("del /f /q {args}"),
+        "rm -r": _cmd_paths("rmdir /s /q {args}"),
+        "rm -fr": _cmd_paths("rmdir /s /q {args}"),
+        "rmdir": _cmd_paths("rmdir {args}"),
+        "cp": _cmd_paths("copy {args}"),
+        "cp -r": _cmd_paths("xcopy /e /i {args}"),
+        "mv": _cmd_paths("move {args}"),
+        # cmd's mkdir always creates missing parents
+        "mkdir": _cmd_paths("mkdir {args}"),
+        "mkdir -p": _cmd_paths("mkdir {args}"),
+        "touch": _cmd_paths("type nul >> {0}"),
+        "pwd": "cd",
+        "echo": "echo {args}",
+        "which": "where {args}",
+        "clear": "cls",
+        "ps": "tasklist",
+        "kill": "taskkill /pid {0}",
+        "kill -9": "taskkill /f /pid {0}",
+        "env": "set",
+        "printenv": "set",
+        "sleep": "timeout /t {0} /nobreak",
+    },
+}
+# Unix targets run the commands as written
+for _os in ("linux", "macos"):
+    for _shell in ("bash", "zsh", "unknown"):
+        COMMAND_MAPPINGS[(_os, _shell)] = {}
+
+QUOTING: Dict[str, Callable[[str], str]] = {"powershell": quote_powershell, "cmd": quote_cmd}
+
+
+def _canonical(words: List[str]) -> List[str]:
+    """Merge the leading single-letter flags after the program into one sorted flag word."""
+    letters = []
+    i = 1
+    while i < len(words) and _FLAG.fullmatch(words[i]):
+        letters.extend(words[i][1:])
+        i += 1
+    if not letters or words[0] in _WORD_OPTIONS:
+        return words
+    return [words[0], "-" + "".join(sorted(set(letters), key=lambda c: (c.lower(), c)))] + words[i:]
+
+
+@lru_cache(maxsize=None)
+def build_trie(os_type: str, shell_type: str) -> Dict:
+    """Build the lookup trie for a target once; each node maps a word to its child, and None to its rule."""
+    trie: Dict = {}
+    for key, rule in COMMAND_MAPPINGS.get((os_type, shell_type), {}).items():
+        node = trie
+        for word in _canonical(key.split()):
+            node = node.setdefault(word, {})
+        node[None] = rule
+    return trie
+
+
+def split_commands(line: str) -> List[Tuple[str, str]]:
+    """Split a line into (simple command, following operator) pairs, outside of quotes."""
+    parts = []
+    quote = None
+    start = i = 0
+    while i < len(line):
+        c = line[i]
+        if quote:
+            if c == "\\" and quote == '"':
+                i += 1
+            elif c == quote:
+                quote = None
+        elif c in "'\"":
+            quote = c
+        elif c == "\\":
+            i += 1
+        else:
+            operator = next((op for op in _OPERATORS if line.startswith(op, i)), None)
+            # `2>&1` and `&>` are redirections, not operators
+            if operator == "&" and (line[i - 1:i] == ">" or line[i + 1:i + 2] == ">"):
+                operator = None
+            if operator:
+                parts.append((line[start:i], operator))
+                i += len(operator)
+                start = i
+                continue
+        i += 1
+    parts.append((line[start:], ""))
+    return parts
+
+
+def _split_redirect(command: str) -> Tuple[str, str]:
+    """Split a simple command into its words and a trailing redirection (kept verbatim)."""
+    quote = None
+    for i, c in enumerate(command):
+        if quote:
+            if c == quote:
+                quote = None
+        elif c in "'\"":
+            quote = c
+        elif c in "<>":
+            # Include a file descriptor number written right before the operator
+            j = i
+            while j > 0 and command[j - 1].isdigit():
+                j -= 1
+            if j == 0 or command[j - 1].isspace():
+                return command[:j], command[j:]
+            return command[:i], command[i:]
+    return command, ""
+
+
+def _fill(template: str, operands: List[str], q: Callable[[str], str]) -> Optional[str]:
+    used = set()
+
+    def replace(match: re.Match) -> str:
+        name = match.group(1)
+        if name == "args":
+            used.update(range(len(operands)))
+            return " ".join(q(word) for word in operands)
+        if name == "rest":
+            used.update(range(1, len(operands)))
+            return " ".join(q(word) for word in operands[1:])
+        index = int(name)
+        if index >= len(operands):
+            raise IndexError(index)
+        used.add(index)
+        return q(operands[index])
+
+    try:
+        filled = _PLACEHOLDER.sub(replace, template)
+    except IndexError:
+        return None
+    # Operands the template has no place for would be lost
+    if len(used) != len(operands):
+        return None
+    return " ".join(filled.split())
+
 
 class CommandTranslator:
-    def __init__(self):
-        self.os_type, self.shell_type = OSDetector.get_os_info()
-        
-        # Command mappings for different OSes
-        self.command_mappings: Dict[str, Dict[str, str]] = {
-            'windows': {
-                'powershell': {
-                    'ls': 'Get-ChildItem',
-                    'cat': 'Get-Content',
-                    'grep': 'Select-String',
-                    'find': 'Get-ChildItem -Recurse',
-                    'rm': 'Remove-Item',
-                    'cp': 'Copy-Item',
-                    'mv': 'Move-Item',
-                    'pwd': 'Get-Location',
-                    'echo': 'Write-Output'
-                },
-                'cmd': {
-                    'ls': 'dir',
-                    'cat': 'type',
-                    'grep': 'findstr',
-                    'find': 'dir /s /b',
-                    'rm': 'del',
-                    'cp': 'copy',
-                    'mv': 'move',
-                    'pwd': 'cd',
-                    'echo': 'echo'
-                }
-            },
-            'macos': {
-                'bash': {},  # Most commands are the same as Linux
-                'zsh': {}    # Most commands are the same as Linux
-            },
-            'linux': {
-                'bash': {},  # Original commands
-                'zsh': {}    # Original commands
-            }
-        }
+    """Translates shell commands written for bash into the current (or a given) OS and shell.
+
+    Each command is tokenized once and its program and flags are looked up
+    in a trie built once per (os, shell) from COMMAND_MAPPINGS. Commands
+    the tables do not cover, or that use shell syntax the translation
+    could not preserve (variables, substitutions, unknown flags), are left
+    as they are. Heredoc file writes become Set-Content/Add-Content on
+    PowerShell and echo lines on cmd.
+    """
+
+    def __init__(self, os_type: Optional[str] = None, shell_type: Optional[str] = None):
+        """Initialize the translator.
+
+        Args:
+            os_type: Target OS ('windows', 'macos', 'linux'); detected (once per process) if omitted
+            shell_type: Target shell ('powershell', 'cmd', 'bash', 'zsh', 'unknown')
+        """
+        detected_os, detected_shell = OSDetector.get_os_info()
+        self.os_type = os_type or detected_os
+        self.shell_type = shell_type or (detected_shell if self.os_type == detected_os else "unknown")
+        self.command_mappings = COMMAND_MAPPINGS.get((self.os_type, self.shell_type), {})
+        self.trie = build_trie(self.os_type, self.shell_type)
+        self.quote = QUOTING.get(self.shell_type, shlex.quote)
+        self._cache: Dict[str, str] = {}
 
     def translate_command(self, command: str) -> str:
-        """Translate a command based on the current OS."""
-        os_type, shell_type = OSDetector.get_os_info()
-        
-        # Handle file creation commands
-        if 'cat >' in command and '<<' in command and 'EOF' in command:
-            # Extract the file path and content
-            lines = command.strip().split('\n')
-            if len(lines) >= 3:
-                file_path = lines[0].split('cat >')[1].split('<<')[0].strip()
-                content_lines = []
-                in_content = False
-                
-                for line in lines[1:]:
-                    if line.strip().endswith("<< 'EOF'"):
-                        in_content = True
-                        continue
-                    elif line.strip() == "EOF":
-                        in_content = False
-                        continue
-                    elif in_content:
-                        content_lines.append(line)
-                
-                content = '\n'.join(content_lines).strip()
-                
-                # Create the command with proper escaping
-                if os_type == 'windows':
-                    # For Windows, use PowerShell
-                    return f'Set-Content -Path "{file_path}" -Value @"{content}"@'
-                else:
-                    # For Unix-like systems, use heredoc
-                    return f"cat > '{file_path}' << 'EOF'\n{content}\nEOF"
-        
-        # Handle other commands based on OS
-        if os_type == 'windows':
-            # Translate Unix commands to PowerShell
-            if command.startswith('rm '):
-                return f'Remove-Item -Path "{command[3:]}" -Force'
-            elif command.startswith('mkdir '):
-                return f'New-Item -Path "{command[6:]}" -ItemType Directory -Force'
-            elif command.startswith('touch '):
-                return f'New-Item -Path "{command[6:]}" -ItemType File -Force'
-        else:
-            # Keep Unix commands as is
+        """Translate a command (or a multi-line script) for the target OS and shell."""
+        if not self.trie:
+            # Unix targets run the commands as written
             return command
+        translated = self._cache.get(command)
+        if translated is None:
+            translated = self._translate_script(command)
+            if len(self._cache) >= 4096:
+                self._cache.clear()
+            self._cache[command] = translated
+        return translated
+
+    def translate_many(self, commands: Iterable[str]) -> List[str]:
+        """Translate a list of commands, e.g. every command block of a response."""
+        return [self.translate_command(command) for command in commands]
+
+    def _translate_script(self, script: str) -> str:
+        translated = []
+        for segment in parse_script(script):
+            if segment.shell is not None:
+                translated.append(self._translate_lines(segment.shell))
+            else:
+                translated.append(self._translate_write(segment.write))
+        return "\n".join(translated)
+
+    def _translate_write(self, write) -> str:
+        if self.shell_type == "cmd":
+            operator = ">>" if write.append else ">"
+            lines = []
+            for line in write.content.rstrip("\n").split("\n"):
+                escaped = re.sub(r"([\^&|<>()])", r"^\1", line).replace("%", "%%")
+                # `echo.` prints an empty line where `echo` would print "ECHO is on."
+                lines.append(f"echo.{escaped} {operator} {quote_cmd(cmd_path(write.path))}")
+                operator = ">>"
+            return "\n".join(lines)
+        # A single-quoted here-string is taken literally, like a quoted heredoc
+        cmdlet = "Add-Content" if write.append else "Set-Content"
+        content = write.content.rstrip("\n")
+        return f"{cmdlet} -Path {quote_powershell(write.path)} -Value @'\n{content}\n'@"
+
+    def _translate_lines(self, text: str) -> str:
+        lines = []
+        heredocs: List[Tuple[str, bool]] = []
+        for line in text.split("\n"):
+            if heredocs:
+                # Heredoc bodies the shell expands itself are left alone
+                delimiter, strip_tabs = heredocs[0]
+                if (line.lstrip("\t") if strip_tabs else line) == delimiter:
+                    heredocs.pop(0)
+                lines.append(line)
+                continue
+            found = heredoc_delimiters(line)
+            if found:
+                heredocs.extend(found)
+                lines.append(line)
+                continue
+            lines.append(self.translate_line(line))
+        return "\n".join(lines)
+
+    def translate_line(self, line: str) -> str:
+        """Translate one line of simple commands joined by pipes and operators."""
+        if not line.strip() or line.lstrip().startswith("#"):
+            return line
+        parts = []
+        for command, operator in split_commands(line):
+            parts.append(self._translate_simple(command) + (f" {operator} " if operator else ""))
+        return "".join(parts).strip() if len(parts) > 1 else parts[0]
+
+    def _translate_simple(self, command: str) -> str:
+        words_text, redirect = _split_redirect(command)
+        if not words_text.strip() or _SHELL_SYNTAX.search(words_text):
+            return command.strip()
+        try:
+            words = shlex.split(words_text)
+        except ValueError:
+            return command.strip()
+        words = _canonical(words)
+
+        # Longest match of the program and its flags
+        node, rule, matched = self.trie, None, 0
+        for i, word in enumerate(words):
+            node = node.get(word)
+            if node is None:
+                break
+            if None in node:
+                rule, matched = node[None], i + 1
+        if rule is None:
+            return command.strip()
+        operands = words[matched:]
+        if words[0] not in _WORD_OPTIONS and any(word.startswith("-") and len(word) > 1 for word in operands):
+            # Flags the table does not know; translating would drop their meaning
+            return command.strip()
+        translated = rule(operands, self.quote) if callable(rule) else _fill(rule, operands, self.quote)
+        if translated is None:
+            return command.strip()
+        return f"{translated} {redirect.strip()}" if redirect.strip() else translated
 
     def translate_file_creation(self, filename: str, content: str) -> str:
         """
@@ -118,7 +452,7 @@ class CommandTranslator:
         """
         # Properly escape the filename for shell safety
         escaped_filename = f'"{filename}"'
-        
+
         if self.os_type == 'windows':
             if self.shell_type == 'powershell':
                 return f'Add-Content -Path {escaped_filename} -Value "{content}" -Encoding UTF8'
@@ -137,4 +471,4 @@ class CommandTranslator:
             else:  # cmd
                 return ['dir', 'type', 'cd', 'echo']
         else:  # Linux or macOS
-            return ['ls', 'cat', 'pwd', 'echo', 'grep', 'find'] 
\ No newline at end of file
+            return ['ls', 'cat', 'pwd', 'echo', 'grep', 'find']
@@ -1,8 +1,32 @@
 import os
-from dotenv import load_dotenv
+from pathlib import Path
 
-load_dotenv()
+_env_loaded = False
+
+def load_environment():
+    """Loads variables from a .env file, at most once per process."""
+    global _env_loaded
+    if not _env_loaded:
+        # python-dotenv is only needed on paths that talk to the LLM
+        from dotenv import load_dotenv
+        load_dotenv()
+        _env_loaded = True
 
 def load_api_key():
     """Loads the API key from the environment."""
+    load_environment()
     return os.getenv("NOVITA_API_KEY")
+
+def get_cache_dir() -> Path:
+    """Returns the per-user cache directory ($XDG_CACHE_HOME/VibeTerminal), creating it if needed."""
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    path = Path(base) / "VibeTerminal"
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+def get_data_dir() -> Path:
+    """Returns the per-user data directory ($XDG_DATA_HOME/VibeTerminal), creating it if needed."""
+    base = os.environ.get("XDG_DATA_HOME") or os.path.join(os.path.expanduser("~"), ".local", "share")
+    path = Path(base) / "VibeTerminal"
+    path.mkdir(parents=True, exist_ok=True)
+    return path
@@ -0,0 +1,130 @@
+import os
+import signal
+import subprocess
+from typing import Callable, Dict, NamedTuple, Optional
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+class ExecutionPolicy(NamedTuple):
+    """Limits applied to a single executed command. None means unlimited."""
+    timeout: Optional[float] = None  # Wall-clock seconds before the process group is killed
+    cpu_seconds: Optional[int] = None  # RLIMIT_CPU
+    memory_bytes: Optional[int] = None  # RLIMIT_AS
+    open_files: Optional[int] = None  # RLIMIT_NOFILE
+    kill_grace: float = 2.0  # Seconds between SIGTERM and SIGKILL
+
+    def describe(self) -> Dict:
+        """Return the configured limits, for inclusion in command results."""
+        return {name: value for name, value in self._asdict().items() if value is not None and name != "kill_grace"}
+
+
+# Defaults per execution mode; each value can be overridden with
+# VIBETERMINAL_<MODE>_<FIELD>, e.g. VIBETERMINAL_AGENT_TIMEOUT=30
+DEFAULT_POLICIES: Dict[str, ExecutionPolicy] = {
+    # Foreground commands are not detached by default, so a build may take as long as it takes
+    "agent": ExecutionPolicy(),  # Commands extracted from LLM responses
+    "tool": ExecutionPolicy(timeout=60),  # agent.tools.execute_shell_command
+    "shell": ExecutionPolicy(),  # cli.execute_command
+    "job": ExecutionPolicy(),  # Background jobs; no limits unless configured
+    # Read-only commands run before they were asked for; never worth a long wait
+    "speculative": ExecutionPolicy(timeout=3, cpu_seconds=2, memory_bytes=1 << 30, open_files=256),
+}
+
+# Agent timeout when long-running commands are detached automatically, so
+# only the commands expected to finish quickly stay in the foreground
+AUTO_BACKGROUND_TIMEOUT = 120.0
+
+_ENV_FIELDS = {
+    "TIMEOUT": ("timeout", float),
+    "CPU": ("cpu_seconds", int),
+    "MEMORY": ("memory_bytes", int),
+    "NOFILE": ("open_files", int),
+}
+
+
+def get_policy(mode: str, **overrides) -> ExecutionPolicy:
+    """Return the execution policy for a mode, with environment and explicit overrides applied.
+
+    Args:
+        mode: Execution mode, one of DEFAULT_POLICIES
+        **overrides: Field values that take precedence; None values are ignored
+
+    Returns:
+        The resolved policy
+    """
+    policy = DEFAULT_POLICIES.get(mode, ExecutionPolicy())
+    values = {}
+    for suffix, (field, cast) in _ENV_FIELDS.items():
+        raw = os.environ.get(f"VIBETERMINAL_{mode.upper()}_{suffix}")
+        if raw is None:
+            continue
+        try:
+            # 0 or a negative value disables the limit
+            value = cast(raw)
+            values[field] = value if value > 0 else None
+        except ValueError:
+            print(f"Warning: Ignoring invalid VIBETERMINAL_{mode.upper()}_{suffix}={raw!r}")
+    values.update({k: v for k, v in overrides.items() if v is not None})
+    return policy._replace(**values)
+
+
+def _make_preexec(policy: ExecutionPolicy) -> Optional[Callable[[], None]]:
+    """Build a preexec_fn that applies the policy's rlimits in the child, or None if there are none."""
+    if resource is None:
+        return None
+    limits = []
+    if policy.cpu_seconds:
+        limits.append((resource.RLIMIT_CPU, policy.cpu_seconds))
+    if policy.memory_bytes:
+        limits.append((resource.RLIMIT_AS, policy.memory_bytes))
+    if policy.open_files:
+        limits.append((resource.RLIMIT_NOFILE, policy.open_files))
+    if not limits:
+        return None
+
+    def apply_limits() -> None:
+        for limit, value in limits:
+            try:
+                _, hard = resource.getrlimit(limit)
+                if hard != resource.RLIM_INFINITY:
+                    value = min(value, hard)
+                resource.setrlimit(limit, (value, hard))
+            except (ValueError, OSError):
+                # Unsupported on this platform (e.g. RLIMIT_AS on macOS)
+                pass
+
+    return apply_limits
+
+
+def popen_kwargs(policy: ExecutionPolicy) -> Dict:
+    """Popen arguments that isolate the command in its own process group and apply rlimits."""
+    if os.name == "nt":
+        return {"creationflags": subprocess.CREATE_NEW_PROCESS_GROUP}
+    kwargs = {"start_new_session": True}
+    preexec = _make_preexec(policy)
+    if preexec:
+        kwargs["preexec_fn"] = preexec
+    return kwargs
+
+
+def kill_process_group(process: subprocess.Popen, grace: float = 2.0) -> None:
+    """Terminate a command and everything it spawned, escalating to SIGKILL after the grace period."""
+    if process.poll() is not None:
+        return
+    if os.name == "nt":
+        process.kill()
+        return
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+        try:
+            process.wait(timeout=grace)
+        except subprocess.TimeoutExpired:
+            pass
+        # Also reaps children that outlived the group leader
+        os.killpg(process.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
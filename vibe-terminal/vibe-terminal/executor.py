@@ -0,0 +1,232 @@
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, List, Optional, Union
+
+from .execution_policy import ExecutionPolicy, kill_process_group, popen_kwargs
+from .tracing import span
+
+# How much of each stream is kept in memory for AgentState and history
+DEFAULT_HEAD_BYTES = int(os.environ.get("VIBETERMINAL_CAPTURE_HEAD", 4 * 1024))
+DEFAULT_TAIL_BYTES = int(os.environ.get("VIBETERMINAL_CAPTURE_TAIL", 16 * 1024))
+CHUNK_SIZE = 64 * 1024
+
+# Serializes live forwarding so chunks from concurrent commands are not torn
+_echo_lock = threading.Lock()
+
+# Commands currently running, mapped to the reason they were stopped (if any)
+_running: Dict[subprocess.Popen, Optional[str]] = {}
+_running_lock = threading.Lock()
+
+
+class OutputCapture:
+    """Bounded capture of a byte stream.
+
+    Keeps the first `head_bytes` and the last `tail_bytes` of the stream in
+    memory, counts everything in between, and optionally spools the complete
+    stream to a temporary file. Memory use does not depend on output size.
+    """
+
+    def __init__(self, head_bytes: int = DEFAULT_HEAD_BYTES, tail_bytes: int = DEFAULT_TAIL_BYTES,
+                 spool: bool = False, name: str = "output"):
+        """Initialize the capture.
+
+        Args:
+            head_bytes: Bytes kept from the start of the stream
+            tail_bytes: Bytes kept from the end of the stream
+            spool: Also write the full stream to a temporary file
+            name: Stream name, used in the spool file name
+        """
+        self.head_bytes = head_bytes
+        self.tail_bytes = tail_bytes
+        self.head = bytearray()
+        self.tail = bytearray()
+        self.total_bytes = 0
+        self.spool_path: Optional[str] = None
+        self._spool = None
+        if spool:
+            self._spool = tempfile.NamedTemporaryFile(prefix=f"vibeterminal-{name}-", suffix=".log", delete=False)
+            self.spool_path = self._spool.name
+
+    def write(self, chunk: bytes) -> None:
+        """Record a chunk of output."""
+        self.total_bytes += len(chunk)
+        if self._spool:
+            self._spool.write(chunk)
+
+        room = self.head_bytes - len(self.head)
+        if room > 0:
+            self.head += chunk[:room]
+            chunk = chunk[room:]
+        if chunk:
+            self.tail += chunk
+            excess = len(self.tail) - self.tail_bytes
+            if excess > 0:
+                del self.tail[:excess]
+
+    def close(self) -> None:
+        """Flush and close the spool file, if any."""
+        if self._spool:
+            self._spool.close()
+            self._spool = None
+
+    @property
+    def truncated(self) -> bool:
+        """True if part of the stream was dropped from memory."""
+        return self.total_bytes > len(self.head) + len(self.tail)
+
+    def getvalue(self) -> str:
+        """Return the captured text, marking the omitted middle when truncated."""
+        head = self.head.decode("utf-8", errors="replace")
+        tail = self.tail.decode("utf-8", errors="replace")
+        if not self.truncated:
+            return head + tail
+        omitted = self.total_bytes - len(self.head) - len(self.tail)
+        marker = f"\n... [{omitted} bytes omitted"
+        if self.spool_path:
+            marker += f", full output in {self.spool_path}"
+        return f"{head}{marker}] ...\n{tail}"
+
+
+def _pump(stream, capture: OutputCapture, echo_to) -> None:
+    """Copy a pipe into the capture, forwarding each chunk live if requested."""
+    try:
+        while True:
+            chunk = stream.read1(CHUNK_SIZE)
+            if not chunk:
+                break
+            capture.write(chunk)
+            if echo_to is not None:
+                with _echo_lock:
+                    echo_to.write(chunk)
+                    echo_to.flush()
+    finally:
+        stream.close()
+        capture.close()
+
+
+def _stop(process: subprocess.Popen, reason: str, grace: float) -> None:
+    """Record why a command is being stopped and kill its process group.
+
+    A repeated Ctrl-C while stopping restarts the kill rather than leaving
+    the group running.
+    """
+    with _running_lock:
+        if process in _running and _running[process] is None:
+            _running[process] = reason
+    while True:
+        try:
+            kill_process_group(process, grace)
+            return
+        except KeyboardInterrupt:
+            continue
+
+
+def cancel_running(grace: float = 2.0) -> int:
+    """Cancel every command currently running, e.g. on Ctrl-C. Returns how many were cancelled."""
+    with _running_lock:
+        processes = list(_running)
+    for process in processes:
+        _stop(process, "cancelled", grace)
+    return len(processes)
+
+
+def run_streaming(
+    command: Union[str, List[str]],
+    shell: bool = True,
+    cwd: Optional[str] = None,
+    env: Optional[Dict[str, str]] = None,
+    echo: bool = True,
+    head_bytes: int = DEFAULT_HEAD_BYTES,
+    tail_bytes: int = DEFAULT_TAIL_BYTES,
+    spool: bool = False,
+    policy: Optional[ExecutionPolicy] = None
+) -> Dict:
+    """Run a command, forwarding its output live while keeping a bounded capture.
+
+    Args:
+        command: Shell command line, or an argv list when shell is False
+        shell: Run the command through the system shell
+        cwd: Working directory for the command
+        env: Environment for the command; defaults to the current one
+        echo: Forward stdout/stderr to the terminal as they are produced
+        head_bytes: Bytes kept from the start of each stream
+        tail_bytes: Bytes kept from the end of each stream
+        spool: Also write each full stream to a temporary file
+        policy: Timeout and resource limits; the command runs in its own
+            process group, which is killed on timeout or Ctrl-C
+
+    Returns:
+        Dict with return_code, stdout, stderr, byte counts, a truncated flag,
+        the spool file paths (None unless spooling was requested), the
+        duration, whether the command timed out or was cancelled, and the
+        limits that applied
+    """
+    policy = policy or ExecutionPolicy()
+    with span("exec", "subprocess", command=command if isinstance(command, str) else " ".join(command)) as s:
+        captures = {
+            name: OutputCapture(head_bytes, tail_bytes, spool=spool, name=name)
+            for name in ("stdout", "stderr")
+        }
+        process = subprocess.Popen(
+            command,
+            shell=shell,
+            cwd=cwd,
+            env=env,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            **popen_kwargs(policy)
+        )
+        started = time.monotonic()
+        with _running_lock:
+            _running[process] = None
+
+        echo_targets = {
+            "stdout": sys.stdout.buffer if echo else None,
+            "stderr": sys.stderr.buffer if echo else None,
+        }
+        pumps = [
+            threading.Thread(target=_pump, args=(getattr(process, name), capture, echo_targets[name]), daemon=True)
+            for name, capture in captures.items()
+        ]
+        for pump in pumps:
+            pump.start()
+        try:
+            try:
+                return_code = process.wait(timeout=policy.timeout)
+            except subprocess.TimeoutExpired:
+                _stop(process, "timeout", policy.kill_grace)
+                return_code = process.wait()
+            except KeyboardInterrupt:
+                # Ctrl-C cancels this command only; the rest of the batch carries on
+                _stop(process, "cancelled", policy.kill_grace)
+                return_code = process.wait()
+        finally:
+            with _running_lock:
+                stop_reason = _running.pop(process, None)
+        duration = time.monotonic() - started
+        for pump in pumps:
+            # A detached grandchild may keep the pipe open after the group is gone
+            pump.join(timeout=None if stop_reason is None else policy.kill_grace)
+
+        result = {
+            "return_code": return_code,
+            "stdout": captures["stdout"].getvalue(),
+            "stderr": captures["stderr"].getvalue(),
+            "stdout_bytes": captures["stdout"].total_bytes,
+            "stderr_bytes": captures["stderr"].total_bytes,
+            "truncated": captures["stdout"].truncated or captures["stderr"].truncated,
+            "spool_paths": {name: c.spool_path for name, c in captures.items()} if spool else None,
+            "duration": duration,
+            "timed_out": stop_reason == "timeout",
+            "cancelled": stop_reason == "cancelled",
+            "limits": policy.describe(),
+        }
+        s.set("return_code", return_code)
+        s.set("stdout_bytes", result["stdout_bytes"])
+        s.set("stderr_bytes", result["stderr_bytes"])
+    return result
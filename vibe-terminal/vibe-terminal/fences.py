@@ -0,0 +1,171 @@
+from typing import List, NamedTuple, Optional, Set, Tuple
+
+from .heredoc import heredoc_delimiters
+
+# Info-string languages whose blocks are shell scripts; "" is an untagged fence
+SHELL_LANGUAGES = {"", "bash", "sh", "zsh", "shell", "console", "shell-session"}
+# Languages whose blocks are treated as commands to run
+COMMAND_LANGUAGES = SHELL_LANGUAGES | {"powershell", "pwsh", "ps1", "ps", "cmd", "bat", "batch"}
+
+
+class FencedBlock(NamedTuple):
+    language: str  # First word of the info string, lowercased; "" when untagged
+    content: str
+    terminated: bool  # False if the response ended inside the block
+    line: int  # 1-based line number of the opening fence
+
+
+def _fence_run(line: str) -> Optional[Tuple[str, int, int]]:
+    """If a line starts with a fence, return (fence char, run length, indent)."""
+    stripped = line.lstrip(" ")
+    if not stripped or stripped[0] not in "`~":
+        return None
+    indent = len(line) - len(stripped)
+    length = len(stripped) - len(stripped.lstrip(stripped[0]))
+    return (stripped[0], length, indent) if length >= 3 and indent <= 3 else None
+
+
+class FenceParser:
+    """Incremental parser for fenced code blocks in markdown.
+
+    Text can be fed in arbitrary chunks as it streams in. Each complete line
+    is examined once and nothing is ever re-scanned, so parsing is linear in
+    the size of the response. Fences follow CommonMark: three or more
+    backticks or tildes, closed by a run of the same character at least as
+    long. Inside shell blocks, heredoc bodies are tracked so that a fence in
+    a file being written (e.g. a README) does not end the block. A closing
+    fence seen while a heredoc is open ends the block after all if the
+    heredoc's delimiter never follows; that is only known once the response
+    is complete, so such a block is returned by close().
+    """
+
+    def __init__(self):
+        self.blocks: List[FencedBlock] = []
+        self._partial: List[str] = []
+        self._line_number = 0
+        # State of the block being read, if any
+        self._fence: Optional[Tuple[str, int, int]] = None
+        self._language = ""
+        self._lines: List[str] = []
+        self._start_line = 0
+        self._heredocs: List[Tuple[str, bool]] = []
+        # A closing fence seen inside a heredoc: (lines before it, its line number, lines after it)
+        self._candidate: Optional[Tuple[int, int, List[str]]] = None
+
+    def feed(self, text: str) -> List[FencedBlock]:
+        """Consume a chunk of text and return the blocks it completed."""
+        completed = len(self.blocks)
+        lines = text.split("\n")
+        if len(lines) > 1:
+            if self._partial:
+                self._partial.append(lines[0])
+                lines[0] = "".join(self._partial)
+                self._partial = []
+            for line in lines[:-1]:
+                self._process_line(line[:-1] if line.endswith("\r") else line)
+        if lines[-1]:
+            self._partial.append(lines[-1])
+        return self.blocks[completed:]
+
+    @property
+    def in_block(self) -> bool:
+        """True while the text fed so far ends inside a fenced block."""
+        return self._fence is not None
+
+    def close(self) -> List[FencedBlock]:
+        """Finish parsing; a block still open is returned as unterminated."""
+        completed = len(self.blocks)
+        if self._partial:
+            line = "".join(self._partial)
+            self._partial = []
+            self._process_line(line[:-1] if line.endswith("\r") else line)
+        while self._candidate is not None:
+            # The heredoc was never closed, so its first closing fence was the block's end
+            count, line_number, rest = self._candidate
+            del self._lines[count:]
+            self._finish(terminated=True)
+            self._line_number = line_number
+            for line in rest:
+                self._process_line(line)
+        if self._fence is not None:
+            self._finish(terminated=False)
+        return self.blocks[completed:]
+
+    def _process_line(self, line: str) -> None:
+        self._line_number += 1
+        if self._fence is None:
+            self._open(line)
+            return
+
+        # Remove up to the opening fence's indentation, as CommonMark does
+        content = line
+        if self._fence[2] and line.startswith(" "):
+            content = line[min(self._fence[2], len(line) - len(line.lstrip(" "))):]
+
+        fence = _fence_run(line)
+        closes = (fence is not None and fence[0] == self._fence[0] and fence[1] >= self._fence[1]
+                  and not line[fence[2] + fence[1]:].strip())
+
+        if self._heredocs:
+            if self._candidate is not None:
+                self._candidate[2].append(line)
+            elif closes:
+                self._candidate = (len(self._lines), self._line_number, [])
+            delimiter, strip_tabs = self._heredocs[0]
+            if (content.lstrip("\t") if strip_tabs else content) == delimiter:
+                self._heredocs.pop(0)
+                # The fence was part of the heredoc body after all
+                self._candidate = None
+            self._lines.append(content)
+            return
+
+        if closes:
+            self._finish(terminated=True)
+            return
+
+        if self._language in SHELL_LANGUAGES:
+            self._heredocs.extend(heredoc_delimiters(content))
+        self._lines.append(content)
+
+    def _open(self, line: str) -> None:
+        fence = _fence_run(line)
+        if not fence:
+            return
+        info = line[fence[2] + fence[1]:].strip()
+        if fence[0] == "`" and "`" in info:
+            # Inline code such as ```ls```, not a fence
+            return
+        self._fence = fence
+        self._language = info.split()[0].lower() if info else ""
+        self._lines = []
+        self._start_line = self._line_number
+        self._heredocs = []
+
+    def _finish(self, terminated: bool) -> None:
+        self.blocks.append(FencedBlock(self._language, "\n".join(self._lines), terminated, self._start_line))
+        self._fence = None
+        self._lines = []
+        self._heredocs = []
+        self._candidate = None
+
+
+def parse_fenced_blocks(text: str) -> List[FencedBlock]:
+    """Parse every fenced code block in a complete response."""
+    parser = FenceParser()
+    parser.feed(text)
+    parser.close()
+    return parser.blocks
+
+
+def split_command_blocks(text: str, languages: Set[str] = COMMAND_LANGUAGES) -> Tuple[List[str], List[str]]:
+    """Return the non-empty contents of the blocks tagged with one of the given languages.
+
+    Returns:
+        (complete blocks, blocks the response ended inside); only the
+        complete ones are safe to run
+    """
+    complete, incomplete = [], []
+    for block in parse_fenced_blocks(text):
+        if block.language in languages and block.content.strip():
+            (complete if block.terminated else incomplete).append(block.content.strip())
+    return complete, incomplete
@@ -0,0 +1,394 @@
+import os
+import re
+import shlex
+import tempfile
+import time
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple, Union
+
+from .tracing import span
+
+# Set VIBETERMINAL_FSYNC=1 to fsync files (and their directory) after writing
+FSYNC_BY_DEFAULT = os.environ.get("VIBETERMINAL_FSYNC", "") not in ("", "0")
+
+# A heredoc operator and its delimiter: <<EOF, <<-EOF, <<'EOF', << "EOF", <<\EOF (not <<<)
+_HEREDOC_PATTERN = re.compile(
+    r"<<(?!<)(-?)[ \t]*(?:'([^']*)'|\"([^\"]*)\"|\\?([^\s;&|<>()'\"]+))"
+)
+# Characters the shell would expand inside an unquoted heredoc body
+_EXPANSION_CHARS = ("$", "`", "\\")
+# Compound commands, by the word that closes them, and what may precede a keyword
+_CLOSES = {"fi": ("if",), "done": ("for", "while", "until", "select"), "esac": ("case",), "}": ("{",), ")": ("(",)}
+_OPENERS = {"if", "for", "while", "until", "select", "case", "{"}
+_COMMAND_START = {";", ";;", "&", "&&", "||", "|", "(", ")", "{", "!", "then", "do", "else", "elif"}
+
+
+class Heredoc(NamedTuple):
+    delimiter: str
+    quoted: bool  # Quoted delimiters disable expansion in the body
+    strip_tabs: bool  # <<- strips leading tabs from body lines
+    body: str
+
+
+class FileWrite(NamedTuple):
+    """A `cat > path <<EOF` (or `>>`) command that can be performed without a shell."""
+    path: str
+    content: str
+    append: bool
+    heredoc: Heredoc
+
+
+class ScriptSegment(NamedTuple):
+    """A run of shell text, or a file write lifted out of it, in script order."""
+    shell: Optional[str]
+    write: Optional[FileWrite]
+
+
+def _heredoc_operators(line: str) -> List[re.Match]:
+    """Find heredoc operators on a line, skipping any inside quotes or arithmetic ($(( )), (( )))."""
+    if "<<" not in line:
+        return []
+    matches = []
+    quote = None
+    # Open parentheses of each arithmetic expression the scan is inside, innermost last
+    arithmetic: List[int] = []
+    i = 0
+    while i < len(line):
+        char = line[i]
+        if quote:
+            if char == quote:
+                quote = None
+            elif char == "\\" and quote == '"':
+                i += 1
+        elif arithmetic:
+            if line.startswith("((", i):
+                arithmetic.append(0)
+                i += 2
+                continue
+            if char == "(":
+                arithmetic[-1] += 1
+            elif char == ")":
+                if arithmetic[-1] == 0 and line.startswith("))", i):
+                    arithmetic.pop()
+                    i += 2
+                    continue
+                arithmetic[-1] = max(arithmetic[-1] - 1, 0)
+        elif line.startswith("((", i):
+            arithmetic.append(0)
+            i += 2
+            continue
+        elif char in ("'", '"'):
+            quote = char
+        elif char == "\\":
+            i += 1
+        elif char == "#" and (i == 0 or line[i - 1].isspace()):
+            break
+        elif line.startswith("<<", i):
+            match = _HEREDOC_PATTERN.match(line, i)
+            if match:
+                matches.append(match)
+                i = match.end()
+                continue
+            i += 2 if not line.startswith("<<<", i) else 3
+            continue
+        i += 1
+    return matches
+
+
+def heredoc_delimiters(line: str) -> List[Tuple[str, bool]]:
+    """Return (delimiter, strip_tabs) for each heredoc a command line opens, in order."""
+    return [
+        (next(g for g in match.groups()[1:] if g is not None), match.group(1) == "-")
+        for match in _heredoc_operators(line)
+    ]
+
+
+def _as_file_write(line: str, operators: List[re.Match], heredocs: List[Heredoc]) -> Optional[FileWrite]:
+    """Recognize `cat > path <<EOF` / `cat <<EOF >> path` lines whose heredoc can be written verbatim."""
+    if len(operators) != 1:
+        return None
+    heredoc = heredocs[0]
+    if not heredoc.quoted and any(c in heredoc.body for c in _EXPANSION_CHARS):
+        # The shell would expand the body; leave it to the shell
+        return None
+
+    operator = operators[0]
+    rest = line[:operator.start()] + " " + line[operator.end():]
+    try:
+        lexer = shlex.shlex(rest, posix=True, punctuation_chars=True)
+        lexer.whitespace_split = True
+        tokens = list(lexer)
+    except ValueError:
+        return None
+
+    # Expect exactly: cat, one output redirection and its target
+    if len(tokens) != 3 or tokens[0] != "cat" or tokens[1] not in (">", ">>", ">|"):
+        return None
+    path = tokens[2]
+    if any(c in path for c in "$`*?[~"):
+        return None
+    return FileWrite(path=path, content=heredoc.body, append=tokens[1] == ">>", heredoc=heredoc)
+
+
+def _nesting(line: str, stack: List[str]) -> Optional[List[str]]:
+    """Follow the compound commands (if, loops, case, groups) a command line opens and closes.
+
+    Returns the stack of compound commands still open after the line, or
+    None when the line cannot be followed (e.g. a quote spanning lines).
+    """
+    try:
+        lexer = shlex.shlex(line, posix=True, punctuation_chars=True)
+        lexer.whitespace_split = True
+        tokens = list(lexer)
+    except ValueError:
+        return None
+    stack = list(stack)
+    previous = None
+    for token in tokens:
+        command_position = previous is None or previous in _COMMAND_START
+        if token == "(":
+            stack.append(token)
+        elif token == ")" and stack and stack[-1] == "case":
+            pass  # The end of a case pattern
+        elif token in _CLOSES and (token == ")" or command_position):
+            if not stack or stack[-1] not in _CLOSES[token]:
+                return None
+            stack.pop()
+        elif token in _OPENERS and command_position:
+            stack.append(token)
+        previous = token
+    return stack
+
+
+def _continues(line: str) -> bool:
+    """Whether a command line continues on the next one (a trailing &&, ||, | or backslash)."""
+    stripped = line.rstrip()
+    return stripped.endswith(("&&", "||", "|", "\\"))
+
+
+def _scan(script: str) -> Iterator[Tuple[str, List[re.Match], List[Heredoc], List[str]]]:
+    """Walk a script once, yielding each command line with its heredocs.
+
+    Yields (line, operators, heredocs, raw_lines), where raw_lines is the
+    command line followed by the unmodified heredoc lines it consumed.
+    Unterminated heredocs run to the end of the script, as in the shell.
+    """
+    lines = script.split("\n")
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        i += 1
+        operators = _heredoc_operators(line)
+        heredocs = []
+        raw_lines = [line]
+        for operator in operators:
+            strip_tabs = operator.group(1) == "-"
+            quoted = operator.group(4) is None or operator.group(0).rstrip().endswith("\\" + operator.group(4))
+            delimiter = next(g for g in operator.groups()[1:] if g is not None)
+            body_lines = []
+            while i < len(lines):
+                body_line = lines[i]
+                i += 1
+                raw_lines.append(body_line)
+                if strip_tabs:
+                    body_line = body_line.lstrip("\t")
+                if body_line == delimiter:
+                    break
+                body_lines.append(body_line)
+            body = "".join(f"{body_line}\n" for body_line in body_lines)
+            heredocs.append(Heredoc(delimiter, quoted, strip_tabs, body))
+        yield line, operators, heredocs, raw_lines
+
+
+def parse_script(script: str) -> List[ScriptSegment]:
+    """Split a shell script into shell segments and in-process file writes.
+
+    The script is scanned once, line by line, so parsing is linear in its
+    size. Heredoc bodies are collected for every operator on a line, in
+    order, supporting quoted and unquoted delimiters, `<<-` and several
+    heredocs per script. Only writes that are top-level simple commands are
+    lifted out; if one sits inside an if, a loop, a group or an &&/|| chain,
+    the whole script is left to the shell so that the condition still holds.
+
+    Args:
+        script: A command block as produced by the model
+
+    Returns:
+        Segments in script order; adjacent shell lines are merged
+    """
+    segments: List[ScriptSegment] = []
+    shell_lines: List[str] = []
+
+    def flush_shell() -> None:
+        if shell_lines:
+            text = "\n".join(shell_lines)
+            if text.strip():
+                segments.append(ScriptSegment(shell=text, write=None))
+            shell_lines.clear()
+
+    stack: Optional[List[str]] = []
+    continued = False
+    for line, operators, heredocs, raw_lines in _scan(script):
+        write = _as_file_write(line, operators, heredocs) if operators else None
+        if write and (stack is None or stack or continued):
+            return [ScriptSegment(shell=script, write=None)]
+        if write:
+            flush_shell()
+            segments.append(ScriptSegment(shell=None, write=write))
+        else:
+            shell_lines.extend(raw_lines)
+        if stack is not None:
+            stack = _nesting(line, stack)
+        continued = _continues(line)
+
+    flush_shell()
+    return segments
+
+
+def command_lines(script: str) -> Iterator[Tuple[str, List[Heredoc]]]:
+    """Yield each command line of a script with the heredocs it opens, bodies excluded."""
+    for line, _, heredocs, _ in _scan(script):
+        yield line, heredocs
+
+
+def strip_heredoc_bodies(script: str) -> str:
+    """Drop heredoc bodies so that only the shell syntax remains."""
+    return "\n".join(line for line, _, _, _ in _scan(script))
+
+
+def parse_file_writes(script: str) -> List[FileWrite]:
+    """Return the file writes in a script, in order."""
+    return [segment.write for segment in parse_script(script) if segment.write]
+
+
+def write_file_atomic(path: str, content: Union[str, bytes], append: bool = False,
+                      fsync: bool = FSYNC_BY_DEFAULT) -> str:
+    """Write a file by replacing it with a fully written temporary file.
+
+    Readers never observe a partially written file. Appends copy the
+    existing content into the temporary file first. Symlinks are written
+    through, and an existing file keeps its permissions.
+
+    Args:
+        path: Destination path
+        content: Text (written as UTF-8) or bytes
+        append: Add to the end of the existing content instead of replacing it
+        fsync: Flush the file and its directory to disk before returning
+
+    Returns:
+        The absolute path that was written
+    """
+    target = os.path.realpath(path)
+    directory = os.path.dirname(target)
+    data = content.encode("utf-8") if isinstance(content, str) else content
+
+    try:
+        mode = os.stat(target).st_mode & 0o7777
+    except FileNotFoundError:
+        umask = os.umask(0)
+        os.umask(umask)
+        mode = 0o666 & ~umask
+
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{os.path.basename(target)}.", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            if append and os.path.exists(target):
+                with open(target, "rb") as existing:
+                    while True:
+                        chunk = existing.read(1024 * 1024)
+                        if not chunk:
+                            break
+                        f.write(chunk)
+            f.write(data)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, target)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+    if fsync and hasattr(os, "O_DIRECTORY"):
+        dir_fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+    return target
+
+
+def apply_file_write(write: FileWrite, cwd: Optional[str] = None, fsync: bool = FSYNC_BY_DEFAULT) -> str:
+    """Perform a parsed file write relative to cwd and return the absolute path written."""
+    path = write.path if os.path.isabs(write.path) else os.path.join(cwd or os.getcwd(), write.path)
+    with span("file.write", "io", path=path, bytes=len(write.content), append=write.append):
+        return write_file_atomic(path, write.content, append=write.append, fsync=fsync)
+
+
+def execute_script(
+    script: str,
+    run_shell: Callable[[str], Dict],
+    cwd: Optional[Callable[[], str]] = None,
+    fsync: bool = FSYNC_BY_DEFAULT
+) -> Dict:
+    """Run a script, performing its heredoc file writes in-process.
+
+    Shell segments go to run_shell (which must return at least return_code,
+    stdout and stderr); file writes never spawn a shell. Like the shell,
+    later segments still run after a failing one, and the last segment's
+    status is the script's status. A timed out or cancelled segment stops
+    the script.
+
+    Args:
+        script: Command block to run
+        run_shell: Runs a shell segment and returns its result dict
+        cwd: Returns the directory relative write paths resolve against;
+            called before each write so that a preceding `cd` is honoured
+        fsync: fsync each written file
+
+    Returns:
+        The combined result, with the absolute paths written in files_written
+        and failed writes (which are not echoed) in write_errors
+    """
+    segments = parse_script(script)
+    if all(segment.shell is not None for segment in segments):
+        result = run_shell(script)
+        return {**result, "files_written": [], "write_errors": []}
+
+    started = time.monotonic()
+    combined = {
+        "return_code": 0, "stdout": "", "stderr": "", "stdout_bytes": 0, "stderr_bytes": 0,
+        "truncated": False, "spool_paths": None, "timed_out": False, "cancelled": False,
+        "limits": {}, "files_written": [], "write_errors": [],
+    }
+    for segment in segments:
+        if segment.write:
+            try:
+                combined["files_written"].append(apply_file_write(segment.write, cwd() if cwd else None, fsync))
+                combined["return_code"] = 0
+            except OSError as e:
+                message = f"{segment.write.path}: {e.strerror or e}\n"
+                combined["write_errors"].append(message.strip())
+                combined["stderr"] += message
+                combined["stderr_bytes"] += len(message)
+                combined["return_code"] = 1
+            continue
+
+        result = run_shell(segment.shell)
+        for key in ("stdout", "stderr", "stdout_bytes", "stderr_bytes"):
+            combined[key] += result.get(key, 0 if key.endswith("bytes") else "")
+        for key in ("truncated", "timed_out", "cancelled"):
+            combined[key] = combined[key] or result.get(key, False)
+        combined["return_code"] = result["return_code"]
+        combined["limits"] = result.get("limits", combined["limits"])
+        combined["spool_paths"] = result.get("spool_paths") or combined["spool_paths"]
+        for key in ("cwd", "session_restarted", "session_exited"):
+            if key in result:
+                combined[key] = result[key]
+        if combined["timed_out"] or combined["cancelled"]:
+            break
+
+    combined["duration"] = time.monotonic() - started
+    return combined
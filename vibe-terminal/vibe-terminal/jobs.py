@@ -0,0 +1,336 @@
+import json
+import os
+import re
+import shutil
+import signal
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+from .config import get_cache_dir
+from .execution_policy import ExecutionPolicy, get_policy, kill_process_group, popen_kwargs
+from .heredoc import write_file_atomic
+
+TABLE_FILE = "jobs.json"
+# Set to 1 to also detach commands detected as long-running; otherwise only marked ones are
+AUTO_DETACH = os.environ.get("VIBETERMINAL_AUTO_BACKGROUND", "") not in ("", "0")
+
+# A command block whose first line is this comment always runs as a job
+_MARKER_PATTERN = re.compile(r"^\s*#\s*(?:vibeterminal:\s*)?background\s*$", re.IGNORECASE)
+
+# Commands that typically run for minutes
+LONG_RUNNING_PATTERNS = [re.compile(pattern) for pattern in (
+    r"^(?:sudo\s+)?docker(?:-compose|\s+compose)?\s+(?:build|pull|push|compose\s+up|up)\b",
+    r"^(?:sudo\s+)?podman\s+(?:build|pull|push)\b",
+    r"^rsync\b",
+    r"^scp\b.*\s-r\b",
+    r"^make\b(?!.*\b(?:clean|help)\b)",
+    r"^cmake\s+--build\b",
+    r"^ninja\b",
+    r"^cargo\s+(?:build|install|test|bench)\b",
+    r"^go\s+(?:build|install|test)\b",
+    r"^(?:mvn|\./mvnw|gradle|\./gradlew)\b",
+    r"^(?:npm|pnpm|yarn)\s+(?:install|ci|run\s+build)\b",
+    r"^(?:pip3?|python3?\s+-m\s+pip)\s+install\b",
+    r"^(?:sudo\s+)?(?:apt|apt-get|dnf|yum|pacman|brew)\s+(?:install|upgrade|update|-S)\b",
+    r"^(?:wget|curl)\b.*\s(?:-O|-o|--output)\b",
+    r"^git\s+clone\b",
+    r"^tar\s+-?c",
+    r"^ffmpeg\b",
+    r"^pytest\b",
+)]
+
+# Supervisor entry point; runs with the package's parent directory on sys.path
+_BOOTSTRAP = (
+    "import importlib, sys; sys.path.insert(0, sys.argv[1]); "
+    "importlib.import_module(sys.argv[2] + '.jobs').supervise(int(sys.argv[3]), sys.argv[4])"
+)
+
+
+def is_marked_background(command: str) -> bool:
+    """True if the model marked a command block to run in the background."""
+    first_line = command.strip().split("\n", 1)[0]
+    return bool(_MARKER_PATTERN.match(first_line))
+
+
+def job_label(command: str) -> str:
+    """The line that names a job: its first command line, skipping a `# background` marker."""
+    lines = [line for line in command.strip().split("\n") if line.strip()]
+    if lines and _MARKER_PATTERN.match(lines[0]):
+        lines = lines[1:]
+    return lines[0].strip() if lines else ""
+
+
+def is_long_running(command: str) -> bool:
+    """True if any line of a command looks like a build, download or install."""
+    for line in command.split("\n"):
+        for part in re.split(r"&&|\|\||;", line):
+            if any(pattern.match(part.strip()) for pattern in LONG_RUNNING_PATTERNS):
+                return True
+    return False
+
+
+def tail_lines(path: str, lines: int = 20, block_size: int = 8192) -> List[str]:
+    """Return the last lines of a file, reading backwards from its end."""
+    try:
+        with open(path, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            position = f.tell()
+            data = b""
+            while position > 0 and data.count(b"\n") <= lines:
+                step = min(block_size, position)
+                position -= step
+                f.seek(position)
+                data = f.read(step) + data
+    except OSError:
+        return []
+    text = data.decode("utf-8", errors="replace")
+    return text.splitlines()[-lines:] if lines > 0 else []
+
+
+def _pid_alive(pid: Optional[int]) -> bool:
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    except OSError:
+        return False
+    return True
+
+
+class JobTable:
+    """Background jobs, persisted in a JSON table next to their output files.
+
+    The table is shared by the CLI and the detached supervisor processes;
+    every read-modify-write holds an exclusive lock on a lock file and the
+    table is replaced atomically.
+    """
+
+    def __init__(self, directory: Optional[Path] = None):
+        """Initialize the table.
+
+        Args:
+            directory: Where the table and job output are kept; defaults to
+                <cache dir>/jobs
+        """
+        self.directory = Path(directory) if directory else get_cache_dir() / "jobs"
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.path = self.directory / TABLE_FILE
+
+    @contextmanager
+    def _locked(self) -> Iterator[Dict]:
+        """Yield the table for modification; it is saved when the block exits."""
+        with open(self.directory / ".lock", "a") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            table = self._read()
+            yield table
+            write_file_atomic(str(self.path), json.dumps(table, indent=2), fsync=False)
+
+    def _read(self) -> Dict:
+        try:
+            with open(self.path, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {"next_id": 1, "jobs": {}}
+
+    def create(self, command: str, cwd: str) -> Dict:
+        """Add a job in the "starting" state and return it."""
+        with self._locked() as table:
+            job_id = table["next_id"]
+            table["next_id"] += 1
+            job = {
+                "id": job_id,
+                "command": command,
+                "cwd": cwd,
+                "status": "starting",
+                "started": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                "finished": None,
+                "return_code": None,
+                "pid": None,
+                "supervisor_pid": None,
+                "stdout_path": str(self.directory / f"{job_id}.out"),
+                "stderr_path": str(self.directory / f"{job_id}.err"),
+                "notified": False,
+            }
+            table["jobs"][str(job_id)] = job
+        return job
+
+    def update(self, job_id: int, **fields) -> Optional[Dict]:
+        """Change fields of a job and return it, or None if there is no such job."""
+        with self._locked() as table:
+            job = table["jobs"].get(str(job_id))
+            if job is not None:
+                job.update(fields)
+        return job
+
+    def get(self, job_id: int) -> Optional[Dict]:
+        """Return a job, with its status refreshed."""
+        return next((job for job in self.list() if job["id"] == job_id), None)
+
+    def list(self) -> List[Dict]:
+        """Return every job, oldest first.
+
+        Jobs whose supervisor is gone without recording an exit status (for
+        example after a reboot) are marked as lost.
+        """
+        jobs = list(self._read()["jobs"].values())
+        lost = [
+            job["id"] for job in jobs
+            if job["status"] in ("starting", "running") and job["supervisor_pid"] and not _pid_alive(job["supervisor_pid"])
+        ]
+        for job_id in lost:
+            self.update(job_id, status="lost", finished=datetime.now().strftime("%Y-%m-%d %H:%M:%S"), notified=True)
+        if lost:
+            jobs = list(self._read()["jobs"].values())
+        return sorted(jobs, key=lambda job: job["id"])
+
+    def pending_notifications(self) -> List[Dict]:
+        """Return the jobs that finished since the last call, marking them as notified."""
+        with self._locked() as table:
+            finished = [job for job in table["jobs"].values() if job["finished"] and not job["notified"]]
+            for job in finished:
+                job["notified"] = True
+        return sorted(finished, key=lambda job: job["id"])
+
+    def remove_finished(self) -> int:
+        """Delete finished jobs and their output files; returns how many were removed."""
+        with self._locked() as table:
+            finished = [job for job in table["jobs"].values() if job["finished"]]
+            for job in finished:
+                del table["jobs"][str(job["id"])]
+        for job in finished:
+            for path in (job["stdout_path"], job["stderr_path"]):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+        return len(finished)
+
+
+def start_job(command: str, cwd: Optional[str] = None, table: Optional[JobTable] = None) -> Dict:
+    """Detach a command into a background job and return its table entry.
+
+    A supervisor process runs the command in its own process group with
+    stdout and stderr written to the job's output files, records its exit
+    status and sends a desktop notification when it finishes.
+    """
+    table = table or JobTable()
+    cwd = cwd or os.getcwd()
+    job = table.create(command, cwd)
+    package_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    supervisor = subprocess.Popen(
+        [sys.executable, "-c", _BOOTSTRAP, package_root, __package__, str(job["id"]), str(table.directory)],
+        cwd=cwd,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        close_fds=True,
+        **popen_kwargs(ExecutionPolicy())
+    )
+    return table.update(job["id"], supervisor_pid=supervisor.pid) or job
+
+
+def supervise(job_id: int, directory: str) -> None:
+    """Run a job to completion and record the outcome. Runs in the detached supervisor."""
+    table = JobTable(Path(directory))
+    job = table.update(job_id, supervisor_pid=os.getpid())
+    if job is None:
+        return
+    policy = get_policy("job")
+    with open(job["stdout_path"], "wb") as stdout, open(job["stderr_path"], "wb") as stderr:
+        try:
+            process = subprocess.Popen(
+                job["command"],
+                shell=True,
+                cwd=job["cwd"],
+                stdin=subprocess.DEVNULL,
+                stdout=stdout,
+                stderr=stderr,
+                **popen_kwargs(policy)
+            )
+        except OSError as e:
+            stderr.write(f"Could not start job: {e}\n".encode())
+            table.update(job_id, status="failed", return_code=-1, finished=datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+            return
+        table.update(job_id, status="running", pid=process.pid)
+        try:
+            return_code = process.wait(timeout=policy.timeout)
+            timed_out = False
+        except subprocess.TimeoutExpired:
+            kill_process_group(process, policy.kill_grace)
+            return_code = process.wait()
+            timed_out = True
+
+    current = table.update(job_id) or job
+    if timed_out:
+        status = "timed_out"
+    elif current["status"] == "killing" or return_code < 0:
+        status = "killed"
+    else:
+        status = "done" if return_code == 0 else "failed"
+    job = table.update(job_id, status=status, return_code=return_code,
+                       finished=datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+    notify_finished(job)
+
+
+def kill_job(job_id: int, grace: float = 2.0, table: Optional[JobTable] = None) -> bool:
+    """Stop a running job and everything it spawned; returns False if it was not running."""
+    table = table or JobTable()
+    job = table.get(job_id)
+    if job is None or job["status"] not in ("starting", "running"):
+        return False
+    table.update(job_id, status="killing")
+    pid = job["pid"] or job["supervisor_pid"]
+    if os.name == "nt":
+        subprocess.call(["taskkill", "/F", "/T", "/PID", str(pid)], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        return True
+    try:
+        os.killpg(pid, signal.SIGTERM)
+        deadline = time.monotonic() + grace
+        while time.monotonic() < deadline and _pid_alive(pid):
+            time.sleep(0.05)
+        os.killpg(pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+    if not job["pid"]:
+        # The supervisor died before starting the command, so nothing else records this
+        table.update(job_id, status="killed", finished=datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+    return True
+
+
+def describe_job(job: Dict) -> str:
+    """One-line summary of a job for notifications."""
+    if job["status"] == "done":
+        outcome = "finished"
+    elif job["status"] == "failed":
+        outcome = f"failed with exit code {job['return_code']}"
+    else:
+        outcome = job["status"].replace("_", " ")
+    return f"Job {job['id']} {outcome}: {job_label(job['command'])}"
+
+
+def notify_finished(job: Dict) -> None:
+    """Send a desktop notification for a finished job, if a notifier is available."""
+    message = describe_job(job)
+    try:
+        if sys.platform == "darwin" and shutil.which("osascript"):
+            script = f"display notification {json.dumps(message)} with title \"VibeTerminal\""
+            subprocess.run(["osascript", "-e", script], timeout=5, capture_output=True)
+        elif shutil.which("notify-send"):
+            subprocess.run(["notify-send", "VibeTerminal", message], timeout=5, capture_output=True)
+    except (OSError, subprocess.SubprocessError):
+        pass
@@ -1,26 +1,42 @@
-from typing import List, Dict
+from typing import Callable, List, Dict, Optional
 import os
+import time
 from rich.console import Console
 from openai import OpenAI
 
+from ..config import load_api_key
+from ..tracing import span
+from ..metrics import (LLM_REQUEST_DURATION, LLM_REQUESTS, LLM_TIME_TO_FIRST_TOKEN, LLM_TOKENS,
+                       provider_of)
+
 console = Console()
 
+DEFAULT_BASE_URL = "https://api.novita.ai/v3/openai"
+# Point the client at another OpenAI-compatible endpoint, e.g. the local stub server
+BASE_URL_ENV_VAR = "VIBETERMINAL_LLM_BASE_URL"
+
 class LLM:
     """LLM class for handling language model interactions."""
     
-    def __init__(self, model: str = "meta-llama/llama-3.1-8b-instruct", temperature: float = 0.7, max_tokens: int = 1000):
-        """Initialize the LLM with the specified model and parameters."""
+    def __init__(self, model: str = "meta-llama/llama-3.1-8b-instruct", temperature: float = 0.7, max_tokens: int = 1000,
+                 base_url: Optional[str] = None):
+        """Initialize the LLM with the specified model and parameters.
+
+        The endpoint is base_url, else $VIBETERMINAL_LLM_BASE_URL, else Novita's API.
+        """
         # Get API key from environment
-        api_key = os.getenv("NOVITA_API_KEY")
+        api_key = load_api_key()
         if not api_key:
             raise ValueError("NOVITA_API_KEY environment variable not set")
         
         try:
             # Initialize Novita client
+            self.base_url = base_url or os.environ.get(BASE_URL_ENV_VAR) or DEFAULT_BASE_URL
             self.client = OpenAI(
-                base_url="https://api.novita.ai/v3/openai",
+                base_url=self.base_url,
                 api_key=api_key
             )
+            self.provider = provider_of(self.base_url)
             self.model = model
             self.temperature = temperature
             self.max_tokens = max_tokens
@@ -37,27 +53,52 @@ class LLM:
             console.print(f"[bold red]Error initializing LLM client: {str(e)}[/bold red]")
             raise
 
+    def _record_usage(self, s, usage) -> None:
+        """Add the token counts the server reported to the trace span and the token metrics."""
+        if usage is None:
+            return
+        for kind in ("prompt", "completion"):
+            tokens = getattr(usage, f"{kind}_tokens", None)
+            s.set(f"{kind}_tokens", tokens)
+            if tokens:
+                LLM_TOKENS.labels(self.model, self.provider, kind).inc(tokens)
+
+    def _record_request(self, mode: str, started: float, outcome: str) -> None:
+        """Count a request by outcome ("ok", "empty" or "error") and observe its duration."""
+        LLM_REQUEST_DURATION.labels(self.model, self.provider, mode).observe(time.perf_counter() - started)
+        LLM_REQUESTS.labels(self.model, self.provider, outcome).inc()
+
+    @staticmethod
+    def _messages(system_prompt: str, user_query: str, chat_history: List[Dict[str, str]] = None) -> List[Dict[str, str]]:
+        """Build the message list for a chat request."""
+        messages = [{"role": "system", "content": system_prompt}]
+        
+        # Add chat history if provided
+        if chat_history:
+            for msg in chat_history:
+                messages.append(msg)
+        
+        # Add the current user query
+        messages.append({"role": "user", "content": user_query})
+        return messages
+
     def invoke_chat(self, system_prompt: str, user_query: str, chat_history: List[Dict[str, str]] = None) -> str:
         """Invoke the LLM with a chat-style prompt."""
         try:
-            # Prepare messages
-            messages = [{"role": "system", "content": system_prompt}]
-            
-            # Add chat history if provided
-            if chat_history:
-                for msg in chat_history:
-                    messages.append(msg)
-            
-            # Add the current user query
-            messages.append({"role": "user", "content": user_query})
+            messages = self._messages(system_prompt, user_query, chat_history)
+            # Errors and empty answers both return "", so the metrics tell them apart
+            started = time.perf_counter()
+            outcome = "error"
             
             try:
-                response = self.client.chat.completions.create(
-                    model=self.model,
-                    messages=messages,
-                    temperature=self.temperature,
-                    max_tokens=self.max_tokens
-                )
+                with span("llm.chat", "llm", model=self.model, messages=len(messages)) as s:
+                    response = self.client.chat.completions.create(
+                        model=self.model,
+                        messages=messages,
+                        temperature=self.temperature,
+                        max_tokens=self.max_tokens
+                    )
+                    self._record_usage(s, getattr(response, "usage", None))
                 
                 # Extract the response content
                 if response.choices and len(response.choices) > 0:
@@ -65,6 +106,7 @@ class LLM:
                     
                     # Validate the content
                     if not content or content.isspace():
+                        outcome = "empty"
                         return ""
                         
                     # Check for JSON-like content
@@ -79,14 +121,69 @@ class LLM:
                         except json.JSONDecodeError:
                             pass
                     
+                    outcome = "ok"
                     return content
                 else:
+                    outcome = "empty"
                     return ""
                     
             except Exception as e:
                 console.print(f"[bold red]Error getting response from LLM: {str(e)}[/bold red]")
                 return ""
+            finally:
+                self._record_request("chat", started, outcome)
                 
         except Exception as e:
             console.print(f"[bold red]Error in invoke_chat: {str(e)}[/bold red]")
-            return "" 
\ No newline at end of file
+            return ""
+
+    def stream_chat(self, system_prompt: str, user_query: str, chat_history: List[Dict[str, str]] = None,
+                    on_text: Optional[Callable[[str], None]] = None) -> str:
+        """Invoke the LLM with a chat-style prompt, receiving the response as it is generated.
+
+        Args:
+            system_prompt: System prompt
+            user_query: The user's message
+            chat_history: Earlier messages of the conversation
+            on_text: Called with each piece of the response as it arrives
+
+        Returns:
+            The complete response, or "" on error
+        """
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            messages = self._messages(system_prompt, user_query, chat_history)
+            with span("llm.stream", "llm", model=self.model, messages=len(messages)) as s:
+                stream = self.client.chat.completions.create(
+                    model=self.model,
+                    messages=messages,
+                    temperature=self.temperature,
+                    max_tokens=self.max_tokens,
+                    stream=True
+                )
+                parts = []
+                for chunk in stream:
+                    # Servers that report usage send it with the last chunk
+                    self._record_usage(s, getattr(chunk, "usage", None))
+                    if not chunk.choices:
+                        continue
+                    text = chunk.choices[0].delta.content
+                    if text:
+                        if not parts:
+                            ttft = time.perf_counter() - started
+                            s.event("first_token")
+                            s.set("time_to_first_token_ms", round(ttft * 1000, 1))
+                            LLM_TIME_TO_FIRST_TOKEN.labels(self.model, self.provider).observe(ttft)
+                        parts.append(text)
+                        if on_text:
+                            on_text(text)
+                s.set("chunks", len(parts))
+            outcome = "ok" if parts else "empty"
+            return "".join(parts)
+
+        except Exception as e:
+            console.print(f"[bold red]Error getting response from LLM: {str(e)}[/bold red]")
+            return ""
+        finally:
+            self._record_request("stream", started, outcome)
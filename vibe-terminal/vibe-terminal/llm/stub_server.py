@@ -0,0 +1,459 @@
+"""A local OpenAI-compatible chat completions server that replays recorded responses.
+
+Responses come from a cassette file (JSON) of recorded interactions and are
+sent with a configurable delay before the first token, token rate and error
+rate, so that VibeTerminal can be load-tested and benchmarked without a
+network. In record mode, requests are forwarded to a real endpoint and the
+responses are added to the cassette.
+
+    python -m vibe-terminal.llm.stub_server cassette.json [--port 8765] [--ttft fixed:300]
+        [--tokens-per-second normal:60,10] [--error-rate 0.05] [--record https://api.novita.ai/v3/openai]
+
+Point VibeTerminal at it with VIBETERMINAL_LLM_BASE_URL=http://127.0.0.1:8765/v1.
+"""
+import argparse
+import hashlib
+import http.client
+import json
+import random
+import re
+import sys
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterator, List, NamedTuple, Optional
+
+CASSETTE_VERSION = 1
+DEFAULT_PORT = 8765
+_WORD = re.compile(r"\s*\S+|\s+$")
+
+
+class Distribution(NamedTuple):
+    """A random distribution of delays or rates, written as "kind:parameters".
+
+    fixed:300, uniform:100,500, normal:300,50 (mean, standard deviation),
+    lognormal:300,0.5 (median, sigma of the underlying normal). Samples are
+    never negative.
+    """
+    kind: str
+    parameters: tuple
+
+    @classmethod
+    def parse(cls, spec: str) -> "Distribution":
+        kind, _, values = spec.partition(":")
+        if not values:
+            # A bare number is a fixed value
+            kind, values = "fixed", kind
+        try:
+            parameters = tuple(float(v) for v in values.split(","))
+        except ValueError:
+            raise ValueError(f"invalid distribution {spec!r}") from None
+        expected = {"fixed": 1, "uniform": 2, "normal": 2, "lognormal": 2}.get(kind)
+        if expected is None or len(parameters) != expected:
+            raise ValueError(f"invalid distribution {spec!r}; use fixed:X, uniform:A,B, normal:MEAN,SD "
+                             f"or lognormal:MEDIAN,SIGMA")
+        return cls(kind, parameters)
+
+    def sample(self, rng: random.Random) -> float:
+        if self.kind == "fixed":
+            value = self.parameters[0]
+        elif self.kind == "uniform":
+            value = rng.uniform(*self.parameters)
+        elif self.kind == "normal":
+            value = rng.gauss(*self.parameters)
+        else:
+            median, sigma = self.parameters
+            value = median * rng.lognormvariate(0, sigma)
+        return max(value, 0.0)
+
+
+def query_of(messages: List[Dict]) -> str:
+    """The last user message of a request, used to match requests whose prompts differ."""
+    for message in reversed(messages or []):
+        if message.get("role") == "user":
+            content = message.get("content")
+            return content if isinstance(content, str) else json.dumps(content, sort_keys=True)
+    return ""
+
+
+def request_key(body: Dict) -> str:
+    """Hash of everything in a request that determines the response."""
+    relevant = {"model": body.get("model"), "messages": body.get("messages")}
+    return hashlib.sha256(json.dumps(relevant, sort_keys=True).encode()).hexdigest()
+
+
+def split_tokens(text: str) -> List[str]:
+    """Split a response into word-sized chunks, for replaying a non-streamed recording as a stream."""
+    return _WORD.findall(text) or [text]
+
+
+class Cassette:
+    """Recorded interactions, matched to requests in order of preference:
+
+    1. the same model and messages (the request key)
+    2. the same last user message, for prompts that embed varying context
+    3. an interaction with no request, which answers anything
+
+    Hand-written cassettes only need a "query" in each request and a
+    "content" in each response.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.interactions: List[Dict] = []
+        self._lock = threading.Lock()
+        if path:
+            try:
+                with open(path) as f:
+                    data = json.load(f)
+            except FileNotFoundError:
+                data = {}
+            self.interactions = data.get("interactions", [])
+        self._index()
+
+    def _index(self) -> None:
+        self._by_key: Dict[str, Dict] = {}
+        self._by_query: Dict[str, Dict] = {}
+        self._default: Optional[Dict] = None
+        for interaction in self.interactions:
+            request = interaction.get("request")
+            if not request:
+                self._default = interaction
+                continue
+            if request.get("key"):
+                self._by_key.setdefault(request["key"], interaction)
+            if "query" in request:
+                self._by_query.setdefault(request["query"], interaction)
+
+    def find(self, body: Dict) -> Optional[Dict]:
+        """Return the recorded response for a request, or None."""
+        with self._lock:
+            interaction = (self._by_key.get(request_key(body))
+                           or self._by_query.get(query_of(body.get("messages", [])))
+                           or self._default)
+        return interaction["response"] if interaction else None
+
+    def add(self, body: Dict, response: Dict) -> None:
+        """Record the response to a request, replacing an earlier recording of the same request."""
+        interaction = {
+            "request": {"key": request_key(body), "model": body.get("model"),
+                        "query": query_of(body.get("messages", [])), "messages": body.get("messages")},
+            "response": response,
+        }
+        with self._lock:
+            self.interactions = [i for i in self.interactions
+                                 if (i.get("request") or {}).get("key") != interaction["request"]["key"]]
+            self.interactions.append(interaction)
+            self._index()
+
+    def save(self, path: Optional[str] = None) -> None:
+        with self._lock:
+            data = {"version": CASSETTE_VERSION, "interactions": self.interactions}
+        with open(path or self.path, "w") as f:
+            json.dump(data, f, indent=2)
+
+
+class StubServer:
+    """Serves a cassette over HTTP on a background thread.
+
+    Use as a context manager, or call start() and stop(). base_url is what
+    the OpenAI client (and VIBETERMINAL_LLM_BASE_URL) should point at.
+    """
+
+    def __init__(self, cassette: Cassette, host: str = "127.0.0.1", port: int = 0,
+                 ttft: Optional[Distribution] = None, tokens_per_second: Optional[Distribution] = None,
+                 error_rate: float = 0.0, seed: Optional[int] = None, upstream: Optional[str] = None):
+        """Initialize the server.
+
+        Args:
+            cassette: Recorded interactions to serve (and to record into)
+            host: Interface to listen on
+            port: Port to listen on; 0 picks a free one
+            ttft: Delay before the first token, in milliseconds
+            tokens_per_second: Rate at which the rest of the response is sent
+            error_rate: Fraction of requests answered with a 500 error
+            seed: Seed for the latency and error draws, for repeatable runs
+            upstream: Base URL of a real endpoint; requests are forwarded
+                there and the responses recorded into the cassette
+        """
+        self.cassette = cassette
+        self.ttft = ttft or Distribution("fixed", (0.0,))
+        self.tokens_per_second = tokens_per_second
+        self.error_rate = error_rate
+        self.upstream = upstream
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "StubServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="llm-stub", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread:
+            self._thread.join()
+
+    def __enter__(self) -> "StubServer":
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.stop()
+
+    def record(self, body: Dict, response: Dict) -> None:
+        """Add a response received from upstream to the cassette and save it right away."""
+        self.cassette.add(body, response)
+        if self.cassette.path:
+            self.cassette.save()
+
+    def _draw(self):
+        """Decide the fate of one request: (fail, ttft seconds, tokens per second or None)."""
+        with self._rng_lock:
+            self.requests += 1
+            fail = self._rng.random() < self.error_rate and not self.upstream
+            self.errors += fail
+            ttft = self.ttft.sample(self._rng) / 1000
+            rate = self.tokens_per_second.sample(self._rng) if self.tokens_per_second else None
+        return fail, ttft, rate
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body are separate writes; without this, keep-alive responses wait for delayed ACKs
+            disable_nagle_algorithm = True
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, status: int, payload: Dict) -> None:
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _error(self, status: int, message: str, kind: str = "server_error") -> None:
+                self._send_json(status, {"error": {"message": message, "type": kind, "code": status}})
+
+            def do_GET(self):
+                if self.path.rstrip("/").endswith("/models"):
+                    models = sorted({(i.get("request") or {}).get("model") or "stub"
+                                     for i in stub.cassette.interactions} or {"stub"})
+                    self._send_json(200, {"object": "list", "data": [
+                        {"id": model, "object": "model", "owned_by": "stub"} for model in models]})
+                else:
+                    self._error(404, f"no route for GET {self.path}", "not_found")
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                try:
+                    body = json.loads(self.rfile.read(length) or b"{}")
+                except ValueError:
+                    self._error(400, "request body is not JSON", "invalid_request_error")
+                    return
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    self._error(404, f"no route for POST {self.path}", "not_found")
+                    return
+                fail, ttft, rate = stub._draw()
+                if fail:
+                    time.sleep(ttft)
+                    self._error(500, "injected error")
+                    return
+                if stub.upstream:
+                    self._record(body)
+                    return
+                response = stub.cassette.find(body)
+                if response is None:
+                    self._error(404, f"no recorded response for {query_of(body.get('messages', []))[:80]!r}",
+                                "not_found")
+                    return
+                time.sleep(ttft)
+                if body.get("stream"):
+                    self._stream(body, response, rate)
+                else:
+                    if rate:
+                        time.sleep(_token_count(response) / rate)
+                    self._send_json(200, _completion(body, response))
+
+            def _stream(self, body: Dict, response: Dict, rate: Optional[float]) -> None:
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Cache-Control", "no-cache")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                self.close_connection = True
+                include_usage = (body.get("stream_options") or {}).get("include_usage")
+                first = True
+                try:
+                    for chunk in _chunks(body, response, include_usage):
+                        text = chunk["choices"][0]["delta"].get("content") if chunk["choices"] else None
+                        # The first token is due at the TTFT, the rest follow at the token rate
+                        if rate and text and not first:
+                            time.sleep(max(1, len(text) // 4) / rate)
+                        first = first and not text
+                        self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                        self.wfile.flush()
+                    self.wfile.write(b"data: [DONE]\n\n")
+                    self.wfile.flush()
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+            def _record(self, body: Dict) -> None:
+                """Forward the request upstream, relay the answer and add it to the cassette."""
+                target = urllib.parse.urlsplit(stub.upstream.rstrip("/") + "/chat/completions")
+                connection_class = (http.client.HTTPSConnection if target.scheme == "https"
+                                    else http.client.HTTPConnection)
+                connection = connection_class(target.netloc, timeout=120)
+                headers = {"Content-Type": "application/json"}
+                if self.headers.get("Authorization"):
+                    headers["Authorization"] = self.headers["Authorization"]
+                try:
+                    connection.request("POST", target.path, json.dumps(body), headers)
+                    upstream = connection.getresponse()
+                    if upstream.status != 200 or not body.get("stream"):
+                        data = upstream.read()
+                        self.send_response(upstream.status)
+                        self.send_header("Content-Type", upstream.getheader("Content-Type", "application/json"))
+                        self.send_header("Content-Length", str(len(data)))
+                        self.end_headers()
+                        self.wfile.write(data)
+                        if upstream.status == 200:
+                            stub.record(body, _recorded_completion(json.loads(data)))
+                        return
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/event-stream")
+                    self.send_header("Connection", "close")
+                    self.end_headers()
+                    self.close_connection = True
+                    chunks = []
+                    for line in upstream:
+                        self.wfile.write(line)
+                        self.wfile.flush()
+                        if line.startswith(b"data:") and line[5:].strip() != b"[DONE]":
+                            chunks.append(json.loads(line[5:]))
+                    stub.record(body, _recorded_stream(chunks))
+                except (OSError, ValueError, http.client.HTTPException) as e:
+                    self._error(502, f"upstream request failed: {e}", "upstream_error")
+                finally:
+                    connection.close()
+
+        return Handler
+
+
+def _token_count(response: Dict) -> int:
+    usage = response.get("usage") or {}
+    return usage.get("completion_tokens") or max(1, len(response.get("content", "")) // 4)
+
+
+def _usage(response: Dict) -> Dict:
+    usage = response.get("usage") or {}
+    completion = usage.get("completion_tokens", _token_count(response))
+    prompt = usage.get("prompt_tokens", 0)
+    return {"prompt_tokens": prompt, "completion_tokens": completion, "total_tokens": prompt + completion}
+
+
+def _completion(body: Dict, response: Dict) -> Dict:
+    return {
+        "id": f"chatcmpl-stub-{int(time.time() * 1000)}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model") or "stub",
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": response.get("content", "")},
+            "finish_reason": response.get("finish_reason", "stop"),
+        }],
+        "usage": _usage(response),
+    }
+
+
+def _chunks(body: Dict, response: Dict, include_usage: bool) -> Iterator[Dict]:
+    base = {"id": f"chatcmpl-stub-{int(time.time() * 1000)}", "object": "chat.completion.chunk",
+            "created": int(time.time()), "model": body.get("model") or "stub"}
+    pieces = response.get("chunks") or split_tokens(response.get("content", ""))
+    yield {**base, "choices": [{"index": 0, "delta": {"role": "assistant", "content": ""}, "finish_reason": None}]}
+    for piece in pieces:
+        yield {**base, "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]}
+    yield {**base, "choices": [{"index": 0, "delta": {}, "finish_reason": response.get("finish_reason", "stop")}]}
+    if include_usage:
+        yield {**base, "choices": [], "usage": _usage(response)}
+
+
+def _recorded_completion(data: Dict) -> Dict:
+    choice = (data.get("choices") or [{}])[0]
+    recorded = {"content": (choice.get("message") or {}).get("content") or "",
+                "finish_reason": choice.get("finish_reason") or "stop"}
+    if data.get("usage"):
+        recorded["usage"] = {k: data["usage"].get(k) for k in ("prompt_tokens", "completion_tokens")}
+    return recorded
+
+
+def _recorded_stream(chunks: List[Dict]) -> Dict:
+    pieces, finish_reason, usage = [], "stop", None
+    for chunk in chunks:
+        for choice in chunk.get("choices") or []:
+            text = (choice.get("delta") or {}).get("content")
+            if text:
+                pieces.append(text)
+            finish_reason = choice.get("finish_reason") or finish_reason
+        usage = chunk.get("usage") or usage
+    recorded = {"content": "".join(pieces), "chunks": pieces, "finish_reason": finish_reason}
+    if usage:
+        recorded["usage"] = {k: usage.get(k) for k in ("prompt_tokens", "completion_tokens")}
+    return recorded
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("cassette", help="Cassette file to serve (created in record mode)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--ttft", default="fixed:0", help="Milliseconds before the first token, e.g. lognormal:300,0.4")
+    parser.add_argument("--tokens-per-second", help="Token rate after the first token, e.g. normal:60,10 (default: instant)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with HTTP 500")
+    parser.add_argument("--seed", type=int, help="Seed for latency and error draws")
+    parser.add_argument("--record", metavar="UPSTREAM", help="Forward requests to this base URL and record the responses")
+    args = parser.parse_args(argv)
+
+    try:
+        server = StubServer(
+            Cassette(args.cassette), args.host, args.port,
+            ttft=Distribution.parse(args.ttft),
+            tokens_per_second=Distribution.parse(args.tokens_per_second) if args.tokens_per_second else None,
+            error_rate=args.error_rate, seed=args.seed, upstream=args.record,
+        )
+    except (ValueError, OSError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    mode = f"recording from {args.record}" if args.record else f"{len(server.cassette.interactions)} interactions"
+    print(f"Serving {args.cassette} ({mode}) at {server.base_url}", flush=True)
+    server.start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+        if args.record:
+            print(f"Saved {len(server.cassette.interactions)} interactions to {args.cassette}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
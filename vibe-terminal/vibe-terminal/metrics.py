@@ -0,0 +1,281 @@
+import bisect
+import os
+import re
+import threading
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+# Single-shot runs add their metrics to this node_exporter textfile-collector
+# file (or --metrics-file); long-running processes serve them with --metrics-port.
+TEXTFILE_ENV_VAR = "VIBETERMINAL_METRICS_FILE"
+PORT_ENV_VAR = "VIBETERMINAL_METRICS_PORT"
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds; LLM requests take far longer than commands, history writes far less
+LLM_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60)
+COMMAND_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 120)
+IO_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+
+_SAMPLE = re.compile(r"^([a-zA-Z_:][a-zA-Z0-9_:]*)(\{.*\})?\s+(\S+)$")
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class _CounterChild:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1) -> None:
+        with self._lock:
+            self.value += amount
+
+
+class _HistogramChild:
+    __slots__ = ("buckets", "counts", "sum", "_lock")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # The last one is +Inf
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+
+class _Metric:
+    """A metric family; labels() returns (and caches) the child for one set of label values."""
+
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values) -> object:
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} takes labels {self.labelnames}, got {key}")
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def samples(self) -> Iterator[Tuple[str, float]]:
+        """Yield (name with labels, value) for every sample, in exposition order."""
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self) -> _CounterChild:
+        return _CounterChild()
+
+    def inc(self, amount: float = 1) -> None:
+        """Increment a counter without labels."""
+        self.labels().inc(amount)
+
+    def samples(self) -> Iterator[Tuple[str, float]]:
+        for values, child in list(self._children.items()):
+            yield self.name + "_total" + _format_labels(self.labelnames, values), child.value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = COMMAND_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self) -> _HistogramChild:
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float) -> None:
+        """Observe a value in a histogram without labels."""
+        self.labels().observe(value)
+
+    def samples(self) -> Iterator[Tuple[str, float]]:
+        for values, child in list(self._children.items()):
+            with child._lock:
+                counts, total = list(child.counts), child.sum
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                yield self.name + "_bucket" + _format_labels(self.labelnames, values, le), cumulative
+            yield self.name + "_sum" + _format_labels(self.labelnames, values), total
+            yield self.name + "_count" + _format_labels(self.labelnames, values), cumulative
+
+
+class Registry:
+    """The metrics of this process, rendered in the Prometheus text format."""
+
+    def __init__(self):
+        self.metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = COMMAND_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def families(self) -> Iterator[Tuple[str, str, str, List[Tuple[str, float]]]]:
+        """Yield (name, help, type, samples) for every metric that has samples."""
+        for metric in self.metrics.values():
+            samples = list(metric.samples())
+            if samples:
+                yield metric.name, metric.documentation, metric.kind, samples
+
+    def render(self) -> str:
+        return _render(self.families())
+
+
+def _render(families) -> str:
+    lines = []
+    for name, documentation, kind, samples in families:
+        lines.append(f"# HELP {name} {documentation}")
+        lines.append(f"# TYPE {name} {kind}")
+        lines.extend(f"{sample} {_format_value(value)}" for sample, value in samples)
+    return "\n".join(lines) + "\n" if lines else ""
+
+
+def parse_text(text: str) -> Dict[str, Tuple[str, str, Dict[str, float]]]:
+    """Parse the text format written by render() into {family: (help, type, {sample: value})}."""
+    families: Dict[str, Tuple[str, str, Dict[str, float]]] = {}
+    current = None
+    for line in text.splitlines():
+        if line.startswith("# HELP "):
+            name, _, documentation = line[7:].partition(" ")
+            current = families.setdefault(name, (documentation, "untyped", {}))
+        elif line.startswith("# TYPE "):
+            name, _, kind = line[7:].partition(" ")
+            documentation, _, samples = families.get(name, ("", "", {}))
+            current = families[name] = (documentation, kind, samples)
+        elif line and not line.startswith("#") and current is not None:
+            match = _SAMPLE.match(line)
+            if match:
+                current[2][match.group(1) + (match.group(2) or "")] = float(match.group(3))
+    return families
+
+
+REGISTRY = Registry()
+
+LLM_REQUEST_DURATION = REGISTRY.histogram(
+    "vibeterminal_llm_request_duration_seconds", "Duration of LLM chat requests.",
+    ("model", "provider", "mode"), LLM_BUCKETS)
+LLM_TIME_TO_FIRST_TOKEN = REGISTRY.histogram(
+    "vibeterminal_llm_time_to_first_token_seconds", "Time until the first token of a streamed LLM response.",
+    ("model", "provider"), LLM_BUCKETS)
+LLM_REQUESTS = REGISTRY.counter(
+    "vibeterminal_llm_requests", "LLM chat requests by outcome (ok, empty or error).",
+    ("model", "provider", "outcome"))
+LLM_TOKENS = REGISTRY.counter(
+    "vibeterminal_llm_tokens", "Tokens reported by the LLM server (prompt or completion).",
+    ("model", "provider", "kind"))
+COMMAND_DURATION = REGISTRY.histogram(
+    "vibeterminal_command_duration_seconds", "Duration of executed commands by where they ran.",
+    ("runner",), COMMAND_BUCKETS)
+COMMAND_RESULTS = REGISTRY.counter(
+    "vibeterminal_command_results", "Executed commands by exit code (or timeout, cancelled, error).",
+    ("exit_code",))
+REPLAYED_RESULTS = REGISTRY.counter(
+    "vibeterminal_result_lookups", "Result cache and speculation lookups by outcome (hit or miss).",
+    ("source", "outcome"))
+HISTORY_WRITE_DURATION = REGISTRY.histogram(
+    "vibeterminal_history_write_duration_seconds", "Duration of command history writes.",
+    (), IO_BUCKETS)
+
+
+def provider_of(base_url: str) -> str:
+    """A short provider name for an API base URL, e.g. "api.novita.ai" for Novita."""
+    host = re.sub(r"^[a-z]+://", "", base_url or "").split("/")[0].split(":")[0]
+    if host in ("127.0.0.1", "localhost", "::1", "[::1]"):
+        return "local"
+    return host or "unknown"
+
+
+def write_textfile(path: str, registry: Registry = REGISTRY) -> None:
+    """Add this process's metrics to a textfile-collector file.
+
+    Counters and histograms are cumulative, so every sample is added to the
+    value already in the file; the file is replaced atomically under a lock
+    so that concurrent runs neither lose updates nor expose a partial file.
+    """
+    import fcntl
+    from .heredoc import write_file_atomic
+
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    with open(path + ".lock", "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            with open(path) as f:
+                merged = parse_text(f.read())
+        except FileNotFoundError:
+            merged = {}
+        for name, documentation, kind, samples in registry.families():
+            _, _, existing = merged.setdefault(name, (documentation, kind, {}))
+            merged[name] = (documentation, kind, existing)
+            for sample, value in samples:
+                existing[sample] = existing.get(sample, 0.0) + value
+        families = ((name, doc, kind, list(samples.items())) for name, (doc, kind, samples) in merged.items())
+        write_file_atomic(path, _render(families))
+
+
+def start_http_server(port: int, host: str = "127.0.0.1", registry: Registry = REGISTRY):
+    """Serve the registry at http://host:port/metrics on a daemon thread; returns the server."""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            data = registry.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    return server
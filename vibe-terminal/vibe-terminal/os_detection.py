@@ -1,14 +1,18 @@
 import platform
 import os
+from functools import lru_cache
 from typing import Tuple
 
 class OSDetector:
     @staticmethod
+    @lru_cache(maxsize=None)
     def get_os_info() -> Tuple[str, str]:
         """
         Returns a tuple of (os_type, shell_type)
         os_type can be: 'windows', 'macos', 'linux'
         shell_type can be: 'powershell', 'cmd', 'bash', 'zsh', 'unknown'
+
+        The result is computed once and cached for the lifetime of the process.
         """
         # Detect OS
         system = platform.system().lower()
@@ -0,0 +1,202 @@
+import hashlib
+import os
+import shlex
+import stat
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Tuple
+
+from .safety import analyze_safety
+from .command_effects import analyze_command
+
+# Opt in with --cache-results or VIBETERMINAL_RESULT_CACHE=1
+CACHE_ENV_VAR = "VIBETERMINAL_RESULT_CACHE"
+# Even with an unchanged fingerprint, results older than this are not reused
+DEFAULT_TTL = float(os.environ.get("VIBETERMINAL_RESULT_CACHE_TTL", 300))
+MAX_ENTRIES = 256
+# Directories with more entries than this are not fingerprinted (and not cached)
+MAX_DIRECTORY_ENTRIES = 5000
+
+# Read-only programs whose output does not depend on the filesystem alone
+VOLATILE_PROGRAMS = {
+    "date", "ps", "top", "uptime", "free", "df", "lsof", "who", "w", "last", "watch", "sleep",
+    "history", "printenv", "env", "hostname", "id", "whoami", "nproc", "jobs",
+}
+# Programs that read whole trees; the fingerprint only covers one directory level
+RECURSIVE_PROGRAMS = {"du", "find", "fd", "fdfind", "tree", "rg"}
+RECURSIVE_FLAGS = {"grep": "rR", "egrep": "rR", "fgrep": "rR", "ls": "R"}
+# git subcommands whose output depends only on refs and objects, not the working tree
+CACHEABLE_GIT_SUBCOMMANDS = {"log", "show", "rev-parse", "branch", "remote"}
+
+def cache_enabled(requested: bool = False) -> bool:
+    """True if result caching was requested on the command line or in the environment."""
+    return requested or os.environ.get(CACHE_ENV_VAR, "") not in ("", "0")
+
+
+def _reads_tree(words: Iterable[str]) -> bool:
+    """Whether a command reads more than its paths one level deep (recursion, git's working tree)."""
+    words = list(words)
+    for index, word in enumerate(words):
+        program = os.path.basename(word)
+        args = words[index + 1:]
+        if program in RECURSIVE_PROGRAMS:
+            return True
+        if program in RECURSIVE_FLAGS and any(
+                a == "--recursive" or a == "--dereference-recursive"
+                or (a.startswith("-") and not a.startswith("--") and set(RECURSIVE_FLAGS[program]) & set(a[1:]))
+                for a in args):
+            return True
+        if program == "git":
+            subcommand = next((a for a in args if not a.startswith("-")), None)
+            if subcommand not in CACHEABLE_GIT_SUBCOMMANDS:
+                return True
+    return False
+
+
+def _git_dir(cwd: str) -> Optional[str]:
+    directory = cwd
+    while True:
+        candidate = os.path.join(directory, ".git")
+        if os.path.exists(candidate):
+            return candidate
+        parent = os.path.dirname(directory)
+        if parent == directory:
+            return None
+        directory = parent
+
+
+def fingerprint(paths: Iterable[str]) -> Optional[str]:
+    """Hash the inode, size and mtime of each path and, for directories, of their entries.
+
+    Returns None if a directory is too large to fingerprint cheaply.
+    """
+    digest = hashlib.blake2b(digest_size=20)
+    for path in sorted(set(paths)):
+        try:
+            st = os.stat(path)
+        except OSError:
+            digest.update(f"{path}\0missing\n".encode())
+            continue
+        digest.update(f"{path}\0{st.st_ino}\0{st.st_size}\0{st.st_mtime_ns}\n".encode())
+        if not stat.S_ISDIR(st.st_mode):
+            continue
+        try:
+            with os.scandir(path) as entries:
+                children = []
+                for entry in entries:
+                    if len(children) >= MAX_DIRECTORY_ENTRIES:
+                        return None
+                    child = entry.stat(follow_symlinks=False)
+                    children.append(f"{entry.name}\0{child.st_ino}\0{child.st_size}\0{child.st_mtime_ns}\n")
+        except OSError:
+            continue
+        for child in sorted(children):
+            digest.update(child.encode())
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """In-memory cache of the results of read-only commands.
+
+    Entries are keyed by command text and working directory, and are only
+    reused while a fingerprint of the paths the command reads (one level
+    deep for directories) is unchanged and the entry is younger than the
+    TTL. Commands that read whole trees (du, find, grep -r, git status, ...)
+    are never cached, since a change deeper down would not be noticed. Any
+    command that is not read-only clears the cache. Entries live only as
+    long as the process, so changes made outside VibeTerminal between runs
+    can never be hidden by a stale entry.
+    """
+
+    def __init__(self, ttl: float = DEFAULT_TTL, max_entries: int = MAX_ENTRIES):
+        """Initialize the cache.
+
+        Args:
+            ttl: Seconds after which an entry is never reused
+            max_entries: Oldest entries beyond this many are removed
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Tuple[str, str], Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _fingerprint(self, command: str, cwd: str) -> Optional[str]:
+        """Fingerprint the paths a cacheable command reads, or return None if it is not cacheable."""
+        verdict = analyze_safety(command, cwd)
+        if not verdict.read_only:
+            return None
+        effects = analyze_command(command, cwd)
+        if effects.barrier or effects.writes:
+            return None
+        try:
+            words = shlex.split(command, comments=True)
+        except ValueError:
+            return None
+        programs = {os.path.basename(word) for word in words}
+        if programs & VOLATILE_PROGRAMS or _reads_tree(words):
+            return None
+
+        paths = set(effects.reads) | {cwd}
+        if "git" in programs:
+            git_dir = _git_dir(cwd)
+            if git_dir:
+                paths |= {os.path.join(git_dir, name) for name in ("HEAD", "index", "refs/heads", "packed-refs")}
+        return fingerprint(paths)
+
+    def get(self, command: str, cwd: str) -> Optional[Dict]:
+        """Return the cached result for a command, if it is still valid."""
+        with self._lock:
+            entry = self._entries.get((cwd, command))
+        if entry is None or time.time() - entry["created"] > self.ttl:
+            self.misses += 1
+            return None
+        current = self._fingerprint(command, cwd)
+        if current is None or current != entry["fingerprint"]:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return {**entry["result"], "cached": True, "cached_at": entry["created"]}
+
+    def put(self, command: str, cwd: str, result: Dict) -> bool:
+        """Store a successful result of a cacheable command; returns True if it was stored."""
+        # A truncated excerpt could not be replayed as the command's full output
+        if result.get("return_code") != 0 or result.get("timed_out") or result.get("cancelled") or result.get("truncated"):
+            return False
+        current = self._fingerprint(command, cwd)
+        if current is None:
+            return False
+        entry = {"fingerprint": current, "created": time.time(), "result": dict(result)}
+        with self._lock:
+            self._entries[(cwd, command)] = entry
+            self._entries.move_to_end((cwd, command))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return True
+
+    def observe(self, command: str, cwd: str, result: Dict) -> bool:
+        """Record an executed command: cache it if read-only, otherwise invalidate the cache."""
+        if not analyze_safety(command, cwd).read_only:
+            self.invalidate()
+            return False
+        return self.put(command, cwd, result)
+
+    def invalidate(self) -> int:
+        """Remove every entry; returns how many were removed."""
+        with self._lock:
+            removed = len(self._entries)
+            self._entries.clear()
+        return removed
+
+
+_cache: Optional[ResultCache] = None
+
+
+def get_cache() -> ResultCache:
+    """Return this process's cache, shared by the queries of a session (e.g. voice mode)."""
+    global _cache
+    if _cache is None:
+        _cache = ResultCache()
+    return _cache
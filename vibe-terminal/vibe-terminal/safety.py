@@ -0,0 +1,503 @@
+import hashlib
+import json
+import os
+import re
+import shlex
+from collections import OrderedDict
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from .heredoc import command_lines
+from .command_effects import (FIND_EXEC_ACTIONS, FIND_WRITE_ACTIONS, READ_ONLY_PROGRAMS, PATH_WRITING_PROGRAMS,
+                              git_reads_only, has_writing_option)
+
+# Verdict levels, from least to most severe
+SAFE = "safe"  # Read-only, or explicitly allowed by the policy
+CONFIRM = "confirm"  # Writes files or runs something the analyzer cannot vouch for
+DANGEROUS = "dangerous"  # Matches a dangerous rule
+LEVELS = (SAFE, CONFIRM, DANGEROUS)
+
+# Per-project policy file, looked up from the working directory upwards
+POLICY_FILE = os.path.join(".vibeterminal", "safety.json")
+CACHE_SIZE = 4096
+MAX_NESTING = 8  # Depth limit for `bash -c`, eval and command substitutions
+
+# Rules are regular expressions matched against normalized forms of each part of a command:
+#   command:  the program's basename and its arguments, e.g. "rm -rf /tmp/x"
+#   redirect: an output redirection, e.g. "> /dev/sda"
+#   pipeline: the programs of a pipeline, e.g. "curl | sh"
+# A pattern must match from the start, up to the end or a space ("make test"
+# matches "make test -v" but not "make test-all").
+DEFAULT_RULES: List[Tuple[str, str, str, str]] = [
+    # (level, kind, pattern, reason)
+    (DANGEROUS, "command", r"rm(?=.* (?:-[a-zA-Z]*[rR]|--recursive))(?=.* (?:-[a-zA-Z]*f|--force)).*", "recursive forced delete"),
+    (DANGEROUS, "command", r"(?:rm|mv|chmod|chown|chgrp)(?: \S+)* (?:/|/\*|~|~/|~/\*|\$HOME|\$HOME/\*)", "targets the root or home directory"),
+    (DANGEROUS, "command", r"(?:sudo|su|doas|pkexec)", "runs as another user"),
+    (DANGEROUS, "command", r"(?:mkfs(?:\.\S+)?|fdisk|sfdisk|parted|wipefs|mkswap|shred)", "formats or wipes storage"),
+    (DANGEROUS, "command", r"dd(?: \S+)* of=\S+", "dd writes raw data"),
+    (DANGEROUS, "command", r"chmod(?: -\S+)* 0+", "removes all permissions"),
+    (DANGEROUS, "command", r"chown(?: -\S+)* root(?::\S*)?", "gives files to root"),
+    (DANGEROUS, "command", r"(?:shutdown|reboot|halt|poweroff)", "stops the machine"),
+    (DANGEROUS, "command", r"kill(?: \S+)* -1", "signals every process"),
+    (DANGEROUS, "command", r"git(?: \S+)* push(?: \S+)* (?:-[a-zA-Z]*f|--force\S*|--mirror)", "force push"),
+    (DANGEROUS, "command", r"git(?: \S+)* reset(?: \S+)* --hard", "discards uncommitted work"),
+    (DANGEROUS, "command", r"git(?: \S+)* clean(?: \S+)* -[a-zA-Z]*f", "deletes untracked files"),
+    (DANGEROUS, "redirect", r"(?:>|>>|>\||&>|&>>) /dev/(?:sd|hd|nvme|disk|mmcblk|xvd|vd)\S*", "writes to a block device"),
+    (DANGEROUS, "pipeline", r"(?:\S+ \| )*(?:curl|wget)(?: \| \S+)* \| (?:ba|z|da|k)?sh", "pipes a download into a shell"),
+    (DANGEROUS, "pipeline", r"(?:\S+ \| )*(?P<fork>function:\S+) \| (?P=fork)", "fork bomb"),
+]
+
+# Read-only programs beyond those the scheduler knows about, and builtins
+# that only change the state of the shell itself
+EXTRA_READ_ONLY_PROGRAMS = {
+    "man", "[[", "id", "hostname", "printenv", "uptime", "free", "ps", "whereis", "lsof", "nproc",
+    "tac", "nl", "od", "xxd", "hexdump", "strings", "column", "tr", "comm", "paste", "fold", "seq",
+    "cd", "pushd", "popd", "export", "unset", "alias", "unalias", "set", "shopt", "declare",
+    "local", "readonly", "hash", ":",
+}
+# Commands that run the command given in their arguments
+WRAPPERS = {"sudo", "doas", "env", "command", "builtin", "exec", "nohup", "nice", "time", "timeout",
+            "stdbuf", "ionice", "xargs", "watch", "strace", "ltrace"}
+# Wrappers that run the command as another user; what it does is never just a read
+PRIVILEGE_WRAPPERS = {"sudo", "doas"}
+# Wrapper options that take a value
+WRAPPER_VALUE_OPTIONS = {
+    "sudo": {"-u", "-g", "-C", "-D", "-h", "-p", "-r", "-t", "-U"},
+    "nice": {"-n"},
+    "ionice": {"-c", "-n", "-p"},
+    "timeout": {"-s", "-k", "--signal", "--kill-after"},
+    "xargs": {"-I", "-i", "-n", "-P", "-d", "-L", "-l", "-s", "-a", "-E", "-e"},
+    "watch": {"-n", "-d"},
+    "stdbuf": {"-i", "-o", "-e"},
+    "strace": {"-e", "-o", "-p", "-s"},
+    "env": {"-u", "-C", "-S"},
+}
+SHELLS = {"sh", "bash", "zsh", "dash", "ksh", "fish"}
+# Words that introduce shell syntax rather than a command
+KEYWORDS = {"if", "then", "else", "elif", "do", "while", "until", "!", "time"}
+SYNTAX_ONLY = {"fi", "done", "esac", "for", "select", "case", "in", "function", "]]", "{", "}"}
+
+OPERATORS = sorted(
+    [";;&", "&>>", "<<<", "&&", "||", ";;", "|&", ">>", "<<", ">&", "<&", ">|", "&>", "<>", ";&",
+     ";", "&", "|", "<", ">", "(", ")"],
+    key=len, reverse=True
+)
+OUTPUT_REDIRECTS = {">", ">>", ">|", "&>", "&>>", "<>"}
+REDIRECTS = OUTPUT_REDIRECTS | {"<", "<<", "<<<", ">&", "<&"}
+PIPES = {"|", "|&"}
+IGNORED_PATHS = {"/dev/null", "/dev/stdout", "/dev/stderr", "/dev/tty"}
+_ASSIGNMENT = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*=")
+_ARITHMETIC = re.compile(r"\$\(\([^()]*(?:\([^()]*\)[^()]*)*\)\)")
+
+
+class SafetyVerdict(NamedTuple):
+    level: str  # SAFE, CONFIRM or DANGEROUS
+    reasons: Tuple[str, ...]
+    read_only: bool  # Every part of the command only reads
+    writes: Tuple[str, ...]  # Paths the command is known to write, as written in the command
+
+    @property
+    def safe(self) -> bool:
+        return self.level == SAFE
+
+
+class _Rule(NamedTuple):
+    level: str
+    kind: str
+    pattern: str
+    reason: str
+
+
+class _Analysis:
+    """Accumulates findings while walking one command."""
+
+    def __init__(self):
+        self.level = SAFE
+        self.reasons: List[str] = []
+        self.read_only = True
+        self.writes: List[str] = []
+
+    def flag(self, level: str, reason: str) -> None:
+        if LEVELS.index(level) > LEVELS.index(self.level):
+            self.level = level
+        if level == DANGEROUS:
+            # Callers skip confirmation and run read-only commands speculatively
+            self.read_only = False
+        if reason and reason not in self.reasons:
+            self.reasons.append(reason)
+
+
+def _split_operators(token: str) -> List[str]:
+    """Split a run of punctuation such as ')|' into shell operators."""
+    parts = []
+    i = 0
+    while i < len(token):
+        for operator in OPERATORS:
+            if token.startswith(operator, i):
+                parts.append(operator)
+                i += len(operator)
+                break
+        else:
+            parts.append(token[i])
+            i += 1
+    return parts
+
+
+def _tokenize(text: str) -> List[str]:
+    lexer = shlex.shlex(text, posix=True, punctuation_chars=True)
+    lexer.whitespace_split = True
+    lexer.commenters = "#"
+    tokens = []
+    for token in lexer:
+        if token and all(c in "();<>|&" for c in token):
+            tokens.extend(_split_operators(token))
+        else:
+            tokens.append(token)
+    return tokens
+
+
+def _substitutions(text: str) -> List[str]:
+    """Return the commands inside $(...) and backticks, outermost first."""
+    found = []
+    i = 0
+    while i < len(text):
+        if text.startswith("$(", i) and not text.startswith("$((", i):
+            depth, j = 1, i + 2
+            while j < len(text) and depth:
+                if text[j] == "(":
+                    depth += 1
+                elif text[j] == ")":
+                    depth -= 1
+                j += 1
+            found.append(text[i + 2:j - 1] if depth == 0 else text[i + 2:])
+            i = j
+        elif text[i] == "`":
+            end = text.find("`", i + 1)
+            found.append(text[i + 1:end] if end >= 0 else text[i + 1:])
+            i = end + 1 if end >= 0 else len(text)
+        else:
+            i += 1
+    return found
+
+
+class SafetyPolicy:
+    """Safety rules compiled once into a single regular expression.
+
+    Every normalized part of a command is matched against one alternation of
+    all rules, ordered by severity, so the first alternative that matches
+    decides the verdict for that part.
+    """
+
+    def __init__(self, rules: Iterable[Tuple[str, str, str, str]] = DEFAULT_RULES, source: Optional[str] = None):
+        """Compile the policy.
+
+        Args:
+            rules: (level, kind, pattern, reason) tuples
+            source: Where project rules came from, for messages
+        """
+        self.source = source
+        self.rules: List[_Rule] = []
+        alternatives = []
+        ordered = sorted((_Rule(*rule) for rule in rules), key=lambda rule: -LEVELS.index(rule.level))
+        for rule in ordered:
+            alternative = f"(?P<r{len(self.rules)}>{rule.kind}:(?:{rule.pattern})(?: .*)?$)"
+            try:
+                re.compile(alternative)
+            except re.error as e:
+                print(f"Warning: Ignoring invalid safety rule {rule.pattern!r}: {e}")
+                continue
+            self.rules.append(rule)
+            alternatives.append(alternative)
+        self._compiled = re.compile("|".join(alternatives), re.DOTALL) if alternatives else None
+
+    @classmethod
+    def from_file(cls, path: str) -> "SafetyPolicy":
+        """Load a project policy; its rules are added to the defaults.
+
+        The file holds lists of rules per level, each a pattern string or an
+        object with "pattern", and optionally "kind" and "reason":
+
+            {"dangerous": ["terraform destroy"], "safe": ["make test", "npm run lint"]}
+
+        Project rules cannot make a command that matches a dangerous rule safe.
+        """
+        rules = list(DEFAULT_RULES)
+        try:
+            with open(path, "r") as f:
+                data = json.load(f)
+            for level in LEVELS:
+                for entry in data.get(level, []):
+                    if isinstance(entry, str):
+                        entry = {"pattern": entry}
+                    rules.append((level, entry.get("kind", "command"), entry["pattern"],
+                                  entry.get("reason", f"{level} by project policy")))
+        except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+            print(f"Warning: Could not load safety policy {path}: {e}")
+        return cls(rules, source=path)
+
+    def match(self, kind: str, text: str) -> Optional[_Rule]:
+        """Return the most severe rule matching a normalized command part."""
+        if self._compiled is None:
+            return None
+        match = self._compiled.match(f"{kind}:{text}")
+        return self.rules[int(match.lastgroup[1:])] if match else None
+
+
+class SafetyAnalyzer:
+    """Classifies shell commands as safe, needing confirmation, or dangerous.
+
+    Commands are tokenized and split into lists, pipelines, simple commands
+    and redirections. Wrappers (sudo, env, xargs, ...), `sh -c`, eval,
+    `find -exec` and command substitutions are unwrapped and analyzed too,
+    and programs are compared by basename, so `/bin/rm  -rf` is still rm.
+    Verdicts are memoized by the hash of the command text.
+    """
+
+    def __init__(self, policy: Optional[SafetyPolicy] = None, cache_size: int = CACHE_SIZE):
+        self.policy = policy or SafetyPolicy()
+        self.cache_size = cache_size
+        self._verdicts: "OrderedDict[bytes, SafetyVerdict]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def analyze(self, command: str) -> SafetyVerdict:
+        """Return the verdict for a command or multi-line script."""
+        key = hashlib.blake2b(command.encode("utf-8", errors="surrogatepass"), digest_size=16).digest()
+        verdict = self._verdicts.get(key)
+        if verdict is not None:
+            self._verdicts.move_to_end(key)
+            self.hits += 1
+            return verdict
+
+        self.misses += 1
+        analysis = _Analysis()
+        self._analyze_script(command, analysis, depth=0)
+        verdict = SafetyVerdict(analysis.level, tuple(analysis.reasons), analysis.read_only, tuple(analysis.writes))
+        self._verdicts[key] = verdict
+        if len(self._verdicts) > self.cache_size:
+            self._verdicts.popitem(last=False)
+        return verdict
+
+    def _analyze_script(self, script: str, analysis: _Analysis, depth: int) -> None:
+        if depth > MAX_NESTING:
+            analysis.read_only = False
+            analysis.flag(CONFIRM, "nested too deeply to analyze")
+            return
+
+        pending = ""
+        heredocs = []
+        for line, line_heredocs in command_lines(script):
+            # Join continuation lines and quotes that span lines
+            pending = f"{pending}\n{line}" if pending else line
+            heredocs.extend(line_heredocs)
+            if pending.endswith("\\"):
+                pending = pending[:-1]
+                continue
+            try:
+                # Arithmetic expansion runs no commands
+                tokens = _tokenize(_ARITHMETIC.sub("0", pending))
+            except ValueError:
+                continue
+            for inner in _substitutions(pending):
+                self._analyze_script(inner, analysis, depth + 1)
+            self._analyze_tokens(tokens, heredocs, analysis, depth)
+            pending, heredocs = "", []
+
+        if pending.strip():
+            analysis.read_only = False
+            analysis.flag(CONFIRM, "could not parse the command")
+
+    def _analyze_tokens(self, tokens: List[str], heredocs: list, analysis: _Analysis, depth: int) -> None:
+        """Split tokens into pipelines of simple commands and analyze each."""
+        functions: Set[str] = set()
+        pipeline: List[str] = []
+        words: List[str] = []
+        redirects: List[Tuple[str, str]] = []
+
+        def end_command() -> None:
+            nonlocal words, redirects
+            if words or redirects:
+                program = self._analyze_command(words, redirects, functions, heredocs, analysis, depth)
+                if program:
+                    pipeline.append(program)
+            words, redirects = [], []
+
+        def end_pipeline() -> None:
+            end_command()
+            if len(pipeline) > 1:
+                self._check(analysis, "pipeline", " | ".join(pipeline))
+            pipeline.clear()
+
+        i = 0
+        while i < len(tokens):
+            token = tokens[i]
+            if token in PIPES:
+                end_command()
+            elif token == "(" and len(words) == 1 and not redirects and i + 1 < len(tokens) and tokens[i + 1] == ")":
+                # name() { ...; } defines a function
+                functions.add(words[0])
+                words = []
+                i += 1
+            elif token in {";", "&&", "||", "&", ";;", ";&", ";;&", "(", ")"}:
+                end_pipeline()
+            elif token in REDIRECTS:
+                target = tokens[i + 1] if i + 1 < len(tokens) else ""
+                if target in {"(", ")"} or target in OPERATORS:
+                    target = ""
+                else:
+                    i += 1
+                redirects.append((token, target))
+            elif token.isdigit() and i + 1 < len(tokens) and tokens[i + 1] in REDIRECTS:
+                pass  # File descriptor number of a redirection such as 2>
+            elif token in {"{", "}"} and not words:
+                end_pipeline()
+            elif token == "function" and not words and i + 1 < len(tokens):
+                functions.add(tokens[i + 1])
+                i += 1
+            elif token == "$" and i + 1 < len(tokens) and tokens[i + 1] == "(":
+                pass  # Substitutions are analyzed from the raw text
+            else:
+                words.append(token)
+            i += 1
+        end_pipeline()
+
+    def _check(self, analysis: _Analysis, kind: str, text: str) -> Optional[_Rule]:
+        rule = self.policy.match(kind, text)
+        if rule:
+            analysis.flag(rule.level, rule.reason)
+        return rule
+
+    def _analyze_command(self, words: List[str], redirects: List[Tuple[str, str]], functions: Set[str],
+                         heredocs: list, analysis: _Analysis, depth: int) -> Optional[str]:
+        """Analyze one simple command and return its program name for pipeline rules."""
+        for operator, target in redirects:
+            if operator in OUTPUT_REDIRECTS and target and target not in IGNORED_PATHS:
+                analysis.read_only = False
+                analysis.writes.append(target)
+                if not self._check(analysis, "redirect", f"{operator} {target}"):
+                    analysis.flag(CONFIRM, f"writes {target}")
+
+        words = list(words)
+        while words and (words[0] in KEYWORDS or _ASSIGNMENT.match(words[0])):
+            words.pop(0)
+        if not words:
+            return None
+        if words[0] in SYNTAX_ONLY:
+            return None
+
+        # Unwrap sudo, env, xargs, ... so the command they run is checked too
+        while words:
+            program = os.path.basename(words[0].lstrip("\\"))
+            if program not in WRAPPERS or len(words) == 1:
+                break
+            self._check(analysis, "command", " ".join([program] + words[1:]))
+            if program in PRIVILEGE_WRAPPERS:
+                analysis.read_only = False
+            words = self._strip_wrapper(program, words[1:])
+        if not words:
+            return None
+
+        program = os.path.basename(words[0].lstrip("\\"))
+        args = words[1:]
+        if program in functions:
+            analysis.read_only = False
+            analysis.flag(CONFIRM, f"calls shell function {program}")
+            return f"function:{program}"
+
+        rule = self._check(analysis, "command", " ".join([program] + args))
+
+        if program in SHELLS or program == "eval":
+            # The script is in the arguments (-c), in heredocs, or on stdin
+            if program == "eval":
+                self._analyze_script(" ".join(args), analysis, depth + 1)
+            elif "-c" in args and args.index("-c") + 1 < len(args):
+                self._analyze_script(args[args.index("-c") + 1], analysis, depth + 1)
+            for heredoc in heredocs:
+                self._analyze_script(heredoc.body, analysis, depth + 1)
+            analysis.read_only = False
+            if not rule:
+                analysis.flag(CONFIRM, f"runs a {program} script")
+            return program
+
+        if program == "find":
+            for index, arg in enumerate(args):
+                if arg in FIND_EXEC_ACTIONS:
+                    end = next((j for j in range(index + 1, len(args)) if args[j] in {";", "+", "\\;"}), len(args))
+                    self._analyze_tokens(args[index + 1:end], [], analysis, depth + 1)
+        if rule and rule.level == SAFE:
+            return program
+
+        if not self._is_read_only(program, args):
+            analysis.read_only = False
+            if program in PATH_WRITING_PROGRAMS or (program == "sed" and self._sed_in_place(args)):
+                analysis.writes.extend(a for a in args if not a.startswith("-"))
+            if not rule:
+                analysis.flag(CONFIRM, f"{program} may modify the system")
+        return program
+
+    @staticmethod
+    def _strip_wrapper(wrapper: str, args: List[str]) -> List[str]:
+        """Drop a wrapper's options (and their values) to reach the wrapped command."""
+        value_options = WRAPPER_VALUE_OPTIONS.get(wrapper, set())
+        i = 0
+        while i < len(args):
+            arg = args[i]
+            if wrapper == "env" and _ASSIGNMENT.match(arg):
+                i += 1
+            elif arg == "--":
+                return args[i + 1:]
+            elif arg.startswith("-") and len(arg) > 1:
+                i += 2 if arg in value_options else 1
+            else:
+                break
+        if wrapper == "timeout" and i < len(args):
+            i += 1  # The duration
+        return args[i:]
+
+    @staticmethod
+    def _sed_in_place(args: List[str]) -> bool:
+        return any(a.startswith("-i") or a == "--in-place" or (a.startswith("-") and not a.startswith("--") and "i" in a[1:])
+                   for a in args if a.startswith("-"))
+
+    def _is_read_only(self, program: str, args: List[str]) -> bool:
+        if program == "git":
+            return git_reads_only(args)
+        if program == "sed":
+            return not self._sed_in_place(args)
+        if program == "find":
+            return not any(a in FIND_WRITE_ACTIONS or a in FIND_EXEC_ACTIONS for a in args)
+        if has_writing_option(program, args):
+            return False
+        return program in READ_ONLY_PROGRAMS or program in EXTRA_READ_ONLY_PROGRAMS
+
+
+def find_policy_file(cwd: Optional[str] = None) -> Optional[str]:
+    """Return the nearest .vibeterminal/safety.json at or above cwd, if any."""
+    directory = os.path.abspath(cwd or os.getcwd())
+    while True:
+        candidate = os.path.join(directory, POLICY_FILE)
+        if os.path.isfile(candidate):
+            return candidate
+        parent = os.path.dirname(directory)
+        if parent == directory:
+            return None
+        directory = parent
+
+
+# Analyzers by (policy file, mtime), so edits to a policy take effect immediately
+_analyzers: Dict[Tuple[Optional[str], float], SafetyAnalyzer] = {}
+
+
+def get_analyzer(cwd: Optional[str] = None) -> SafetyAnalyzer:
+    """Return the analyzer for the project containing cwd."""
+    path = find_policy_file(cwd)
+    key = (path, os.path.getmtime(path) if path else 0.0)
+    analyzer = _analyzers.get(key)
+    if analyzer is None:
+        analyzer = SafetyAnalyzer(SafetyPolicy.from_file(path) if path else SafetyPolicy())
+        _analyzers[key] = analyzer
+    return analyzer
+
+
+def analyze_safety(command: str, cwd: Optional[str] = None) -> SafetyVerdict:
+    """Classify a command using the policy of the project containing cwd."""
+    return get_analyzer(cwd).analyze(command)
@@ -0,0 +1,364 @@
+import atexit
+import os
+import select
+import shutil
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from typing import Dict, Optional
+
+from .execution_policy import ExecutionPolicy, kill_process_group, popen_kwargs
+from .executor import DEFAULT_HEAD_BYTES, DEFAULT_TAIL_BYTES, OutputCapture
+from .tracing import span
+
+try:
+    import fcntl
+    import pty
+    import termios
+    import tty
+except ImportError:  # Windows
+    pty = None
+
+# Flags that skip rc files so that starting a session stays cheap and predictable
+NO_RC_FLAGS = {
+    "bash": ["--norc", "--noprofile"],
+    "zsh": ["-f"],
+}
+READ_SIZE = 64 * 1024
+# The command wrapper is POSIX sh, so the user's login shell (fish, tcsh, ...) is not used
+DEFAULT_SHELL = "/bin/bash" if os.path.exists("/bin/bash") else "/bin/sh"
+# stdout is a terminal, so keep pagers and colors from waiting for input or adding escapes
+PLAIN_OUTPUT_ENV = {"PAGER": "cat", "GIT_PAGER": "cat", "MANPAGER": "cat", "TERM": "dumb", "NO_COLOR": "1"}
+
+
+def _quote(text: str) -> str:
+    """Single-quote text for any POSIX shell; newlines are preserved literally."""
+    return "'" + text.replace("'", "'\\''") + "'"
+
+
+class ShellSession:
+    """A long-lived shell on a pseudo-terminal that runs commands one at a time.
+
+    Commands share the shell's state, so `cd` and `export` carry over to the
+    next command. The shell reads its commands from a control pipe; each one
+    is evaluated inside the shell and followed by a unique sentinel carrying
+    its exit status and the resulting working directory, which delimits its
+    output. The commands themselves read from the pty, which is the session's
+    controlling terminal, so prompts (sudo, apt, `read`) get the user's
+    keystrokes. If the shell dies (or is killed on timeout or Ctrl-C) a fresh
+    one is started in the last known directory.
+    """
+
+    def __init__(self, shell: Optional[str] = None, cwd: Optional[str] = None,
+                 policy: Optional[ExecutionPolicy] = None):
+        """Initialize the session; the shell itself starts on first use.
+
+        Args:
+            shell: Name or path of a POSIX shell; defaults to /bin/bash, then /bin/sh
+            cwd: Initial working directory; defaults to the current one
+            policy: Resource limits inherited by every command run in the session
+        """
+        shell = shell or DEFAULT_SHELL
+        self.shell = shell if os.path.isabs(shell) else (shutil.which(shell) or f"/bin/{shell}")
+        self.cwd = cwd or os.getcwd()
+        self.policy = (policy or ExecutionPolicy())._replace(timeout=None)
+        self.process: Optional[subprocess.Popen] = None
+        self.restarts = 0
+        self.state_changed = False  # Set once commands changed the cwd or environment of the shell
+        self._master_fd: Optional[int] = None
+        self._control_fd: Optional[int] = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def is_supported() -> bool:
+        """Sessions need POSIX pseudo-terminals."""
+        return pty is not None
+
+    @property
+    def alive(self) -> bool:
+        """True if the shell process is running."""
+        return self.process is not None and self.process.poll() is None
+
+    def _spawn(self) -> None:
+        """Start the shell reading a control pipe, with stdout on a pty and stderr on a pipe."""
+        master_fd, slave_fd = os.openpty()
+        # No newline translation on output; input keeps line editing and echo so
+        # that programs can turn echo off for passwords
+        tty.setraw(slave_fd)
+        attributes = termios.tcgetattr(slave_fd)
+        attributes[3] |= termios.ICANON | termios.ECHO | termios.ECHOE | termios.ECHOK
+        termios.tcsetattr(slave_fd, termios.TCSANOW, attributes)
+        control_read, control_write = os.pipe()
+
+        name = os.path.basename(self.shell)
+        argv = [self.shell] + NO_RC_FLAGS.get(name, [])
+        env = dict(os.environ, PS1="", PS2="", PROMPT_COMMAND="", **PLAIN_OUTPUT_ENV)
+        kwargs = popen_kwargs(self.policy)
+        apply_limits = kwargs.pop("preexec_fn", None)
+
+        def preexec() -> None:
+            if apply_limits:
+                apply_limits()
+            # Runs after setsid: the pty on stdout becomes the controlling terminal (/dev/tty)
+            fcntl.ioctl(1, termios.TIOCSCTTY, 0)
+
+        try:
+            # stdin and stderr are pipes, so the shell runs non-interactively: no prompts or job control
+            self.process = subprocess.Popen(
+                argv,
+                stdin=control_read,
+                stdout=slave_fd,
+                stderr=subprocess.PIPE,
+                cwd=self.cwd if os.path.isdir(self.cwd) else None,
+                env=env,
+                preexec_fn=preexec,
+                **kwargs
+            )
+        except BaseException:
+            os.close(master_fd)
+            os.close(control_write)
+            raise
+        finally:
+            os.close(slave_fd)
+            os.close(control_read)
+        self._master_fd = master_fd
+        self._control_fd = control_write
+
+    def _ensure_started(self) -> bool:
+        """Start or restart the shell; returns True if a dead shell was replaced."""
+        if self.alive:
+            return False
+        restarted = self.process is not None
+        self._close_fds()
+        if restarted:
+            self.restarts += 1
+        self._spawn()
+        return restarted
+
+    def _close_fds(self) -> None:
+        for fd in (self._master_fd, self._control_fd):
+            if fd is not None:
+                os.close(fd)
+        self._master_fd = self._control_fd = None
+        if self.process is not None and self.process.stderr:
+            self.process.stderr.close()
+
+    def _write(self, fd: int, data: bytes) -> None:
+        view = memoryview(data)
+        while view:
+            written = os.write(fd, view)
+            view = view[written:]
+
+    def close(self) -> None:
+        """Terminate the shell and release the pty."""
+        if self.alive:
+            kill_process_group(self.process, grace=0.5)
+            self.process.wait()
+        self._close_fds()
+        self.process = None
+
+    def run(
+        self,
+        command: str,
+        echo: bool = True,
+        head_bytes: int = DEFAULT_HEAD_BYTES,
+        tail_bytes: int = DEFAULT_TAIL_BYTES,
+        spool: bool = False,
+        timeout: Optional[float] = None
+    ) -> Dict:
+        """Run a command in the session.
+
+        Args:
+            command: Shell command or multi-line script
+            echo: Forward output to the terminal as it is produced
+            head_bytes: Bytes kept from the start of each stream
+            tail_bytes: Bytes kept from the end of each stream
+            spool: Also write each full stream to a temporary file
+            timeout: Wall-clock seconds before the session is killed and restarted
+
+        Returns:
+            The same fields as executor.run_streaming, plus the working
+            directory after the command, whether the shell was restarted
+            before it and whether the command ended the shell (`exit`, or a
+            failure under `set -e`), which loses the session's state
+        """
+        with span("shell.run", "subprocess", command=command, shell=self.shell) as s:
+            with self._lock:
+                s.event("session_acquired")
+                result = self._run(command, echo, head_bytes, tail_bytes, spool, timeout)
+            s.set("return_code", result["return_code"])
+            s.set("restarted", result.get("session_restarted", False))
+        return result
+
+    def _run(self, command, echo, head_bytes, tail_bytes, spool, timeout) -> Dict:
+        restarted = self._ensure_started()
+        captures = {
+            name: OutputCapture(head_bytes, tail_bytes, spool=spool, name=name)
+            for name in ("stdout", "stderr")
+        }
+        marker = f"__VIBE_{uuid.uuid4().hex}__".encode()
+        # Keystrokes are forwarded only when someone is at the terminal;
+        # otherwise commands that read stdin get end-of-file instead of waiting
+        try:
+            keyboard = sys.stdin.fileno() if echo and sys.stdin.isatty() else None
+        except (AttributeError, ValueError, OSError):
+            keyboard = None
+        # eval keeps syntax errors from killing the shell; the command's stdin
+        # is the pty (fd 1) or /dev/null, never the control pipe
+        script = (
+            f"__vibe_cmd={_quote(command)}\n"
+            f"{{ eval \"$__vibe_cmd\"\n}} {'<&1' if keyboard is not None else '</dev/null'}\n"
+            "__vibe_status=$?\n"
+            f"printf '\\n{marker.decode()} %d %s\\n' \"$__vibe_status\" \"$PWD\"\n"
+            f"printf '\\n{marker.decode()}\\n' >&2\n"
+        )
+
+        streams = {
+            self._master_fd: ("stdout", sys.stdout.buffer if echo else None),
+            self.process.stderr.fileno(): ("stderr", sys.stderr.buffer if echo else None),
+        }
+        pending = {name: b"" for name in captures}
+        done = {name: False for name in captures}
+        status_line = b""
+        stop_reason = None
+        exited = False
+        started = time.monotonic()
+        deadline = started + timeout if timeout else None
+        # Output is held back by this much so a marker split across reads is never forwarded
+        hold_back = len(marker) + 1
+        terminal_mode = None
+
+        try:
+            if keyboard is not None:
+                # Keys go to the pty as they are typed; it echoes and edits lines itself
+                terminal_mode = termios.tcgetattr(keyboard)
+                tty.setcbreak(keyboard)
+            self._write(self._control_fd, script.encode())
+            while not all(done.values()):
+                wait = None if deadline is None else max(0.0, deadline - time.monotonic())
+                if wait == 0.0:
+                    stop_reason = "timeout"
+                    break
+                fds = [fd for fd, (name, _) in streams.items() if not done[name]]
+                ready, _, _ = select.select(fds + ([keyboard] if keyboard is not None else []), [], [], wait)
+                for fd in ready:
+                    if fd == keyboard:
+                        keys = os.read(keyboard, READ_SIZE)
+                        if keys:
+                            self._write(self._master_fd, keys)
+                        else:
+                            keyboard = None
+                        continue
+                    name, echo_to = streams[fd]
+                    try:
+                        chunk = os.read(fd, READ_SIZE)
+                    except OSError:
+                        chunk = b""
+                    if not chunk:
+                        # The shell exited before printing the sentinel
+                        exited = True
+                        done = {n: True for n in done}
+                        break
+                    data = pending[name] + chunk
+                    index = data.find(b"\n" + marker)
+                    if index >= 0:
+                        output, rest = data[:index], data[index + 1 + len(marker):]
+                        if name == "stdout":
+                            status_line = rest
+                        done[name] = True
+                        pending[name] = b""
+                    else:
+                        output, pending[name] = data[:-hold_back], data[-hold_back:]
+                        if len(data) <= hold_back:
+                            output, pending[name] = b"", data
+                    if output:
+                        captures[name].write(output)
+                        if echo_to is not None:
+                            echo_to.write(output)
+                            echo_to.flush()
+            # The status line may arrive in a later read than the marker
+            while stop_reason is None and not exited and b"\n" not in status_line:
+                ready, _, _ = select.select([self._master_fd], [], [], 1.0)
+                try:
+                    chunk = os.read(self._master_fd, READ_SIZE) if ready else b""
+                except OSError:
+                    chunk = b""
+                if not chunk:
+                    break
+                status_line += chunk
+        except KeyboardInterrupt:
+            stop_reason = "cancelled"
+        finally:
+            if terminal_mode is not None:
+                termios.tcsetattr(sys.stdin.fileno(), termios.TCSADRAIN, terminal_mode)
+
+        if stop_reason:
+            # The running command shares the shell's process group; replace the whole session
+            while True:
+                try:
+                    kill_process_group(self.process, grace=0.5)
+                    self.process.wait()
+                    break
+                except KeyboardInterrupt:
+                    continue
+        for capture in captures.values():
+            capture.close()
+
+        return_code = None
+        if stop_reason is None and status_line.strip():
+            fields = status_line.split(b"\n", 1)[0].decode("utf-8", errors="replace").strip().split(" ", 1)
+            return_code = int(fields[0])
+            new_cwd = fields[1] if len(fields) > 1 else self.cwd
+            if new_cwd != self.cwd:
+                self.state_changed = True
+                self.cwd = new_cwd
+        if return_code is None:
+            # The command ended the shell (e.g. `exit 3`) or the session was killed
+            return_code = self.process.wait()
+
+        return {
+            "return_code": return_code,
+            "stdout": captures["stdout"].getvalue(),
+            "stderr": captures["stderr"].getvalue(),
+            "stdout_bytes": captures["stdout"].total_bytes,
+            "stderr_bytes": captures["stderr"].total_bytes,
+            "truncated": captures["stdout"].truncated or captures["stderr"].truncated,
+            "spool_paths": {name: c.spool_path for name, c in captures.items()} if spool else None,
+            "duration": time.monotonic() - started,
+            "timed_out": stop_reason == "timeout",
+            "cancelled": stop_reason == "cancelled",
+            "limits": self.policy._replace(timeout=timeout).describe(),
+            "cwd": self.cwd,
+            "session_restarted": restarted,
+            "session_exited": stop_reason is None and not self.alive,
+        }
+
+
+_sessions: Dict[str, ShellSession] = {}
+
+
+def get_session(shell: Optional[str] = None, policy: Optional[ExecutionPolicy] = None) -> ShellSession:
+    """Return this process's session for a shell, creating it on first use.
+
+    A session whose resource limits differ from the requested policy is
+    replaced, since the limits are applied when the shell starts.
+    """
+    key = shell or DEFAULT_SHELL
+    limits = (policy or ExecutionPolicy())._replace(timeout=None)
+    session = _sessions.get(key)
+    if session is not None and session.policy != limits:
+        session.close()
+        session = ShellSession(key, cwd=session.cwd, policy=limits)
+        _sessions[key] = session
+    elif session is None:
+        session = ShellSession(key, policy=limits)
+        _sessions[key] = session
+    return session
+
+
+@atexit.register
+def _close_sessions() -> None:
+    for session in _sessions.values():
+        session.close()
@@ -0,0 +1,207 @@
+import json
+import os
+import shlex
+import threading
+from typing import Dict, List, Optional
+
+from .config import get_cache_dir
+from .command_history import CommandHistory
+from .execution_policy import ExecutionPolicy, get_policy
+from .executor import run_streaming
+from .heredoc import write_file_atomic
+from .safety import analyze_safety
+from .command_effects import analyze_command
+
+# Opt in with --speculate or VIBETERMINAL_SPECULATE=1
+SPECULATE_ENV_VAR = "VIBETERMINAL_SPECULATE"
+MAX_PREDICTIONS = 3
+# A command must have been run at least this often in the directory to be predicted
+MIN_COUNT = 2
+STATS_FILE = "speculation.json"
+
+# Read-only programs that are still not worth running unasked
+EXCLUDED_PROGRAMS = {"sleep", "watch", "top", "less", "more", "man", "tail", "yes", "cat"}
+
+
+def speculation_enabled(requested: bool = False) -> bool:
+    """True if speculative execution was requested on the command line or in the environment."""
+    return requested or os.environ.get(SPECULATE_ENV_VAR, "") not in ("", "0")
+
+
+def is_speculatable(command: str, cwd: str) -> bool:
+    """True if a command may be run before the user (or the model) asked for it.
+
+    Only single-line commands that the safety analyzer classifies as
+    read-only and that neither write, change shell state nor act as a
+    scheduling barrier qualify.
+    """
+    if "\n" in command.strip() or not analyze_safety(command, cwd).read_only:
+        return False
+    effects = analyze_command(command, cwd)
+    if effects.writes or effects.barrier or effects.shell_state:
+        return False
+    try:
+        words = shlex.split(command, comments=True)
+    except ValueError:
+        return False
+    return bool(words) and not {os.path.basename(word) for word in words} & EXCLUDED_PROGRAMS
+
+
+class SpeculationStats:
+    """Cumulative used/wasted counts, overall and per command, kept in the cache directory."""
+
+    def __init__(self, path: Optional[str] = None):
+        """Initialize the stats.
+
+        Args:
+            path: Stats file; defaults to <cache dir>/speculation.json
+        """
+        self.path = path or str(get_cache_dir() / STATS_FILE)
+        self.data: Dict = {"used": 0, "wasted": 0, "commands": {}}
+        try:
+            with open(self.path, "r") as f:
+                self.data.update(json.load(f))
+        except (OSError, ValueError):
+            pass
+
+    def hit_rate(self, command: str) -> float:
+        """Smoothed fraction of the speculative runs of a command that were used."""
+        counts = self.data["commands"].get(command, {})
+        used, wasted = counts.get("used", 0), counts.get("wasted", 0)
+        return (used + 1) / (used + wasted + 2)
+
+    def record(self, command: str, used: bool) -> None:
+        key = "used" if used else "wasted"
+        self.data[key] += 1
+        counts = self.data["commands"].setdefault(command, {"used": 0, "wasted": 0})
+        counts[key] += 1
+
+    def save(self) -> None:
+        try:
+            write_file_atomic(self.path, json.dumps(self.data, indent=2), fsync=False)
+        except OSError as e:
+            print(f"Warning: Could not save speculation stats: {e}")
+
+
+class SpeculativeExecutor:
+    """Runs likely read-only commands while the LLM request is in flight.
+
+    Candidates are the commands most often run in the current directory
+    according to the command history, weighted by how often their
+    speculative results were used before. Each runs in a background thread
+    under the strict "speculative" execution policy with its output
+    captured, not shown. When the model then asks for one of them, its
+    result is taken instead of running the command again.
+    """
+
+    def __init__(self, cwd: Optional[str] = None, history: Optional[CommandHistory] = None,
+                 max_predictions: int = MAX_PREDICTIONS, policy: Optional[ExecutionPolicy] = None,
+                 stats: Optional[SpeculationStats] = None):
+        """Initialize the executor.
+
+        Args:
+            cwd: Directory the commands are predicted for and run in
+            history: Command history to predict from
+            max_predictions: Most commands run speculatively per request
+            policy: Limits for speculative runs; defaults to the "speculative" policy
+            stats: Used/wasted counts; loaded from the cache directory by default
+        """
+        self.cwd = cwd or os.getcwd()
+        self.history = history if history is not None else CommandHistory()
+        self.max_predictions = max_predictions
+        self.policy = policy or get_policy("speculative")
+        self.stats = stats if stats is not None else SpeculationStats()
+        self.used = 0
+        self.wasted = 0
+        self._results: Dict[str, Dict] = {}
+        self._threads: Dict[str, threading.Thread] = {}
+        self._lock = threading.Lock()
+        self._finished = False
+
+    def predict(self) -> List[str]:
+        """Return the commands to run speculatively, most likely first."""
+        counts = self.history.command_counts(self.cwd)
+        scored = [
+            (count * self.stats.hit_rate(command), command)
+            for command, count in counts.items()
+            if count >= MIN_COUNT
+        ]
+        scored.sort(key=lambda item: item[0], reverse=True)
+        predictions = []
+        for _, command in scored:
+            if len(predictions) >= self.max_predictions:
+                break
+            if is_speculatable(command, self.cwd):
+                predictions.append(command)
+        return predictions
+
+    def start(self) -> List[str]:
+        """Start the predicted commands in the background; returns the commands started."""
+        commands = self.predict()
+        for command in commands:
+            thread = threading.Thread(target=self._run, args=(command,), daemon=True)
+            self._threads[command] = thread
+            thread.start()
+        return commands
+
+    def _run(self, command: str) -> None:
+        try:
+            result = run_streaming(command, cwd=self.cwd, echo=False, policy=self.policy)
+        except OSError:
+            return
+        with self._lock:
+            # An invalidated run keeps its None marker
+            self._results.setdefault(command, result)
+
+    def invalidate(self) -> None:
+        """Discard every prefetched result, e.g. because a command wrote to the filesystem."""
+        with self._lock:
+            discarded = [command for command in self._threads if command not in self._results or self._results[command]]
+            for command in discarded:
+                self._results[command] = None
+        for command in discarded:
+            self._record(command, used=False)
+
+    def take(self, command: str, cwd: str) -> Optional[Dict]:
+        """Return the prefetched result for a command, or None if it must be run normally.
+
+        Waits for a speculative run that is still in progress; it was started
+        earlier, so this is never slower than starting the command now.
+        """
+        thread = self._threads.get(command)
+        if thread is None or self._finished or os.path.realpath(cwd) != os.path.realpath(self.cwd):
+            return None
+        thread.join()
+        with self._lock:
+            result = self._results.get(command)
+            if result is None:
+                return None
+            self._results[command] = None
+        if (result["return_code"] != 0 or result["timed_out"] or result["cancelled"]
+                or result["truncated"]):
+            self._record(command, used=False)
+            return None
+        self._record(command, used=True)
+        return {**result, "files_written": [], "write_errors": [], "speculative": True}
+
+    def _record(self, command: str, used: bool) -> None:
+        with self._lock:
+            if used:
+                self.used += 1
+            else:
+                self.wasted += 1
+            self.stats.record(command, used)
+
+    def finish(self) -> None:
+        """Count every result that was not taken as wasted and save the stats."""
+        if self._finished:
+            return
+        self._finished = True
+        with self._lock:
+            unused = [command for command in self._threads if self._results.get(command, True) is not None]
+            for command in unused:
+                self._results[command] = None
+        for command in unused:
+            self._record(command, used=False)
+        if self._threads:
+            self.stats.save()
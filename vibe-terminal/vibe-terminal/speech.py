@@ -0,0 +1,362 @@
+import json
+import math
+import os
+import time
+import wave
+from array import array
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional, Type, Union
+
+from .config import get_data_dir
+
+SAMPLE_RATE = 16000
+FRAME_MS = 30
+# Recognition backend: "vosk" (offline, streaming) or "google" (online, whole utterance)
+STT_ENV_VAR = "VIBETERMINAL_STT"
+# Directory of an unpacked Vosk model, e.g. vosk-model-small-en-us-0.15
+VOSK_MODEL_ENV_VAR = "VIBETERMINAL_VOSK_MODEL"
+# A WAV file to read speech from instead of the microphone
+VOICE_INPUT_ENV_VAR = "VIBETERMINAL_VOICE_INPUT"
+
+
+class SpeechError(Exception):
+    """Raised when no recognition backend or audio source can be used."""
+
+
+class Utterance(NamedTuple):
+    """One recognized utterance."""
+    text: str
+    duration: float  # Seconds of audio from the start to the end of speech
+    latency: float  # Seconds from the end of speech to the final text
+
+
+def frame_rms(frame: bytes) -> float:
+    """Root mean square of a frame of 16-bit little-endian mono samples."""
+    samples = array("h", frame[:len(frame) - len(frame) % 2])
+    if not samples:
+        return 0.0
+    return math.sqrt(sum(s * s for s in samples) / len(samples))
+
+
+class MicrophoneSource:
+    """16 kHz mono frames from the default microphone, through PyAudio.
+
+    The stream is opened once and stays open until close(), so consecutive
+    utterances are captured without reopening the device.
+    """
+
+    def __init__(self, sample_rate: int = SAMPLE_RATE, frame_ms: int = FRAME_MS):
+        try:
+            import pyaudio
+        except ImportError:
+            raise SpeechError("PyAudio is not installed; install it with 'pip install pyaudio'")
+        self.sample_rate = sample_rate
+        self.frame_samples = sample_rate * frame_ms // 1000
+        self._audio = pyaudio.PyAudio()
+        self._stream = self._audio.open(format=pyaudio.paInt16, channels=1, rate=sample_rate, input=True,
+                                        frames_per_buffer=self.frame_samples)
+
+    def frames(self) -> Iterator[bytes]:
+        """Yield frames as they are captured; never ends on its own."""
+        while True:
+            yield self._stream.read(self.frame_samples, exception_on_overflow=False)
+
+    def close(self) -> None:
+        self._stream.stop_stream()
+        self._stream.close()
+        self._audio.terminate()
+
+
+class WavFileSource:
+    """Frames read from a 16-bit mono WAV file, for tests and benchmarks.
+
+    With realtime, frames are delivered at the pace they were recorded, as a
+    microphone would deliver them, so latencies are comparable. The file is
+    followed by silence so that the end of the last utterance is detected.
+    """
+
+    def __init__(self, path: str, frame_ms: int = FRAME_MS, realtime: bool = False, trailing_silence: float = 2.0):
+        self.path = path
+        with wave.open(path, "rb") as wav:
+            if wav.getsampwidth() != 2 or wav.getnchannels() != 1:
+                raise SpeechError(f"{path}: expected 16-bit mono audio")
+            self.sample_rate = wav.getframerate()
+            self._data = wav.readframes(wav.getnframes())
+        self.frame_samples = self.sample_rate * frame_ms // 1000
+        self.realtime = realtime
+        self.trailing_silence = trailing_silence
+        self._position = 0
+
+    def frames(self) -> Iterator[bytes]:
+        """Yield the remaining frames of the file, then silence; resumes where the last call stopped."""
+        size = self.frame_samples * 2
+        frame_seconds = self.frame_samples / self.sample_rate
+        started = time.monotonic()
+        delivered = 0
+        silence = bytes(size)
+        silent_frames = int(self.trailing_silence / frame_seconds)
+        while self._position < len(self._data) + silent_frames * size:
+            if self._position < len(self._data):
+                frame = self._data[self._position:self._position + size].ljust(size, b"\0")
+            else:
+                frame = silence
+            self._position += size
+            if self.realtime:
+                delay = started + delivered * frame_seconds - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            delivered += 1
+            yield frame
+
+    def close(self) -> None:
+        pass
+
+
+class EnergyVAD:
+    """Energy-based voice activity detection with end-of-speech endpointing.
+
+    The noise floor is calibrated once per session from the first frames;
+    speech starts after a few consecutive frames above the threshold and ends
+    after a stretch of silence.
+    """
+
+    def __init__(self, frame_ms: int = FRAME_MS, silence_ms: int = 700, start_ms: int = 90,
+                 calibration_ms: int = 500, ratio: float = 3.0, min_threshold: float = 300.0,
+                 max_utterance_ms: int = 15000):
+        """Initialize the detector.
+
+        Args:
+            frame_ms: Length of each frame
+            silence_ms: Silence that ends an utterance
+            start_ms: Voiced audio needed to start one
+            calibration_ms: Audio used to measure the noise floor
+            ratio: Threshold as a multiple of the noise floor
+            min_threshold: Lowest threshold, for near-silent rooms
+            max_utterance_ms: Utterances are cut off after this long
+        """
+        self.frame_ms = frame_ms
+        self.silence_frames = max(silence_ms // frame_ms, 1)
+        self.start_frames = max(start_ms // frame_ms, 1)
+        self.calibration_frames = max(calibration_ms // frame_ms, 1)
+        self.ratio = ratio
+        self.min_threshold = min_threshold
+        self.max_frames = max_utterance_ms // frame_ms
+        self.threshold: Optional[float] = None
+
+    def calibrate(self, frames: List[bytes]) -> float:
+        """Set the threshold from frames of background noise and return it."""
+        noise = sum(frame_rms(frame) for frame in frames) / max(len(frames), 1)
+        self.threshold = max(self.min_threshold, noise * self.ratio)
+        return self.threshold
+
+    def is_speech(self, frame: bytes) -> bool:
+        return frame_rms(frame) >= (self.threshold or self.min_threshold)
+
+
+class Recognizer:
+    """A speech recognition backend fed one utterance at a time.
+
+    Subclasses receive the audio frames of an utterance as they are
+    captured through accept(), may return a partial transcript from it,
+    and return the final text from finish().
+    """
+
+    name = "base"
+
+    def start(self, sample_rate: int) -> None:
+        """Begin a new utterance."""
+
+    def accept(self, frame: bytes) -> Optional[str]:
+        """Process a frame; returns the partial transcript if it changed."""
+        return None
+
+    def finish(self) -> str:
+        """End the utterance and return its text."""
+        raise NotImplementedError
+
+
+class VoskRecognizer(Recognizer):
+    """Offline streaming recognition on the CPU with Vosk (Kaldi)."""
+
+    name = "vosk"
+
+    def __init__(self, model_path: Optional[str] = None):
+        try:
+            import vosk
+        except ImportError:
+            raise SpeechError("Vosk is not installed; install it with 'pip install vosk'")
+        model_path = model_path or os.environ.get(VOSK_MODEL_ENV_VAR) or str(get_data_dir() / "vosk-model")
+        if not os.path.isdir(model_path):
+            raise SpeechError(f"No Vosk model at {model_path}; download one from https://alphacephei.com/vosk/models "
+                              f"and unpack it there or set {VOSK_MODEL_ENV_VAR}")
+        vosk.SetLogLevel(-1)
+        self._vosk = vosk
+        # Loading the model takes seconds; it is done once per session
+        self._model = vosk.Model(model_path)
+        self._recognizer = None
+        self._partial = ""
+
+    def start(self, sample_rate: int) -> None:
+        self._recognizer = self._vosk.KaldiRecognizer(self._model, sample_rate)
+        self._partial = ""
+
+    def accept(self, frame: bytes) -> Optional[str]:
+        if self._recognizer.AcceptWaveform(frame):
+            text = json.loads(self._recognizer.Result()).get("text", "")
+            # Vosk finished a phrase inside the utterance; keep it as the partial prefix
+            self._partial = f"{self._partial} {text}".strip() if text else self._partial
+            return self._partial or None
+        partial = json.loads(self._recognizer.PartialResult()).get("partial", "")
+        return f"{self._partial} {partial}".strip() if partial else None
+
+    def finish(self) -> str:
+        text = json.loads(self._recognizer.FinalResult()).get("text", "")
+        return f"{self._partial} {text}".strip()
+
+
+class GoogleRecognizer(Recognizer):
+    """Online recognition of the whole utterance through SpeechRecognition's Google Web Speech API."""
+
+    name = "google"
+
+    def __init__(self, language: str = "en-US"):
+        try:
+            import speech_recognition
+        except ImportError:
+            raise SpeechError("SpeechRecognition is not installed; install it with 'pip install SpeechRecognition'")
+        self._sr = speech_recognition
+        self._recognizer = speech_recognition.Recognizer()
+        self.language = language
+        self._frames: List[bytes] = []
+        self._sample_rate = SAMPLE_RATE
+
+    def start(self, sample_rate: int) -> None:
+        self._frames = []
+        self._sample_rate = sample_rate
+
+    def accept(self, frame: bytes) -> Optional[str]:
+        self._frames.append(frame)
+        return None
+
+    def finish(self) -> str:
+        audio = self._sr.AudioData(b"".join(self._frames), self._sample_rate, 2)
+        try:
+            return self._recognizer.recognize_google(audio, language=self.language)
+        except self._sr.UnknownValueError:
+            return ""
+        except self._sr.RequestError as e:
+            raise SpeechError(f"Could not request results: {e}")
+
+
+RECOGNIZERS: Dict[str, Type[Recognizer]] = {
+    "vosk": VoskRecognizer,
+    "google": GoogleRecognizer,
+}
+
+
+def create_recognizer(name: Optional[str] = None) -> Recognizer:
+    """Create the configured recognition backend.
+
+    Without a name (and without VIBETERMINAL_STT), the offline Vosk backend
+    is used if it is installed and has a model, otherwise Google.
+    """
+    name = name or os.environ.get(STT_ENV_VAR)
+    if name:
+        if name not in RECOGNIZERS:
+            raise SpeechError(f"Unknown speech recognition backend {name!r}; choose from {', '.join(RECOGNIZERS)}")
+        return RECOGNIZERS[name]()
+    errors = []
+    for backend in RECOGNIZERS.values():
+        try:
+            return backend()
+        except SpeechError as e:
+            errors.append(str(e))
+    raise SpeechError("; ".join(errors))
+
+
+def open_source() -> Union[MicrophoneSource, WavFileSource]:
+    """Open the microphone, or the WAV file named by VIBETERMINAL_VOICE_INPUT."""
+    path = os.environ.get(VOICE_INPUT_ENV_VAR)
+    if path:
+        return WavFileSource(path, realtime=True)
+    return MicrophoneSource()
+
+
+class Transcriber:
+    """Turns an audio source into utterances, streaming frames to a recognizer as they arrive.
+
+    The recognizer only sees audio from shortly before speech starts until
+    the detector hears enough silence, so no key press is needed to stop.
+    """
+
+    def __init__(self, recognizer: Recognizer, vad: Optional[EnergyVAD] = None, preroll_ms: int = 300):
+        """Initialize the transcriber.
+
+        Args:
+            recognizer: Recognition backend
+            vad: Voice activity detector; calibrated on the first listen()
+            preroll_ms: Audio kept from before speech was detected, so its onset is not clipped
+        """
+        self.recognizer = recognizer
+        self.vad = vad or EnergyVAD()
+        self.preroll_frames = max(preroll_ms // self.vad.frame_ms, self.vad.start_frames)
+
+    def listen(self, source, on_partial: Optional[Callable[[str], None]] = None,
+               timeout: Optional[float] = None) -> Optional[Utterance]:
+        """Wait for the next utterance and return it.
+
+        Args:
+            source: A MicrophoneSource, WavFileSource or anything with frames() and sample_rate
+            on_partial: Called with each new partial transcript
+            timeout: Seconds to wait for speech to start
+
+        Returns:
+            The utterance, or None if no speech started before the timeout or the source ended
+        """
+        frames = source.frames()
+        frame_seconds = self.vad.frame_ms / 1000
+        if self.vad.threshold is None:
+            calibration = [frame for _, frame in zip(range(self.vad.calibration_frames), frames)]
+            self.vad.calibrate(calibration)
+
+        waited = 0.0
+        preroll: List[bytes] = []
+        voiced = 0
+        for frame in frames:
+            preroll.append(frame)
+            del preroll[:-self.preroll_frames]
+            voiced = voiced + 1 if self.vad.is_speech(frame) else 0
+            if voiced >= self.vad.start_frames:
+                break
+            waited += frame_seconds
+            if timeout is not None and waited >= timeout:
+                return None
+        else:
+            return None
+
+        self.recognizer.start(source.sample_rate)
+        partial = None
+        for frame in preroll:
+            partial = self.recognizer.accept(frame) or partial
+        if partial and on_partial:
+            on_partial(partial)
+        # Frames heard since speech started, not counting the preroll before it
+        count = self.vad.start_frames
+        silent = 0
+        speech_ended = time.monotonic()
+        for frame in frames:
+            count += 1
+            if self.vad.is_speech(frame):
+                silent = 0
+                speech_ended = time.monotonic()
+            else:
+                silent += 1
+            update = self.recognizer.accept(frame)
+            if update and update != partial:
+                partial = update
+                if on_partial:
+                    on_partial(partial)
+            if silent >= self.vad.silence_frames or count >= self.vad.max_frames:
+                break
+        text = self.recognizer.finish()
+        latency = time.monotonic() - speech_ended
+        return Utterance(text, (count - silent) * frame_seconds, latency)
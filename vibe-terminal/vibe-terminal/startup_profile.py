@@ -0,0 +1,116 @@
+import os
+import subprocess
+import sys
+import time
+from typing import Dict, List, NamedTuple, Optional, Sequence
+
+# Measurements run in fresh interpreters, so the package is imported by name
+# from its parent directory rather than reusing this process's module cache.
+PACKAGE_NAME = __package__
+PACKAGE_PARENT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Entry points whose import cost is reported by --profile-startup
+STARTUP_TARGETS = {
+    "cli": "every invocation",
+    "agent.graph": "LLM queries",
+    "voice_handler": "--voice",
+}
+
+# Modules that must never be imported by the non-LLM paths
+HEAVY_MODULES = ["langgraph", "langchain_core", "openai", "speech_recognition", "pyttsx3", "dotenv"]
+
+
+class ImportTiming(NamedTuple):
+    module: str
+    self_us: int
+    cumulative_us: int
+    depth: int
+
+
+def _run_python(code: str, interpreter_args: Sequence[str] = (), script_args: Sequence[str] = (),
+                cwd: Optional[str] = None) -> subprocess.CompletedProcess:
+    """Run a snippet in a fresh interpreter that can import the package."""
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(p for p in (PACKAGE_PARENT, env.get("PYTHONPATH")) if p)
+    return subprocess.run(
+        [sys.executable, *interpreter_args, "-c", code, *script_args],
+        capture_output=True,
+        text=True,
+        cwd=cwd,
+        env=env
+    )
+
+
+def profile_imports(module: str) -> List[ImportTiming]:
+    """Import a package module in a fresh interpreter and parse the -X importtime report.
+
+    Args:
+        module: Module path relative to the package, e.g. "cli" or "agent.graph"
+
+    Returns:
+        One timing per imported module, in the order Python reported them
+    """
+    code = f"import importlib; importlib.import_module({PACKAGE_NAME + '.' + module!r})"
+    proc = _run_python(code, ("-X", "importtime"))
+
+    timings = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        # Nesting is encoded as two spaces per level after the separator space
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        timings.append(ImportTiming(name.strip(), int(self_us), int(cumulative_us), depth))
+
+    if proc.returncode != 0:
+        error_lines = proc.stderr.strip().splitlines()
+        raise RuntimeError(error_lines[-1] if error_lines else f"import of {module} failed")
+    return timings
+
+
+def group_by_package(timings: List[ImportTiming]) -> Dict[str, float]:
+    """Sum self time per top-level package, in milliseconds, largest first."""
+    totals: Dict[str, float] = {}
+    for timing in timings:
+        top_level = timing.module.split(".")[0]
+        totals[top_level] = totals.get(top_level, 0.0) + timing.self_us / 1000
+    return dict(sorted(totals.items(), key=lambda item: item[1], reverse=True))
+
+
+def measure_cold_start(args: List[str], runs: int = 5, cwd: Optional[str] = None) -> float:
+    """Return the median wall-clock time, in seconds, of `VibeTerminal <args>` in a fresh process."""
+    code = (
+        "import importlib, sys; "
+        f"importlib.import_module({PACKAGE_NAME + '.cli'!r}).app(sys.argv[1:])"
+    )
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        proc = _run_python(code, script_args=args, cwd=cwd)
+        samples.append(time.perf_counter() - start)
+        if proc.returncode != 0:
+            raise RuntimeError(f"VibeTerminal {' '.join(args)} exited with {proc.returncode}: {proc.stderr.strip()}")
+    samples.sort()
+    return samples[len(samples) // 2]
+
+
+def print_startup_profile(console, top: int = 8) -> None:
+    """Print the import-time breakdown for each startup path."""
+    from rich.table import Table
+
+    for module, used_by in STARTUP_TARGETS.items():
+        try:
+            timings = profile_imports(module)
+        except RuntimeError as e:
+            console.print(f"[yellow]{module} ({used_by}): not importable - {e}[/yellow]")
+            continue
+
+        total_ms = sum(t.cumulative_us for t in timings if t.depth == 0) / 1000
+        table = Table(title=f"import {module} ({used_by}): {total_ms:.1f} ms", title_justify="left")
+        table.add_column("Package")
+        table.add_column("Self time (ms)", justify="right")
+        table.add_column("Share", justify="right")
+        for package, ms in list(group_by_package(timings).items())[:top]:
+            share = ms / total_ms * 100 if total_ms else 0.0
+            table.add_row(package, f"{ms:.1f}", f"{share:.0f}%")
+        console.print(table)
@@ -0,0 +1,275 @@
+import functools
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+# Spans are recorded only while a tracer is active (--trace); otherwise
+# span() returns a shared no-op object and costs one global lookup.
+SERVICE_NAME = "vibe-terminal"
+FORMATS = ("chrome", "otlp")
+# Longest string kept in a span attribute (commands, queries)
+MAX_ATTRIBUTE_LENGTH = 200
+
+
+class SpanEvent(NamedTuple):
+    """A point in time inside a span, e.g. the first token of an LLM response."""
+    name: str
+    time_ns: int
+    attributes: Dict[str, Any]
+
+
+class Span:
+    """A timed operation; use as a context manager via span()."""
+
+    __slots__ = ("tracer", "name", "category", "attributes", "events", "span_id", "parent_id",
+                 "thread_id", "start_ns", "end_ns")
+
+    def __init__(self, tracer: "Tracer", name: str, category: str, attributes: Dict[str, Any]):
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.attributes = attributes
+        self.events: List[SpanEvent] = []
+        self.span_id = 0
+        self.parent_id = 0
+        self.thread_id = 0
+        self.start_ns = 0
+        self.end_ns = 0
+
+    def set(self, key: str, value: Any) -> None:
+        """Set an attribute, e.g. a return code once it is known."""
+        self.attributes[key] = value
+
+    def event(self, name: str, **attributes: Any) -> None:
+        """Record a point in time inside the span."""
+        self.events.append(SpanEvent(name, time.perf_counter_ns(), attributes))
+
+    def __enter__(self) -> "Span":
+        self.tracer._enter(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        if exc_type is not None:
+            self.attributes["error"] = f"{exc_type.__name__}: {exc}"
+        self.tracer._exit(self)
+        return False
+
+
+class _NullSpan:
+    """Stands in for a span while tracing is off."""
+
+    def set(self, key: str, value: Any) -> None:
+        pass
+
+    def event(self, name: str, **attributes: Any) -> None:
+        pass
+
+    def __enter__(self) -> "_NullSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def _clip(value: Any) -> Any:
+    if isinstance(value, str) and len(value) > MAX_ATTRIBUTE_LENGTH:
+        return value[:MAX_ATTRIBUTE_LENGTH - 3] + "..."
+    return value
+
+
+class Tracer:
+    """Collects the spans of one process, from any thread, and exports them.
+
+    Spans nest per thread: a span started while another is open on the
+    same thread becomes its child. Times come from a monotonic clock and
+    are anchored to the wall clock once, when the tracer starts.
+    """
+
+    def __init__(self):
+        self.spans: List[Span] = []
+        self.start_ns = time.perf_counter_ns()
+        self.epoch_ns = time.time_ns()
+        self.trace_id = os.urandom(16).hex()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._next_id = 0
+        self._threads: Dict[int, str] = {}
+
+    def _enter(self, span: Span) -> None:
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        with self._lock:
+            self._next_id += 1
+            span.span_id = self._next_id
+            thread = threading.current_thread()
+            self._threads.setdefault(thread.ident, thread.name)
+        span.thread_id = thread.ident
+        span.parent_id = stack[-1].span_id if stack else 0
+        stack.append(span)
+        span.start_ns = time.perf_counter_ns()
+
+    def _exit(self, span: Span) -> None:
+        span.end_ns = time.perf_counter_ns()
+        stack = self._local.stack
+        if span in stack:
+            stack.remove(span)
+        with self._lock:
+            self.spans.append(span)
+
+    def _wall_ns(self, perf_ns: int) -> int:
+        return self.epoch_ns + perf_ns - self.start_ns
+
+    def to_chrome(self) -> Dict:
+        """Chrome trace-event JSON, as opened by Perfetto and chrome://tracing."""
+        pid = os.getpid()
+        with self._lock:
+            spans = sorted(self.spans, key=lambda s: s.start_ns)
+            threads = dict(self._threads)
+        tids = {ident: number for number, ident in enumerate(threads, 1)}
+        events: List[Dict] = [
+            {"name": "process_name", "ph": "M", "pid": pid, "tid": 0, "args": {"name": SERVICE_NAME}}
+        ]
+        for ident, name in threads.items():
+            events.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": tids[ident], "args": {"name": name}})
+        for span in spans:
+            tid = tids.get(span.thread_id, 0)
+            events.append({
+                "name": span.name,
+                "cat": span.category,
+                "ph": "X",
+                "ts": (span.start_ns - self.start_ns) / 1000,
+                "dur": (span.end_ns - span.start_ns) / 1000,
+                "pid": pid,
+                "tid": tid,
+                "args": {key: _clip(value) for key, value in span.attributes.items()},
+            })
+            for event in span.events:
+                events.append({
+                    "name": event.name,
+                    "cat": span.category,
+                    "ph": "i",
+                    "s": "t",
+                    "ts": (event.time_ns - self.start_ns) / 1000,
+                    "pid": pid,
+                    "tid": tid,
+                    "args": {key: _clip(value) for key, value in event.attributes.items()},
+                })
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def to_otlp(self) -> Dict:
+        """OTLP/JSON (the body of an OTLP/HTTP trace export request)."""
+        def attributes(values: Dict[str, Any]) -> List[Dict]:
+            converted = []
+            for key, value in values.items():
+                if isinstance(value, bool):
+                    converted.append({"key": key, "value": {"boolValue": value}})
+                elif isinstance(value, int):
+                    converted.append({"key": key, "value": {"intValue": str(value)}})
+                elif isinstance(value, float):
+                    converted.append({"key": key, "value": {"doubleValue": value}})
+                elif value is not None:
+                    converted.append({"key": key, "value": {"stringValue": str(_clip(value))}})
+            return converted
+
+        with self._lock:
+            spans = sorted(self.spans, key=lambda s: s.start_ns)
+        otlp_spans = []
+        for span in spans:
+            otlp_span = {
+                "traceId": self.trace_id,
+                "spanId": f"{span.span_id:016x}",
+                "name": span.name,
+                "kind": 1,  # SPAN_KIND_INTERNAL
+                "startTimeUnixNano": str(self._wall_ns(span.start_ns)),
+                "endTimeUnixNano": str(self._wall_ns(span.end_ns)),
+                "attributes": attributes({"category": span.category, "thread.id": span.thread_id,
+                                          **span.attributes}),
+                "events": [
+                    {"name": event.name, "timeUnixNano": str(self._wall_ns(event.time_ns)),
+                     "attributes": attributes(event.attributes)}
+                    for event in span.events
+                ],
+                "status": {"code": 2, "message": span.attributes["error"]} if "error" in span.attributes else {},
+            }
+            if span.parent_id:
+                otlp_span["parentSpanId"] = f"{span.parent_id:016x}"
+            otlp_spans.append(otlp_span)
+        return {"resourceSpans": [{
+            "resource": {"attributes": attributes({"service.name": SERVICE_NAME, "process.pid": os.getpid()})},
+            "scopeSpans": [{"scope": {"name": SERVICE_NAME}, "spans": otlp_spans}],
+        }]}
+
+    def write(self, path: str, format: str = "chrome") -> int:
+        """Write the spans recorded so far to a JSON file.
+
+        Args:
+            path: Output file
+            format: "chrome" (trace-event JSON) or "otlp" (OTLP/JSON)
+
+        Returns:
+            The number of spans written
+        """
+        if format not in FORMATS:
+            raise ValueError(f"unknown trace format {format!r}; expected one of {', '.join(FORMATS)}")
+        document = self.to_chrome() if format == "chrome" else self.to_otlp()
+        with open(path, "w") as f:
+            json.dump(document, f)
+        return len(self.spans)
+
+
+_tracer: Optional[Tracer] = None
+
+
+def start_tracing() -> Tracer:
+    """Start recording spans for the rest of the process (or until stop_tracing())."""
+    global _tracer
+    if _tracer is None:
+        _tracer = Tracer()
+    return _tracer
+
+
+def stop_tracing() -> Optional[Tracer]:
+    """Stop recording and return the tracer with the spans recorded so far."""
+    global _tracer
+    tracer, _tracer = _tracer, None
+    return tracer
+
+
+def tracing_enabled() -> bool:
+    return _tracer is not None
+
+
+def span(name: str, category: str = "app", **attributes: Any):
+    """Time a block of code:
+
+        with span("history.add", "history", command=command) as s:
+            ...
+            s.set("rows", 1)
+
+    Does nothing while tracing is off.
+    """
+    tracer = _tracer
+    if tracer is None:
+        return _NULL_SPAN
+    return Span(tracer, name, category, {key: _clip(value) for key, value in attributes.items()})
+
+
+def traced(name: Optional[str] = None, category: str = "app") -> Callable:
+    """Decorator that records a span around every call of a function."""
+    def decorate(function: Callable) -> Callable:
+        span_name = name or function.__name__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if _tracer is None:
+                return function(*args, **kwargs)
+            with span(span_name, category):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
@@ -0,0 +1,251 @@
+import queue
+import re
+import threading
+import time
+from typing import List, Optional
+
+from .fences import COMMAND_LANGUAGES, FenceParser, FencedBlock
+
+# Words ending in a period that do not end a sentence
+ABBREVIATIONS = {"e.g.", "i.e.", "etc.", "vs.", "mr.", "mrs.", "ms.", "dr.", "st.", "no.", "approx.", "cf."}
+_SENTENCE_END = re.compile(r"[.!?]+[\"')\]]*\s")
+_MARKDOWN = [
+    (re.compile(r"^\s{0,3}#{1,6}\s+"), ""),  # Headings
+    (re.compile(r"^\s*(?:[-*+]|\d+[.)])\s+"), ""),  # List items
+    (re.compile(r"!?\[([^\]]*)\]\([^)]*\)"), r"\1"),  # Links and images: keep the text
+    (re.compile(r"https?://\S+"), "a link"),
+    (re.compile(r"(\*\*|__|\*|_|`)(?=\S)(.+?)(?<=\S)\1"), r"\2"),  # Emphasis and inline code
+    (re.compile(r"^\s*(?:[-*_]\s*){3,}$"), ""),  # Horizontal rules
+    (re.compile(r"^\s*>\s?"), ""),  # Block quotes
+    (re.compile(r"\|"), ", "),  # Table cells
+]
+
+
+def clean_for_speech(text: str) -> str:
+    """Strip markdown so that only the words are spoken."""
+    lines = []
+    for line in text.split("\n"):
+        for pattern, replacement in _MARKDOWN:
+            line = pattern.sub(replacement, line)
+        if line.strip():
+            lines.append(line.strip())
+    return " ".join(lines)
+
+
+def describe_block(block: FencedBlock) -> str:
+    """What is spoken instead of a code block."""
+    if block.language in COMMAND_LANGUAGES:
+        return "The command is shown on screen."
+    return f"The {block.language} code is shown on screen." if block.language else "The code is shown on screen."
+
+
+class SentenceSplitter:
+    """Splits text that arrives in chunks into sentences to speak.
+
+    A sentence is handed out as soon as the whitespace after its final
+    punctuation arrives, or at the end of its line, so speech can start
+    long before the text is complete. Fenced code blocks are not read out;
+    each is replaced by one short sentence once it ends.
+    """
+
+    def __init__(self):
+        self._fences = FenceParser()
+        self._line = ""
+        self._spoken = 0  # Characters of the current line already taken as prose
+        self._prose = ""
+
+    def feed(self, text: str) -> List[str]:
+        """Consume a chunk of text and return the sentences it completed."""
+        sentences: List[str] = []
+        self._line += text
+        while "\n" in self._line:
+            line, self._line = self._line.split("\n", 1)
+            self._end_line(line, sentences)
+        # A partial line that cannot be a fence any more is prose so far
+        stripped = self._line.lstrip(" ")
+        if not self._fences.in_block and (self._spoken or (len(stripped) >= 3 and stripped[0] not in "`~")):
+            self._prose += self._line[self._spoken:]
+            self._spoken = len(self._line)
+            self._take_sentences(sentences)
+        return sentences
+
+    def close(self) -> List[str]:
+        """Return whatever is left once the text is complete."""
+        sentences = self.feed("\n") if self._line else []
+        for block in self._fences.close():
+            self._flush(sentences)
+            sentences.append(describe_block(block))
+        self._flush(sentences)
+        return sentences
+
+    def _end_line(self, line: str, sentences: List[str]) -> None:
+        if self._spoken:
+            self._prose += line[self._spoken:] + "\n"
+            self._spoken = 0
+            self._fences.feed(line + "\n")
+            self._flush(sentences)
+            return
+        was_in_block = self._fences.in_block
+        completed = self._fences.feed(line + "\n")
+        if completed:
+            sentences.extend(describe_block(block) for block in completed)
+        elif self._fences.in_block and not was_in_block:
+            # Whatever came before the code block is complete
+            self._flush(sentences)
+        elif not self._fences.in_block:
+            self._prose += line + "\n"
+            self._flush(sentences)
+
+    def _take_sentences(self, sentences: List[str]) -> None:
+        start = 0
+        for match in _SENTENCE_END.finditer(self._prose):
+            words = self._prose[start:match.end()].split()
+            if words and words[-1].lower() in ABBREVIATIONS:
+                continue
+            self._emit(self._prose[start:match.end()], sentences)
+            start = match.end()
+        self._prose = self._prose[start:]
+
+    def _flush(self, sentences: List[str]) -> None:
+        self._take_sentences(sentences)
+        self._emit(self._prose, sentences)
+        self._prose = ""
+
+    @staticmethod
+    def _emit(text: str, sentences: List[str]) -> None:
+        text = clean_for_speech(text)
+        if any(c.isalnum() for c in text):
+            sentences.append(text)
+
+
+class SpeechQueue:
+    """Speaks queued sentences on a background thread.
+
+    The text-to-speech engine is created once, on the worker thread, and
+    reused for everything said afterwards. say() and feed() return at once;
+    interrupt() drops whatever is queued and cuts off the sentence being
+    spoken.
+    """
+
+    def __init__(self, rate: int = 150, volume: float = 0.9):
+        """Initialize the queue.
+
+        Args:
+            rate: Speaking rate in words per minute
+            volume: Volume from 0.0 to 1.0
+        """
+        self.rate = rate
+        self.volume = volume
+        self._queue: "queue.Queue[Optional[str]]" = queue.Queue()
+        self._splitter: Optional[SentenceSplitter] = None
+        self._discard_stream = False  # The text being fed was interrupted
+        self._interrupted = threading.Event()
+        self._idle = threading.Event()
+        self._idle.set()
+        self._lock = threading.Lock()
+        self._engine = None
+        self.error: Optional[str] = None
+        self.started_at: Optional[float] = None  # time.monotonic() when the last sentence began
+        self._thread = threading.Thread(target=self._run, name="tts", daemon=True)
+        self._thread.start()
+
+    def say(self, text: str) -> None:
+        """Queue a complete text; it is spoken sentence by sentence, without its code blocks."""
+        splitter = SentenceSplitter()
+        for sentence in splitter.feed(text) + splitter.close():
+            self._put(sentence)
+
+    def feed(self, chunk: str) -> None:
+        """Queue part of a text that is still arriving, e.g. from a streaming LLM response."""
+        with self._lock:
+            if self._discard_stream:
+                return
+            if self._splitter is None:
+                self._splitter = SentenceSplitter()
+            sentences = self._splitter.feed(chunk)
+        for sentence in sentences:
+            self._put(sentence)
+
+    def end_stream(self) -> None:
+        """Mark the text passed to feed() as complete and speak what is left of it."""
+        with self._lock:
+            splitter, self._splitter = self._splitter, None
+            self._discard_stream = False
+        if splitter is not None:
+            for sentence in splitter.close():
+                self._put(sentence)
+
+    def _put(self, sentence: str) -> None:
+        self._interrupted.clear()
+        self._idle.clear()
+        self._queue.put(sentence)
+
+    @property
+    def speaking(self) -> bool:
+        """True while anything is queued or being spoken."""
+        return not self._idle.is_set()
+
+    def interrupt(self) -> None:
+        """Stop speaking and forget everything queued."""
+        self._interrupted.set()
+        with self._lock:
+            # The rest of a text still being fed is dropped as well
+            self._discard_stream = self._splitter is not None
+            self._splitter = None
+        closing = False
+        while True:
+            try:
+                closing = self._queue.get_nowait() is None or closing
+            except queue.Empty:
+                break
+            self._queue.task_done()
+        if closing:
+            self._queue.put(None)
+        elif self._queue.unfinished_tasks == 0:
+            self._idle.set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until everything queued was spoken; returns False on timeout."""
+        return self._idle.wait(timeout)
+
+    def close(self) -> None:
+        """Stop the worker after what is queued has been spoken."""
+        self._queue.put(None)
+        self._thread.join(timeout=5)
+
+    def _create_engine(self):
+        import pyttsx3
+        engine = pyttsx3.init()
+        engine.setProperty("rate", self.rate)
+        engine.setProperty("volume", self.volume)
+        voices = engine.getProperty("voices")
+        if voices:
+            engine.setProperty("voice", voices[0].id)
+
+        # The engine can only be stopped safely from its own callbacks
+        def on_word(name, location, length):
+            if self._interrupted.is_set():
+                engine.stop()
+        engine.connect("started-word", on_word)
+        return engine
+
+    def _run(self) -> None:
+        while True:
+            sentence = self._queue.get()
+            try:
+                if sentence is None:
+                    return
+                if self._interrupted.is_set() or self.error:
+                    continue
+                if self._engine is None:
+                    self._engine = self._create_engine()
+                self.started_at = time.monotonic()
+                self._engine.say(sentence)
+                self._engine.runAndWait()
+            except Exception as e:
+                # No engine (pyttsx3 or a speech driver is missing); keep draining the queue
+                self.error = str(e)
+            finally:
+                self._queue.task_done()
+                if self._queue.unfinished_tasks == 0:
+                    self._idle.set()
@@ -0,0 +1,468 @@
+import glob
+import hashlib
+import os
+import shlex
+import shutil
+import sqlite3
+import stat
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, NamedTuple, Optional, Set, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+from .config import get_data_dir
+from .heredoc import parse_file_writes
+from .safety import SafetyVerdict, analyze_safety
+from .command_effects import analyze_command
+
+# Set VIBETERMINAL_UNDO=0 to stop taking snapshots
+UNDO_ENV_VAR = "VIBETERMINAL_UNDO"
+# Files up to this size are hashed and stored by content; larger ones are
+# keyed by inode identity so that snapshotting them never reads them
+HASH_LIMIT = 4 * 1024 * 1024
+# Bytes a single command may copy when neither a hardlink nor a reflink is possible
+COPY_BUDGET = int(os.environ.get("VIBETERMINAL_UNDO_COPY_BUDGET", 64 * 1024 * 1024))
+# Files recorded per snapshot, e.g. when a command removes a large tree
+MAX_FILES = 10000
+# Snapshots kept; older ones and the objects only they used are removed
+MAX_SNAPSHOTS = int(os.environ.get("VIBETERMINAL_UNDO_MAX_SNAPSHOTS", 50))
+
+# FICLONE from linux/fs.h: share the source's blocks (btrfs, XFS, bcachefs, ...)
+_FICLONE = 0x40049409
+_GLOB_CHARS = set("*?[")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    command TEXT NOT NULL,
+    cwd TEXT NOT NULL,
+    created REAL NOT NULL,
+    complete INTEGER NOT NULL,
+    bytes_copied INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS snapshot_paths (
+    snapshot_id INTEGER NOT NULL REFERENCES snapshots (id) ON DELETE CASCADE,
+    path TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    object TEXT,
+    mode INTEGER,
+    mtime_ns INTEGER,
+    link_target TEXT
+);
+CREATE INDEX IF NOT EXISTS snapshot_paths_snapshot ON snapshot_paths (snapshot_id);
+CREATE INDEX IF NOT EXISTS snapshot_paths_object ON snapshot_paths (object);
+"""
+
+
+class PathState(NamedTuple):
+    """The state of one path before a command ran."""
+    path: str
+    kind: str  # "file", "dir", "symlink", "missing", or "skipped" (too large to copy)
+    object: Optional[str] = None  # Store object holding a file's content
+    mode: Optional[int] = None
+    mtime_ns: Optional[int] = None
+    link_target: Optional[str] = None
+
+
+def undo_enabled() -> bool:
+    """False if snapshots were turned off with VIBETERMINAL_UNDO=0."""
+    return os.environ.get(UNDO_ENV_VAR, "1") not in ("", "0")
+
+
+def _reflink(source: str, destination: str) -> bool:
+    """Clone a file without copying its data, if the filesystem supports it."""
+    if fcntl is None:
+        return False
+    try:
+        with open(source, "rb") as src, open(destination, "wb") as dst:
+            fcntl.ioctl(dst.fileno(), _FICLONE, src.fileno())
+        return True
+    except OSError:
+        try:
+            os.remove(destination)
+        except OSError:
+            pass
+        return False
+
+
+def _words(command: str) -> Iterator[List[str]]:
+    """Yield the words of each simple command, split on shell operators."""
+    lexer = shlex.shlex(command, posix=True, punctuation_chars=";&|()<>")
+    lexer.whitespace_split = True
+    lexer.commenters = "#"
+    current: List[str] = []
+    try:
+        for token in lexer:
+            if set(token) <= set(";&|()<>"):
+                if current:
+                    yield current
+                current = []
+            else:
+                current.append(token)
+    except ValueError:
+        pass
+    if current:
+        yield current
+
+
+def replaced_paths(command: str) -> Set[str]:
+    """Paths a command deletes or replaces with a new file rather than changing in place.
+
+    Their old inode is no longer reachable afterwards, so a hardlink to it
+    is an exact, free snapshot: rm/unlink targets, files edited with
+    `sed -i`, the destination of mv, and heredoc writes VibeTerminal
+    performs itself with an atomic rename.
+    """
+    paths = {write.path for write in parse_file_writes(command)}
+    for line in command.split("\n"):
+        for words in _words(line):
+            program = os.path.basename(words[0])
+            args = [word for word in words[1:] if not word.startswith("-")]
+            if program in ("rm", "unlink"):
+                paths.update(args)
+            elif program == "mv" and len(args) >= 2:
+                paths.add(args[-1])
+            elif program == "sed" and any(word.startswith("-i") or word == "--in-place" for word in words[1:]):
+                has_script_option = any(word in ("-e", "-f") or word.startswith("--expression") for word in words[1:])
+                paths.update(args if has_script_option else args[1:])
+    return paths
+
+
+class UndoJournal:
+    """Snapshots of the files a command is about to change, for --undo.
+
+    Before a command runs, the paths the safety analyzer and the scheduler
+    say it writes are recorded: missing paths as missing, directories as
+    their whole tree, and file contents in a content-addressed object store
+    under the data directory. Files the command deletes or replaces are
+    hardlinked. Otherwise small files are stored by content hash, so
+    repeated snapshots of the same file cost one copy, and large files are
+    reflinked on filesystems with copy-on-write clones; snapshotting large
+    files never reads their data. Every copy counts against a per-command
+    budget, and a snapshot that runs out of it is marked incomplete.
+    """
+
+    def __init__(self, directory: Optional[Path] = None, max_snapshots: int = MAX_SNAPSHOTS,
+                 copy_budget: int = COPY_BUDGET):
+        """Initialize the journal.
+
+        Args:
+            directory: Where the journal and objects are kept; defaults to <data dir>/undo
+            max_snapshots: Snapshots kept before the oldest are pruned
+            copy_budget: Bytes a single snapshot may copy
+        """
+        self.directory = Path(directory) if directory else get_data_dir() / "undo"
+        self.objects = self.directory / "objects"
+        self.objects.mkdir(parents=True, exist_ok=True)
+        self.max_snapshots = max_snapshots
+        self.copy_budget = copy_budget
+        self._db = sqlite3.connect(str(self.directory / "journal.db"), timeout=30, isolation_level=None,
+                                   check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA foreign_keys=ON")
+        self._db.executescript(_SCHEMA)
+        # Commands of one parallel stage take their snapshots from several threads
+        self._lock = threading.RLock()
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._db
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+
+    def _object_path(self, name: str) -> Path:
+        return self.objects / name[:2] / name
+
+    def _store(self, path: str, st: os.stat_result, replaced: bool, budget: List[int]) -> Optional[str]:
+        """Put a file's current content in the object store and return the object name.
+
+        Returns None if the file is too large to copy within the remaining budget.
+        Every byte copied counts against the budget; hardlinks and reflinks are free.
+        """
+        # A file the command replaces keeps its inode, so it is hardlinked like a large one
+        if st.st_size <= HASH_LIMIT and not replaced:
+            if st.st_size > budget[0]:
+                return None
+            with open(path, "rb") as f:
+                data = f.read()
+            name = hashlib.blake2b(data, digest_size=20).hexdigest()
+            target = self._object_path(name)
+            if not target.exists():
+                target.parent.mkdir(exist_ok=True)
+                fd, tmp_path = tempfile.mkstemp(dir=target.parent)
+                with os.fdopen(fd, "wb") as f:
+                    f.write(data)
+                os.replace(tmp_path, target)
+                budget[0] -= len(data)
+            return name
+
+        # Identified by inode and change signature, so an unchanged large file is stored once
+        name = f"i{st.st_dev:x}-{st.st_ino:x}-{st.st_size:x}-{st.st_mtime_ns:x}"
+        target = self._object_path(name)
+        if target.exists():
+            return name
+        target.parent.mkdir(exist_ok=True)
+        tmp_path = str(target) + ".tmp"
+        if replaced:
+            try:
+                os.link(path, tmp_path)
+                os.replace(tmp_path, target)
+                return name
+            except OSError:
+                pass  # Another filesystem, or links not supported
+        if not _reflink(path, tmp_path):
+            if st.st_size > budget[0]:
+                return None
+            shutil.copyfile(path, tmp_path)
+            budget[0] -= st.st_size
+        os.replace(tmp_path, target)
+        return name
+
+    def _record(self, path: str, replaced: bool, budget: List[int], states: List[PathState]) -> None:
+        try:
+            st = os.lstat(path)
+        except FileNotFoundError:
+            states.append(PathState(path, "missing"))
+            return
+        if stat.S_ISLNK(st.st_mode):
+            states.append(PathState(path, "symlink", mode=st.st_mode & 0o7777, link_target=os.readlink(path)))
+        elif stat.S_ISDIR(st.st_mode):
+            states.append(PathState(path, "dir", mode=st.st_mode & 0o7777, mtime_ns=st.st_mtime_ns))
+            for root, dirs, files in os.walk(path):
+                for name in dirs + files:
+                    if len(states) >= MAX_FILES:
+                        return
+                    child = os.path.join(root, name)
+                    # Removing the tree removes its files too
+                    self._record_entry(child, replaced, budget, states)
+        elif stat.S_ISREG(st.st_mode):
+            name = self._store(path, st, replaced, budget)
+            kind = "file" if name else "skipped"
+            states.append(PathState(path, kind, name, st.st_mode & 0o7777, st.st_mtime_ns))
+
+    def _record_entry(self, path: str, replaced: bool, budget: List[int], states: List[PathState]) -> None:
+        try:
+            st = os.lstat(path)
+        except OSError:
+            return
+        if stat.S_ISDIR(st.st_mode):
+            states.append(PathState(path, "dir", mode=st.st_mode & 0o7777, mtime_ns=st.st_mtime_ns))
+        else:
+            self._record(path, replaced, budget, states)
+
+    def target_paths(self, command: str, cwd: str, verdict: Optional[SafetyVerdict] = None) -> Tuple[Set[str], bool]:
+        """Return the absolute paths a command writes and whether that list is complete."""
+        verdict = verdict or analyze_safety(command, cwd)
+        effects = analyze_command(command, cwd)
+        paths = set(effects.writes)
+        for path in verdict.writes:
+            path = os.path.normpath(os.path.join(cwd, os.path.expandvars(os.path.expanduser(path))))
+            if _GLOB_CHARS & set(path):
+                # The scheduler widens a glob to its whole directory; snapshot only the matches
+                prefix = path[:min(path.index(c) for c in _GLOB_CHARS if c in path)]
+                paths.discard(os.path.normpath(prefix[:prefix.rfind("/") + 1]))
+                paths.update(glob.glob(path))
+            elif effects.barrier:
+                # A barrier command (an interpreter, a build tool, ...) may write anywhere;
+                # still keep what the safety analyzer found, such as its redirects
+                paths.add(path)
+        return paths, not effects.barrier
+
+    def snapshot(self, command: str, cwd: Optional[str] = None) -> Optional[int]:
+        """Record the current state of every path a command will write; returns the snapshot id.
+
+        Read-only commands get no snapshot (None).
+        """
+        cwd = cwd or os.getcwd()
+        verdict = analyze_safety(command, cwd)
+        if verdict.read_only:
+            return None
+        paths, complete = self.target_paths(command, cwd, verdict)
+        replaced = {os.path.normpath(os.path.join(cwd, path)) for path in replaced_paths(command)}
+        budget = [self.copy_budget]
+        states: List[PathState] = []
+        created: Set[str] = set()
+        for path in sorted(paths):
+            if path in ("/", os.path.expanduser("~")):
+                complete = False
+                continue
+            try:
+                self._record(path, path in replaced, budget, states)
+            except OSError:
+                complete = False
+            # Directories a command like `mkdir -p a/b` or `cat > a/b/c` would create
+            parent = os.path.dirname(path)
+            while parent not in created and not os.path.lexists(parent):
+                created.add(parent)
+                states.append(PathState(parent, "missing"))
+                parent = os.path.dirname(parent)
+        complete = complete and len(states) < MAX_FILES and all(state.kind != "skipped" for state in states)
+
+        with self._transaction() as db:
+            snapshot_id = db.execute(
+                "INSERT INTO snapshots (command, cwd, created, complete, bytes_copied) VALUES (?, ?, ?, ?, ?)",
+                (command, cwd, time.time(), int(complete), self.copy_budget - budget[0])
+            ).lastrowid
+            db.executemany(
+                "INSERT INTO snapshot_paths (snapshot_id, path, kind, object, mode, mtime_ns, link_target) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(snapshot_id,) + tuple(state) for state in states]
+            )
+        if snapshot_id % 16 == 0:
+            self.prune()
+        return snapshot_id
+
+    def get(self, snapshot_id: int) -> Optional[Dict]:
+        """Return a snapshot with its recorded path states, or None."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT id, command, cwd, created, complete, bytes_copied FROM snapshots WHERE id = ?", (snapshot_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            states = [
+                PathState(*state) for state in self._db.execute(
+                    "SELECT path, kind, object, mode, mtime_ns, link_target FROM snapshot_paths WHERE snapshot_id = ?",
+                    (snapshot_id,)
+                )
+            ]
+        return {"id": row[0], "command": row[1], "cwd": row[2], "created": row[3], "complete": bool(row[4]),
+                "bytes_copied": row[5], "paths": states}
+
+    def _restore_file(self, state: PathState) -> None:
+        source = str(self._object_path(state.object))
+        directory = os.path.dirname(state.path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix=f".{os.path.basename(state.path)}.", suffix=".undo", dir=directory)
+        os.close(fd)
+        try:
+            if not _reflink(source, tmp_path):
+                shutil.copyfile(source, tmp_path)
+            os.chmod(tmp_path, state.mode)
+            os.utime(tmp_path, ns=(state.mtime_ns, state.mtime_ns))
+            if os.path.isdir(state.path) and not os.path.islink(state.path):
+                shutil.rmtree(state.path)
+            os.replace(tmp_path, state.path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def restore(self, snapshot_id: int) -> Tuple[List[str], List[str]]:
+        """Put every path of a snapshot back into its recorded state, then drop the snapshot.
+
+        Returns:
+            Descriptions of what was restored, and of what could not be
+        """
+        snapshot = self.get(snapshot_id)
+        if snapshot is None:
+            return [], [f"Snapshot {snapshot_id} no longer exists"]
+        restored, errors = [], []
+        states = snapshot["paths"]
+        # Remove what the command created, deepest first; then recreate directories, then files
+        for state in sorted((s for s in states if s.kind == "missing"), key=lambda s: s.path.count(os.sep), reverse=True):
+            try:
+                if os.path.isdir(state.path) and not os.path.islink(state.path):
+                    shutil.rmtree(state.path)
+                elif os.path.lexists(state.path):
+                    os.remove(state.path)
+                else:
+                    continue
+                restored.append(f"removed {state.path}")
+            except OSError as e:
+                errors.append(f"{state.path}: {e}")
+        for state in sorted((s for s in states if s.kind == "dir"), key=lambda s: s.path.count(os.sep)):
+            try:
+                if os.path.lexists(state.path) and not os.path.isdir(state.path):
+                    os.remove(state.path)
+                if not os.path.isdir(state.path):
+                    os.makedirs(state.path)
+                    restored.append(f"recreated {state.path}/")
+                os.chmod(state.path, state.mode)
+            except OSError as e:
+                errors.append(f"{state.path}: {e}")
+        for state in states:
+            try:
+                if state.kind == "file":
+                    self._restore_file(state)
+                    restored.append(f"restored {state.path}")
+                elif state.kind == "symlink":
+                    if os.path.lexists(state.path) and not os.path.isdir(state.path):
+                        os.remove(state.path)
+                    if not os.path.lexists(state.path):
+                        os.symlink(state.link_target, state.path)
+                    restored.append(f"restored link {state.path}")
+                elif state.kind == "skipped":
+                    errors.append(f"{state.path}: was too large to snapshot")
+            except OSError as e:
+                errors.append(f"{state.path}: {e}")
+        # Directory mtimes last, after their contents were changed back
+        for state in states:
+            if state.kind == "dir" and os.path.isdir(state.path):
+                try:
+                    os.utime(state.path, ns=(state.mtime_ns, state.mtime_ns))
+                except OSError:
+                    pass
+        if not snapshot["complete"]:
+            errors.append("the command may also have changed files VibeTerminal could not identify")
+        with self._transaction() as db:
+            db.execute("DELETE FROM snapshots WHERE id = ?", (snapshot_id,))
+        # Hardlinked and cloned copies of large files are not shared by content; free them now
+        self.gc({state.object for state in states if state.object and state.object.startswith("i")})
+        return restored, errors
+
+    def prune(self) -> int:
+        """Drop snapshots beyond max_snapshots, oldest first, and collect their objects."""
+        with self._transaction() as db:
+            removed = db.execute(
+                "DELETE FROM snapshots WHERE id <= (SELECT id FROM snapshots ORDER BY id DESC LIMIT 1 OFFSET ?)",
+                (self.max_snapshots,)
+            ).rowcount
+        if removed:
+            self.gc()
+        return removed
+
+    def gc(self, candidates: Optional[Set[str]] = None) -> int:
+        """Delete objects no snapshot refers to; returns how many were deleted.
+
+        Args:
+            candidates: Only consider these objects, e.g. those of a snapshot just
+                dropped; they are deleted however recently they were stored
+        """
+        with self._lock:
+            referenced = {row[0] for row in self._db.execute(
+                "SELECT DISTINCT object FROM snapshot_paths WHERE object IS NOT NULL"
+            )}
+        if candidates is not None:
+            paths = [self._object_path(name) for name in candidates]
+        else:
+            paths = [path for bucket in self.objects.iterdir() if bucket.is_dir() for path in bucket.iterdir()]
+        removed = 0
+        for path in paths:
+            if path.name in referenced:
+                continue
+            # Objects stored in the last minute may belong to a snapshot another
+            # terminal is still recording (linking and renaming update the ctime)
+            try:
+                if candidates is None and time.time() - path.stat().st_ctime < 60:
+                    continue
+                path.unlink()
+                removed += 1
+            except OSError:
+                pass
+        return removed
+
+    def close(self) -> None:
+        self._db.close()
@@ -5,15 +5,9 @@ from rich.console import Console
 from rich.syntax import Syntax
 from rich.text import Text
 
-console = Console()
+from .safety import analyze_safety
 
-# Basic safety check keywords (very simplistic, needs improvement)
-DANGEROUS_COMMAND_PATTERNS = [
-    "rm -rf", "sudo", "mkfs", "> /dev/sd", "dd if=", ":(){:|:&};:",
-    "mv /", "chmod 000", "chown root"
-]
-# Commands generally considered read-only (simplistic)
-READ_ONLY_COMMANDS_START = ["ls", "cat", "grep", "find", "pwd", "git status", "git diff", "man", "echo"]
+console = Console()
 
 def get_current_context(max_history: int = 10, max_dir_depth: int = 1) -> str:
     """Gathers context from the current terminal environment."""
@@ -53,42 +47,11 @@ def print_code(code: str, language: str = "bash"):
 
 def is_command_safe(command: str) -> bool:
     """
-    Very basic safety check for a command.
-    Returns True if likely read-only, False if potentially destructive or needs confirmation.
+    Safety check for a command, using the project's safety policy (see safety.py).
+    Returns True if read-only or allowed by the policy, False if potentially
+    destructive or needs confirmation.
     """
-    command_lower = command.lower().strip()
-    if not command_lower:
-        return True # Empty command is safe
-
-    for pattern in DANGEROUS_COMMAND_PATTERNS:
-        if pattern in command_lower:
-            return False
-            
-    # Check if it starts with a known read-only command and doesn't have obvious write operations
-    is_read_only_start = any(command_lower.startswith(ro_cmd) for ro_cmd in READ_ONLY_COMMANDS_START)
-    
-    # Simplistic check for redirection that writes, or pipes to dangerous commands
-    if is_read_only_start:
-        if ">" in command and ">>" not in command_lower and not command_lower.split(">",1)[1].strip().startswith("/dev/null"): # Simple output redirection
-            return False # Writing to a new file might be ok, but let's be cautious
-        if "|" in command: # If piping, check the subsequent commands
-            parts = command_lower.split("|")
-            for part in parts[1:]:
-                if not any(part.strip().startswith(ro_cmd) for ro_cmd in READ_ONLY_COMMANDS_START):
-                    # If any part of the pipe isn't clearly read-only, ask.
-                    # This is very naive, e.g. `ls | dangerous_script`
-                    if not is_command_safe_recursive_pipe(part.strip()):
-                        return False
-        return True # If it starts read-only and no obvious write ops found
-
-    return False 
-
-def is_command_safe_recursive_pipe(command_part: str) -> bool:
-    """Helper for checking piped commands recursively."""
-    if any(command_part.startswith(ro_cmd) for ro_cmd in READ_ONLY_COMMANDS_START):
-        # Further checks for this part could be added here if needed
-        return True
-    return False
+    return analyze_safety(command).safe
 
 # if __name__ == '__main__':
 #     print_colored("This is a test of colored output.", "green")
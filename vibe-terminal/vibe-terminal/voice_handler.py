@@ -1,38 +1,27 @@
-import speech_recognition as sr
-import pyttsx3
 import os
+import re
+from typing import Callable, List, NamedTuple, Optional
 from rich.console import Console
-from rich.prompt import Prompt
-import threading
-import queue
 import time
 import sys
 import termios
 import tty
 import select
 
+from .speech import SpeechError, Transcriber, Utterance, create_recognizer, open_source
+from .tts import SpeechQueue
+
 console = Console()
 
 class VoiceHandler:
     def __init__(self):
-        self.recognizer = sr.Recognizer()
-        self.engine = pyttsx3.init()
-        self.audio_queue = queue.Queue()
-        self.is_listening = False
-        
-        # Configure text-to-speech engine
-        self.engine.setProperty('rate', 150)    # Speed of speech
-        self.engine.setProperty('volume', 0.9)  # Volume (0.0 to 1.0)
-        
-        # Get available voices and set a default one
-        voices = self.engine.getProperty('voices')
-        if voices:
-            self.engine.setProperty('voice', voices[0].id)
+        # Responses are spoken on a background thread by one reused engine
+        self.speech = SpeechQueue(rate=150, volume=0.9)
         
-        # Adjust recognition settings
-        self.recognizer.dynamic_energy_threshold = True
-        self.recognizer.energy_threshold = 300  # Lower threshold for better sensitivity
-        self.recognizer.pause_threshold = 0.8   # Shorter pause threshold
+        # The recognizer and the audio source are opened on first use and kept;
+        # the noise floor is calibrated once, on the first utterance
+        self.transcriber = None
+        self.source = None
 
     def get_key(self):
         """Get a single key press without requiring accessibility permissions."""
@@ -45,110 +34,212 @@ class VoiceHandler:
             termios.tcsetattr(fd, termios.TCSADRAIN, old_settings)
         return ch
 
-    def listen_in_background(self, source):
-        """Listen in the background and put audio in queue."""
-        try:
-            self.is_listening = True
-            audio_data = []
-            
-            while self.is_listening:
-                try:
-                    # Adjust for ambient noise at the start
-                    self.recognizer.adjust_for_ambient_noise(source, duration=0.5)
-                    
-                    # Listen with shorter timeout
-                    audio = self.recognizer.listen(source, timeout=3, phrase_time_limit=10)
-                    audio_data.append(audio)
-                    
-                    # If we got audio, process it immediately
-                    if audio_data:
-                        self.audio_queue.put(audio_data[-1])
-                        break
-                        
-                except sr.WaitTimeoutError:
-                    continue
-                except Exception as e:
-                    console.print(f"[yellow]Listening...[/yellow]")
-                    continue
-            
-        except Exception as e:
-            console.print(f"[red]Error in background listening: {str(e)}[/red]")
-        finally:
-            self.is_listening = False
+    def open(self) -> None:
+        """Load the recognition backend and open the audio source, if not done yet."""
+        if self.transcriber is None:
+            recognizer = create_recognizer()
+            self.transcriber = Transcriber(recognizer)
+            console.print(f"[dim]Speech recognition: {recognizer.name}[/dim]")
+        if self.source is None:
+            self.source = open_source()
+
+    def close(self) -> None:
+        """Finish speaking, then release the audio source and the speech engine."""
+        self.wait_for_speech()
+        self.speech.close()
+        if self.source is not None:
+            self.source.close()
+            self.source = None
+
+    def listen(self, timeout: float = None) -> Optional[Utterance]:
+        """Wait for the next utterance, showing partial transcripts while the user speaks.
 
-    def listen_for_command(self) -> str:
+        Listening stops by itself once the speaker pauses. Returns None if
+        nothing was said before the timeout or the audio source ended.
+
+        Raises:
+            SpeechError: If no recognition backend or audio source is available
+        """
+        # Speaking over the user would be picked up by the microphone
+        self.speech.interrupt()
+        self.open()
+
+        def show_partial(text: str) -> None:
+            width = max(console.width - 1, 20)
+            sys.stdout.write("\r\033[K" + text[-width:])
+            sys.stdout.flush()
+
+        utterance = self.transcriber.listen(self.source, on_partial=show_partial, timeout=timeout)
+        sys.stdout.write("\r\033[K")
+        sys.stdout.flush()
+        if utterance is not None and utterance.text:
+            console.print(f"[bold blue]Recognized: {utterance.text}[/bold blue]")
+            console.print(f"[dim]Recognized {utterance.duration:.1f}s of speech, "
+                          f"{utterance.latency * 1000:.0f} ms after it ended[/dim]")
+        return utterance
+
+    def listen_for_command(self, timeout: float = None) -> str:
         """Listen for voice command and return the transcribed text."""
         try:
-            with sr.Microphone() as source:
-                console.print("[bold blue]Listening...[/bold blue]")
-                console.print("[dim]Speak your command and press any key when done[/dim]")
-                
-                # Start background listening
-                self.is_listening = True
-                listen_thread = threading.Thread(target=self.listen_in_background, args=(source,))
-                listen_thread.daemon = True
-                listen_thread.start()
-                
-                # Wait for any key press
-                self.get_key()
-                
-                # Stop listening
-                self.is_listening = False
-                listen_thread.join(timeout=1)
-                
-                console.print("[bold green]Processing speech...[/bold green]")
-                
-                # Get the audio from queue
-                try:
-                    audio = self.audio_queue.get_nowait()
-                    text = self.recognizer.recognize_google(audio, language='en-US')
-                    console.print(f"[bold blue]Recognized: {text}[/bold blue]")
-                    return text.lower()
-                except queue.Empty:
-                    console.print("[yellow]No speech detected. Please try again.[/yellow]")
-                    return ""
-                
-        except sr.UnknownValueError:
-            console.print("[yellow]Could not understand audio. Please try again.[/yellow]")
-            return ""
-        except sr.RequestError as e:
-            console.print(f"[red]Could not request results; {str(e)}[/red]")
+            console.print("[bold blue]Listening...[/bold blue]")
+            console.print("[dim]Speak your command; listening stops when you pause[/dim]")
+            utterance = self.listen(timeout)
+            if utterance is None or not utterance.text:
+                console.print("[yellow]No speech detected. Please try again.[/yellow]")
+                return ""
+            return utterance.text.lower()
+
+        except SpeechError as e:
+            console.print(f"[red]{str(e)}[/red]")
             return ""
         except Exception as e:
             console.print(f"[red]Error in voice recognition: {str(e)}[/red]")
             return ""
 
     def speak_response(self, text: str) -> None:
-        """Convert text to speech and speak it."""
+        """Queue text to be spoken and return immediately; code blocks are not read out."""
+        self.speech.say(text)
+
+    def speak_stream(self, chunk: str) -> None:
+        """Speak a response while it streams in; call end_speech_stream() when it is complete."""
+        self.speech.feed(chunk)
+
+    def end_speech_stream(self) -> None:
+        self.speech.end_stream()
+
+    def wait_for_speech(self) -> None:
+        """Block until everything queued was spoken; any key press stops it."""
+        if self.speech.speaking:
+            if sys.stdin.isatty():
+                fd = sys.stdin.fileno()
+                old_settings = termios.tcgetattr(fd)
+                try:
+                    tty.setcbreak(fd)
+                    while self.speech.speaking:
+                        ready, _, _ = select.select([sys.stdin], [], [], 0.1)
+                        if ready:
+                            sys.stdin.read(1)
+                            self.speech.interrupt()
+                            break
+                finally:
+                    termios.tcsetattr(fd, termios.TCSADRAIN, old_settings)
+            # After an interrupt the engine stops at the next word
+            self.speech.wait(timeout=5 if sys.stdin.isatty() else None)
+        if self.speech.error:
+            console.print(f"[red]Error in text-to-speech: {self.speech.error}[/red]")
+            self.speech.error = None
+
+class TurnStats(NamedTuple):
+    """Timings of one utterance handled by a voice session, in seconds."""
+    speech: float  # Length of the utterance
+    recognition: float  # End of speech to final transcript
+    first_response: Optional[float]  # Transcript to the first spoken sentence
+    total: float  # End of speech until the answer was handled
+
+
+def _percentile(values: List[float], fraction: float) -> float:
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+class VoiceSession:
+    """A hands-free conversation that keeps one microphone stream, recognizer and speech engine.
+
+    Each utterance is passed to a handler (normally the agent graph) and
+    the next one is listened for once the answer has been spoken. With a
+    wake word, only utterances starting with it are handled; saying the
+    wake word alone makes the next utterance count without it.
+    """
+
+    EXIT_WORDS = {"quit", "exit", "stop listening", "goodbye"}
+
+    def __init__(self, wake_word: Optional[str] = None, handler: Optional[VoiceHandler] = None):
+        """Initialize the session.
+
+        Args:
+            wake_word: Word or phrase each command must start with
+            handler: Voice handler to use; created if not given
+        """
+        self.handler = handler or VoiceHandler()
+        self.wake_word = self._normalize(wake_word) if wake_word else None
+        self.turns: List[TurnStats] = []
+
+    @staticmethod
+    def _normalize(text: str) -> str:
+        return re.sub(r"[^\w\s']", "", text.lower()).strip()
+
+    def _strip_wake_word(self, text: str, awake: bool) -> Optional[str]:
+        """Return the command in an utterance, "" for the wake word alone, or None if it is not addressed to us."""
+        normalized = self._normalize(text)
+        if not self.wake_word or awake:
+            return normalized
+        if normalized == self.wake_word:
+            return ""
+        if normalized.startswith(self.wake_word + " "):
+            return normalized[len(self.wake_word) + 1:]
+        return None
+
+    def run(self, handle: Callable[[str], None]) -> None:
+        """Listen and handle utterances until the user says "quit" or presses Ctrl+C.
+
+        Args:
+            handle: Called with each command; it answers through self.handler
+        """
+        console.print("[bold green]Voice mode activated![/bold green]")
+        if self.wake_word:
+            console.print(f"[dim]Start each command with \"{self.wake_word}\"; say \"quit\" to exit.[/dim]")
+        else:
+            console.print("[dim]Speak your commands; say \"quit\" or press Ctrl+C to exit.[/dim]")
+        awake = False
         try:
-            self.engine.say(text)
-            self.engine.runAndWait()
-        except Exception as e:
-            console.print(f"[red]Error in text-to-speech: {str(e)}[/red]")
-
-def handle_voice_mode() -> str:
-    """Handle voice mode interaction."""
-    voice_handler = VoiceHandler()
-    
-    console.print("[bold green]Voice mode activated![/bold green]")
-    console.print("[dim]Speak your command and press any key when done.[/dim]")
-    
-    while True:
-        # Wait for Enter to start speaking
-        user_input = Prompt.ask("\nPress Enter to start speaking (or 'q' to quit)")
-        if user_input.lower() == 'q':
-            console.print("[bold blue]Exiting voice mode...[/bold blue]")
-            return None
-        
-        # Get voice command
-        command = voice_handler.listen_for_command()
-        
-        if not command:
-            continue
-            
-        if command.lower() == 'quit' or command.lower() == 'exit':
-            console.print("[bold blue]Exiting voice mode...[/bold blue]")
-            return None
-            
-        # Return the command for processing
-        return command 
\ No newline at end of file
+            while True:
+                console.print("\n[bold blue]Listening...[/bold blue]")
+                utterance = self.handler.listen()
+                if utterance is None:
+                    # Only a recording runs out; the microphone never does
+                    break
+                heard = time.monotonic()
+                command = self._strip_wake_word(utterance.text, awake)
+                if command is None:
+                    console.print("[dim]No wake word; ignored[/dim]")
+                    continue
+                if not command:
+                    awake = True
+                    self.handler.speak_response("Yes?")
+                    self.handler.wait_for_speech()
+                    continue
+                awake = False
+                if command in self.EXIT_WORDS:
+                    break
+
+                speech = self.handler.speech
+                started_before = speech.started_at
+                handle(command)
+                self.handler.wait_for_speech()
+                first = speech.started_at - heard if speech.started_at != started_before else None
+                self.turns.append(TurnStats(utterance.duration, utterance.latency, first,
+                                            utterance.latency + time.monotonic() - heard))
+        except SpeechError as e:
+            console.print(f"[red]{str(e)}[/red]")
+        except KeyboardInterrupt:
+            pass
+        console.print("[bold blue]Exiting voice mode...[/bold blue]")
+        self.print_stats()
+
+    def print_stats(self) -> None:
+        """Print per-utterance latencies and their median and 90th percentile."""
+        if not self.turns:
+            return
+        console.print("\n[bold blue]Voice latency per utterance:[/bold blue]")
+        for number, turn in enumerate(self.turns, 1):
+            first = f"{turn.first_response * 1000:6.0f} ms" if turn.first_response is not None else "     -   "
+            console.print(f"[dim]#{number:<3} speech {turn.speech:5.1f}s  recognition {turn.recognition * 1000:5.0f} ms  "
+                          f"first spoken {first}  total {turn.total:6.1f}s[/dim]")
+        recognition = [turn.recognition * 1000 for turn in self.turns]
+        first = [turn.first_response * 1000 for turn in self.turns if turn.first_response is not None]
+        summary = (f"Recognition: median {_percentile(recognition, 0.5):.0f} ms, "
+                   f"p90 {_percentile(recognition, 0.9):.0f} ms")
+        if first:
+            summary += (f"; first spoken sentence: median {_percentile(first, 0.5):.0f} ms, "
+                        f"p90 {_percentile(first, 0.9):.0f} ms")
+        console.print(f"[dim]{summary}[/dim]")